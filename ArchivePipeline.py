@@ -0,0 +1,236 @@
+import os
+import queue
+import shutil
+import threading
+import time
+
+from .ArchiveWriter import open_archive
+
+
+class ArchiveStream(object):
+    def __init__(self, pipeline, worker_index, archive_path, archive_format, folder_path, on_done, label):
+        self.pipeline = pipeline
+        self.label = label
+        self.worker_index = worker_index
+        self.archive_path = archive_path
+        # written under a temp name, renamed into place once complete
+        self.part_path = archive_path + ".part"
+        self.archive_format = archive_format
+        self.folder_path = folder_path
+        self.on_done = on_done
+        self.writer = None
+        self.added = set()
+        self.error = None
+        self.cancelled = False
+        self.digest = None
+        self.started = time.time()
+
+    def __contains__(self, file_path):
+        return os.path.relpath(file_path, self.folder_path) in self.added
+
+    def add(self, file_path):
+        arcname = os.path.relpath(file_path, self.folder_path)
+        if arcname in self.added:
+            return
+        self.added.add(arcname)
+        self.pipeline._put(self, 'add', file_path, arcname)
+
+    def close(self):
+        self.pipeline._put(self, 'close')
+
+    def abort(self, reason):
+        self.pipeline._put(self, 'abort', arcname=reason)
+
+    def cancel(self):
+        # aborted on purpose, not reported as failed
+        self.cancelled = True
+        self.abort("Cancelled")
+
+
+class ArchivePipeline(object):
+    """Streams exported files into archives on worker threads while the main thread goes on exporting.
+
+    Every archive is written by a single worker, files are deleted from the
+    temp folder as soon as they are in the archive. Results are handed back to
+    the main thread by collect(), because Fusion API and the rest of the
+    exporter state must only be touched from there.
+    """
+
+    def __init__(self, log, workers=2, max_pending_bytes=0, pump=None, profiler=None):
+        self.log = log
+        self.profiler = profiler
+        self.workers_count = max(1, workers)
+        self.max_pending_bytes = max_pending_bytes
+        self.pump = pump
+
+        self.queues = []
+        self.finished = queue.Queue()
+        self.condition = threading.Condition()
+        self.pending_bytes = 0
+        self.pending_streams = 0
+        self.next_worker = 0
+        self.workers = []
+        # sha1 of finished archives, hashed while written
+        self.digests = {}
+
+    def open(self, archive_path, archive_format, folder_path, on_done=None, label=None):
+        self._start_workers()
+
+        with self.condition:
+            self.pending_streams += 1
+
+        stream = ArchiveStream(self, self.next_worker, archive_path,
+                               archive_format, folder_path, on_done, label)
+        self.next_worker = (self.next_worker + 1) % self.workers_count
+        return stream
+
+    def collect(self):
+        failed = []
+        while True:
+            try:
+                stream = self.finished.get_nowait()
+            except queue.Empty:
+                return failed
+
+            if stream.cancelled:
+                continue
+            if stream.error is not None:
+                self.log.error("Failed archiving \"{}\" into \"{}\": {}".format(
+                    stream.folder_path, stream.archive_path, stream.error))
+                failed.append(stream)
+            else:
+                self.digests[stream.archive_path] = stream.digest
+                if stream.on_done is None:
+                    continue
+                try:
+                    stream.on_done()
+                except Exception as ex:
+                    # a locked file or a full disk fails this archive, the other ones go on
+                    stream.error = ex
+                    self.log.exception("Failed finishing \"{}\"".format(stream.archive_path), exc_info=ex)
+                    failed.append(stream)
+
+    def drain(self):
+        failed = []
+        while True:
+            with self.condition:
+                if self.pending_streams == 0:
+                    break
+                self.condition.wait(0.2)
+
+            failed.extend(self.collect())
+            if self.pump is not None:
+                self.pump()
+
+        failed.extend(self.collect())
+
+        for jobs in self.queues:
+            jobs.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+        self.queues = []
+
+        return failed
+
+    def _put(self, stream, action, file_path=None, arcname=None):
+        size = 0
+        if file_path is not None:
+            try:
+                size = os.path.getsize(file_path)
+            except OSError:
+                pass
+
+        # backpressure: don't let not yet archived files pile up in the temp folder
+        while True:
+            with self.condition:
+                if self.max_pending_bytes <= 0 or self.pending_bytes == 0 or self.pending_bytes + size <= self.max_pending_bytes:
+                    self.pending_bytes += size
+                    break
+                self.condition.wait(0.2)
+
+            if self.pump is not None:
+                self.pump()
+
+        self.queues[stream.worker_index].put((stream, action, file_path, arcname, size))
+
+    def _start_workers(self):
+        while len(self.workers) < self.workers_count:
+            jobs = queue.Queue()
+            worker = threading.Thread(
+                target=self._work, args=(jobs,), name="TehExport archive", daemon=True)
+            worker.start()
+            self.queues.append(jobs)
+            self.workers.append(worker)
+
+    def _work(self, jobs):
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+
+            stream, action, file_path, arcname, size = job
+            started = time.perf_counter()
+            if action == 'add':
+                self._add(stream, file_path, arcname)
+            else:
+                if action == 'abort' and stream.error is None:
+                    stream.error = Exception(arcname)
+                self._close(stream)
+
+            if self.profiler is not None:
+                self.profiler.record("archive " + action, time.perf_counter() - started,
+                                     size, stream.label)
+
+            with self.condition:
+                self.pending_bytes -= size
+                self.condition.notify_all()
+
+    def _add(self, stream, file_path, arcname):
+        try:
+            if stream.error is None:
+                if stream.writer is None:
+                    stream.writer = open_archive(stream.archive_format, stream.part_path)
+                stream.writer.add(file_path, arcname)
+        except BaseException as ex:
+            stream.error = ex
+
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
+
+    def _close(self, stream):
+        try:
+            if stream.error is None:
+                if stream.writer is None:
+                    # nothing was exported, still leave an archive as a marker
+                    stream.writer = open_archive(stream.archive_format, stream.part_path)
+                stream.writer.close()
+                stream.digest = stream.writer.digest
+                if not os.path.exists(stream.part_path):
+                    raise Exception("Archive not found")
+                os.replace(stream.part_path, stream.archive_path)
+                self.log.file("Archived \"{}\" in {:.1f}s".format(
+                    stream.archive_path, time.time() - stream.started))
+        except BaseException as ex:
+            stream.error = ex
+
+        if stream.error is not None:
+            # don't leave a half written archive behind
+            try:
+                if stream.writer is not None:
+                    stream.writer.close()
+            except BaseException:
+                pass
+            try:
+                os.remove(stream.part_path)
+            except OSError:
+                pass
+
+        shutil.rmtree(stream.folder_path, ignore_errors=True)
+
+        with self.condition:
+            self.pending_streams -= 1
+            self.finished.put(stream)
+            self.condition.notify_all()
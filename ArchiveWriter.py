@@ -0,0 +1,136 @@
+import gzip
+import hashlib
+import lzma
+import shutil
+import tarfile
+import zipfile
+from collections import OrderedDict
+
+fixed_date_time = (1980, 1, 1, 0, 0, 0)
+
+
+class HashingFile(object):
+    """Write only file that hashes the archive while it is written, so it never has to be read back.
+
+    It can't seek, archives are written as a plain stream.
+    """
+
+    def __init__(self, file_path):
+        self.file = open(file_path, 'wb')
+        self.hash = hashlib.sha1()
+        self.position = 0
+
+    def write(self, data):
+        self.hash.update(data)
+        self.position += len(data)
+        return self.file.write(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    @property
+    def digest(self):
+        return self.hash.hexdigest()
+
+
+class ZipArchiveWriter(object):
+    def __init__(self, archive_path, compression, compresslevel=None):
+        self.archive_path = archive_path
+        self.output = HashingFile(archive_path)
+        self.archive = zipfile.ZipFile(
+            self.output, 'w', compression, allowZip64=True, compresslevel=compresslevel)
+
+    def add(self, file_path, arcname):
+        # fixed timestamps, the same content gives the same archive to share in the blob store
+        zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+        zinfo.date_time = fixed_date_time
+        zinfo.compress_type = self.archive.compression
+        if hasattr(zinfo, 'compress_level'):
+            zinfo.compress_level = self.archive.compresslevel
+        else:
+            zinfo._compresslevel = self.archive.compresslevel
+
+        with open(file_path, 'rb') as source, self.archive.open(zinfo, 'w') as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+
+    def close(self):
+        self.archive.close()
+        self.output.close()
+
+    @property
+    def digest(self):
+        return self.output.digest
+
+
+class TarArchiveWriter(object):
+    def __init__(self, archive_path, compression='', compresslevel=None):
+        self.archive_path = archive_path
+        self.output = HashingFile(archive_path)
+        self.compressed = self.output
+        if compression == 'gz':
+            self.compressed = gzip.GzipFile(
+                filename='', mode='wb', fileobj=self.output, mtime=0,
+                compresslevel=compresslevel if compresslevel is not None else 9)
+        elif compression == 'xz':
+            self.compressed = lzma.LZMAFile(self.output, 'wb')
+        self.archive = tarfile.open(fileobj=self.compressed, mode='w|')
+
+    def add(self, file_path, arcname):
+        tarinfo = self.archive.gettarinfo(file_path, arcname)
+        tarinfo.mtime = 0
+        tarinfo.uid = tarinfo.gid = 0
+        tarinfo.uname = tarinfo.gname = ''
+        with open(file_path, 'rb') as source:
+            self.archive.addfile(tarinfo, source)
+
+    def close(self):
+        self.archive.close()
+        if self.compressed is not self.output:
+            self.compressed.close()
+        self.output.close()
+
+    @property
+    def digest(self):
+        return self.output.digest
+
+
+class ArchiveFormat(object):
+    def __init__(self, extension, factory):
+        self.extension = extension
+        self.factory = factory
+
+    def open(self, archive_path):
+        return self.factory(archive_path)
+
+
+archive_formats = OrderedDict([
+    ('zip', ArchiveFormat('.zip', lambda path: ZipArchiveWriter(path, zipfile.ZIP_DEFLATED, 6))),
+    ('zip (store)', ArchiveFormat('.zip', lambda path: ZipArchiveWriter(path, zipfile.ZIP_STORED))),
+    ('zip (fast)', ArchiveFormat('.zip', lambda path: ZipArchiveWriter(path, zipfile.ZIP_DEFLATED, 1))),
+    ('zip (best)', ArchiveFormat('.zip', lambda path: ZipArchiveWriter(path, zipfile.ZIP_DEFLATED, 9))),
+    ('zip (lzma)', ArchiveFormat('.zip', lambda path: ZipArchiveWriter(path, zipfile.ZIP_LZMA))),
+    ('tar', ArchiveFormat('.tar', lambda path: TarArchiveWriter(path))),
+    ('tar.gz', ArchiveFormat('.tar.gz', lambda path: TarArchiveWriter(path, 'gz', 6))),
+    ('tar.xz', ArchiveFormat('.tar.xz', lambda path: TarArchiveWriter(path, 'xz'))),
+])
+
+# Python 3.14+
+if hasattr(zipfile, 'ZIP_ZSTANDARD'):
+    archive_formats['zip (zstd)'] = ArchiveFormat(
+        '.zip', lambda path: ZipArchiveWriter(path, zipfile.ZIP_ZSTANDARD, 3))
+
+default_archive_format = 'zip'
+
+
+def open_archive(archive_format, archive_path):
+    return archive_formats[archive_format].open(archive_path)
+
+
+def archive_extension(archive_format):
+    return archive_formats[archive_format].extension
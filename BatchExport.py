@@ -0,0 +1,238 @@
+import json
+import os
+import time
+import traceback
+
+from .FusionFileExport import FusionFileExport
+from .ArchiveWriter import archive_formats, default_archive_format
+from .StlAssembler import stl_modes, default_stl_mode
+from .ExportScheduler import schedule_policies, default_schedule_policy
+from .VersionSelector import version_policies, default_version_policy
+from .ExportWatchdog import quarantine_policies, default_quarantine_policy
+from .ExportLog import log_verbosities, default_log_verbosity, log_formats, default_log_format
+from .ExportShards import ExportShard
+from .JsonFile import write_json
+
+job_environment_variable = "TEHEXPORT_JOB"
+
+scopes = ("hub", "project", "file", "projects", "files", "plan_hub", "plan_project", "plan", "split_plan",
+          "merge_shards", "catalog_hub", "catalog", "collect_garbage")
+
+
+class BatchJob(object):
+    """Export job read from a JSON file, for runs without anybody at the computer.
+
+    {
+        "output_path": "D:/Backup/Fusion",
+        "scope": "hub",                   // hub, project, file, projects, files, plan_hub, plan_project, plan,
+                                          // split_plan, merge_shards, catalog_hub, catalog or collect_garbage
+        "project_ids": [],                // for "projects", limits "catalog"
+        "file_ids": [],                   // for "files"
+        "plan_path": "D:/Backup/Fusion/exportplan.json",  // made by "plan_hub" and "plan_project", exported by "plan",
+                                                          // by default the part of the shard once split
+        "formats": ["step", "stl"],       // step, stl, iges
+        "stl_mode": "both",               // stl files of bodies, merged components or both
+        "archive_format": "zip",
+        "exportignore": ["Old designs"],  // added to exportignore.txt
+        "time_budget": 28800,             // seconds, 0 for no limit
+        "schedule": "cheapest",           // folder, cheapest, recent, never_exported or references
+        "versions": "new",                // latest, all, new, every_nth or described
+        "version_interval": 10,           // for "every_nth"
+        "quarantine": "defer",            // defer, skip or retry quarantined files
+        "resume": true,
+        "log_verbosity": "summary",       // summary, file or artifact
+        "log_format": "json",             // text (output.log) or json (output.jsonl)
+        "shard": 2,                       // this workstation exports shard 2 of "shards"
+        "shards": 4,                      // for "split_plan" too
+        "shard_weights": [2, 1, 1, 1],    // relative speed of the workstations
+        "shard_paths": ["D:/Backup/Fusion", "//ws2/Backup/Fusion"],  // output roots of the shards, for "merge_shards"
+        "result_path": "D:/Backup/Fusion/result.json"
+    }
+
+    "project" and "file" export the project and file of the active document.
+    "plan_hub" and "plan_project" only write the plan, nothing is exported.
+    "split_plan" splits the plan into one per shard, balanced by the estimated
+    time, "plan" of a shard then exports its part. "merge_shards" puts the
+    manifests, logs and reports of the shards together.
+    "catalog_hub" refreshes catalog.db without opening anything, "catalog"
+    exports the catalogued designs with versions left to export.
+    """
+
+    def __init__(self, values, job_path=None):
+        self.job_path = job_path
+        self.output_path = values.get("output_path")
+        if not self.output_path:
+            raise ValueError("output_path is missing")
+
+        self.scope = values.get("scope", "hub")
+        if self.scope not in scopes:
+            raise ValueError("Unknown scope \"{}\", expected one of {}".format(self.scope, ", ".join(scopes)))
+
+        self.project_ids = list(values.get("project_ids", []))
+        self.file_ids = list(values.get("file_ids", []))
+        if self.scope == "projects" and not self.project_ids:
+            raise ValueError("project_ids are missing")
+        if self.scope == "files" and not self.file_ids:
+            raise ValueError("file_ids are missing")
+
+        self.formats = [value.lower() for value in values.get("formats", ["step"])]
+        for value in self.formats:
+            if value not in ("step", "stl", "iges"):
+                raise ValueError("Unknown format \"{}\"".format(value))
+
+        self.stl_mode = values.get("stl_mode", default_stl_mode)
+        if self.stl_mode not in stl_modes:
+            raise ValueError("Unknown stl mode \"{}\"".format(self.stl_mode))
+
+        self.archive_format = values.get("archive_format", default_archive_format)
+        if self.archive_format not in archive_formats:
+            raise ValueError("Unknown archive format \"{}\"".format(self.archive_format))
+
+        exportignore = values.get("exportignore", [])
+        if isinstance(exportignore, str):
+            exportignore = exportignore.splitlines()
+        self.exportignore = "\n".join(exportignore)
+
+        self.time_budget = values.get("time_budget", 0)
+        self.schedule = values.get("schedule", default_schedule_policy)
+        if self.schedule not in schedule_policies:
+            raise ValueError("Unknown schedule \"{}\"".format(self.schedule))
+
+        self.versions = values.get("versions", default_version_policy)
+        if self.versions not in version_policies:
+            raise ValueError("Unknown versions \"{}\"".format(self.versions))
+        self.version_interval = int(values.get("version_interval", 10))
+        if self.version_interval < 1:
+            raise ValueError("version_interval must be 1 or more")
+
+        self.quarantine = values.get("quarantine", default_quarantine_policy)
+        if self.quarantine not in quarantine_policies:
+            raise ValueError("Unknown quarantine \"{}\"".format(self.quarantine))
+
+        self.resume = bool(values.get("resume", False))
+
+        self.log_verbosity = values.get("log_verbosity", default_log_verbosity)
+        if self.log_verbosity not in log_verbosities:
+            raise ValueError("Unknown log_verbosity \"{}\"".format(self.log_verbosity))
+        self.log_format = values.get("log_format", default_log_format)
+        if self.log_format not in log_formats:
+            raise ValueError("Unknown log_format \"{}\"".format(self.log_format))
+        self.shard = ExportShard(int(values.get("shard", 1)) - 1, int(values.get("shards", 1)), values.get("shard_weights"))
+        self.shard_paths = list(values.get("shard_paths", []))
+
+        self.plan_path = values.get("plan_path")
+        if self.scope in ("plan_hub", "plan_project", "split_plan"):
+            self.plan_path = self.plan_path or os.path.join(self.output_path, "exportplan.json")
+        self.result_path = values.get("result_path") or os.path.join(
+            self.output_path, self.shard.file_name("result.json"))
+
+    @classmethod
+    def load(cls, job_path):
+        with open(job_path, encoding='utf-8') as f:
+            return cls(json.load(f), job_path)
+
+
+def run_batch(app, job_path):
+    started = time.time()
+    result = {
+        "job": job_path,
+        "started": round(started, 3),
+        "status": "failed",
+    }
+
+    job = None
+    try:
+        job = BatchJob.load(job_path)
+        os.makedirs(job.output_path, exist_ok=True)
+
+        with FusionFileExport(app, job.output_path, interactive=False, extra_exportignore=job.exportignore,
+                              log_verbosity=job.log_verbosity, log_format=job.log_format,
+                              shard=job.shard if job.scope not in ("split_plan", "catalog_hub") else None) as total_export:
+            total_export.export_step = "step" in job.formats
+            total_export.export_stl = "stl" in job.formats
+            total_export.stl_mode = job.stl_mode
+            total_export.export_iges = "iges" in job.formats
+            total_export.archive_format = job.archive_format
+            total_export.time_budget = job.time_budget
+            total_export.schedule_policy = job.schedule
+            total_export.version_policy = job.versions
+            total_export.version_interval = job.version_interval
+            total_export.quarantine_policy = job.quarantine
+            total_export.resume = job.resume
+
+            if job.scope == "hub":
+                total_export.exportActiveHub()
+            elif job.scope == "project":
+                total_export.exportCurrentProject()
+            elif job.scope == "file":
+                total_export.exportCurrentFile()
+            elif job.scope == "projects":
+                total_export.exportProjects(job.project_ids)
+            elif job.scope == "files":
+                total_export.exportFiles(job.file_ids)
+            elif job.scope == "plan_hub":
+                total_export.planActiveHub(job.plan_path)
+            elif job.scope == "plan_project":
+                total_export.planCurrentProject(job.plan_path)
+            elif job.scope == "plan":
+                total_export.exportPlan(job.plan_path)
+            elif job.scope == "split_plan":
+                total_export.splitPlan(job.shard.count, job.shard.weights, job.plan_path)
+            elif job.scope == "merge_shards":
+                result["shards"] = total_export.mergeShards(job.shard_paths or None)
+            elif job.scope == "catalog_hub":
+                total_export.catalogActiveHub()
+                result["catalog"] = total_export.catalog.counts()
+            elif job.scope == "catalog":
+                total_export.exportCatalog(job.project_ids or None)
+            else:
+                total_export.collectGarbage()
+
+            result.update(_export_result(total_export))
+    except BaseException:
+        result["error"] = traceback.format_exc()
+
+    result["finished"] = round(time.time(), 3)
+    result["seconds"] = round(result["finished"] - started, 3)
+
+    result_path = job.result_path if job is not None else os.path.splitext(job_path)[0] + ".result.json"
+    _write_result(result_path, result)
+    return result
+
+
+def _export_result(total_export):
+    cloud_exports = total_export.cloud_exports
+    return {
+        "status": total_export.exportStatus(),
+        "output_path": total_export.output_path,
+        "shard": total_export.shard.name if total_export.shard.is_sharded else None,
+        "exported": total_export.file_exported_count,
+        "skipped": total_export.file_skipped_count,
+        "deferred": total_export.file_deferred_count,
+        "quarantined": total_export.file_quarantined_count,
+        "held_quarantined": total_export.file_held_quarantined_count,
+        "quarantine": [{"file_id": file_id, "name": name, "reason": reason}
+                       for file_id, (name, reason) in total_export.quarantined.items()],
+        "issues": total_export.num_issues,
+        "resumed": total_export.journal.resumed,
+        "journal_finished": total_export.journal.finished,
+        "component_cache": {
+            "hits": total_export.component_cache.hits,
+            "misses": total_export.component_cache.misses,
+        },
+        "blob_store": {
+            "stored": total_export.blob_store.stored_count,
+            "deduplicated": total_export.blob_store.deduplicated_count,
+            "saved_bytes": total_export.blob_store.saved_bytes,
+        } if total_export.blob_store is not None else None,
+        "cloud_exports": {
+            "completed": [export.path for export in cloud_exports.completed],
+            "pending": [export.path for export in cloud_exports.pending],
+            "timed_out": [export.path for export in cloud_exports.timed_out],
+        },
+    }
+
+
+def _write_result(result_path, result):
+    # somebody may be waiting for the file to show up, it appears complete or not at all
+    write_json(result_path, result, indent=2)
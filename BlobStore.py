@@ -0,0 +1,162 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import sys
+import uuid
+
+from .ExportManifest import file_digest
+
+FICLONE = 0x40049409  # linux/fs.h
+# hard links don't work on the volume, other errors are about a single file
+link_unsupported_errnos = set(getattr(errno, name) for name in (
+    "EXDEV", "ENOTSUP", "EOPNOTSUPP", "EMLINK") if hasattr(errno, name))
+
+
+def reflink(source_path, target_path):
+    # copy on write clone, for file systems without hard links but with block sharing (btrfs, xfs, apfs)
+    if sys.platform == 'darwin':
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        if libc.clonefile(os.fsencode(source_path), os.fsencode(target_path), 0) != 0:
+            raise OSError(ctypes.get_errno(), "clonefile failed", target_path)
+        return
+
+    if sys.platform.startswith('linux'):
+        import fcntl
+        with open(source_path, 'rb') as source, open(target_path, 'wb') as target:
+            try:
+                fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+                return
+            except OSError:
+                pass
+        os.remove(target_path)
+
+    raise OSError("Reflinks are not supported")
+
+
+class BlobStore(object):
+    """Content addressed store of exported files under the output root.
+
+    Every exported file is stored once by its sha1. The same content in other
+    versions and folders becomes a hard link to the stored copy, or a reflink
+    where hard links don't work. A blob nobody links to and the manifest doesn't
+    know any more is dropped by collect_garbage().
+    """
+
+    def __init__(self, blobs_path):
+        self.blobs_path = blobs_path
+        self.can_link = True
+        self.can_reflink = True
+
+        self.stored_count = 0
+        self.deduplicated_count = 0
+        self.saved_bytes = 0
+
+    def store(self, file_path, digest=None):
+        if not self.can_link and not self.can_reflink:
+            return digest
+
+        if digest is None:
+            digest = file_digest(file_path)
+
+        blob_path = self.blob_path(digest)
+        if os.path.exists(blob_path):
+            if os.path.samefile(blob_path, file_path):
+                return digest
+
+            # same content is stored already, swap the file for a link to it
+            size = os.path.getsize(file_path)
+            part_path = self._part_path(file_path)
+            if self._link(blob_path, part_path):
+                os.replace(part_path, file_path)
+                self.deduplicated_count += 1
+                self.saved_bytes += size
+        else:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            # shards sharing the store may store the same content at the same time, each under its own name
+            part_path = self._part_path(blob_path)
+            if self._link(file_path, part_path):
+                try:
+                    os.replace(part_path, blob_path)
+                except OSError:
+                    os.remove(part_path)
+                    if not os.path.exists(blob_path):
+                        raise
+                    # stored by another shard in between, same content
+                self.stored_count += 1
+
+        return digest
+
+    def blob_path(self, digest):
+        return os.path.join(self.blobs_path, digest[:2], digest)
+
+    def blobs(self):
+        if not os.path.isdir(self.blobs_path):
+            return
+
+        for prefix in os.scandir(self.blobs_path):
+            if not prefix.is_dir():
+                continue
+            for blob in os.scandir(prefix.path):
+                if blob.is_file() and not blob.name.endswith(".part"):
+                    yield blob
+
+    def space_saved(self):
+        # bytes that every hard link beyond the first would take as a separate copy
+        saved = 0
+        for blob in self.blobs():
+            stat = os.stat(blob.path)  # DirEntry.stat() has no link count on Windows
+            if stat.st_nlink > 2:
+                saved += (stat.st_nlink - 2) * stat.st_size
+        return saved
+
+    def collect_garbage(self, referenced_digests=()):
+        # nlink 1 means no output links to the blob, reflinked outputs are found in the manifest instead
+        removed_count = 0
+        removed_bytes = 0
+        referenced_digests = set(referenced_digests)
+        for blob in self.blobs():
+            stat = os.stat(blob.path)
+            if stat.st_nlink > 1 or blob.name in referenced_digests:
+                continue
+
+            try:
+                os.remove(blob.path)
+            except OSError:
+                continue
+            removed_count += 1
+            removed_bytes += stat.st_size
+
+        return removed_count, removed_bytes
+
+    def summary(self):
+        return "Blob store: {} stored, {} deduplicated, {:.1f} MB saved".format(
+            self.stored_count, self.deduplicated_count, self.saved_bytes / (1024 * 1024))
+
+    def _link(self, source_path, target_path):
+        if os.path.exists(target_path):
+            os.remove(target_path)
+
+        if self.can_link:
+            try:
+                os.link(source_path, target_path)
+                return True
+            except OSError as ex:
+                if ex.errno not in link_unsupported_errnos:
+                    # trouble with this one file, like a locked one, it keeps its own copy
+                    return False
+                # FAT, exFAT, different volumes or a blob with as many links as allowed (1023 on NTFS)
+                self.can_link = False
+
+        if self.can_reflink:
+            try:
+                reflink(source_path, target_path)
+                return True
+            except OSError:
+                self.can_reflink = False
+
+        return False
+
+    @staticmethod
+    def _part_path(path):
+        return "{}.{}.part".format(path, uuid.uuid4().hex)
@@ -0,0 +1,92 @@
+import os
+import time
+
+
+class CloudExport(object):
+    def __init__(self, path, name, started, on_arrival):
+        self.path = path
+        self.name = name
+        self.started = started
+        self.arrived = None
+        self.on_arrival = on_arrival
+
+
+class CloudExportTracker(object):
+    """Keeps track of f3z cloud exports without blocking the export of other files.
+
+    Output folders of pending exports are listed with scandir every
+    poll_interval seconds. An export that didn't arrive within timeout seconds
+    is reported as timed out.
+    """
+
+    def __init__(self, timeout, poll_interval, clock=time.time):
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self.last_poll = None
+
+        self.pending = []
+        self.completed = []
+        self.timed_out = []
+
+    def __len__(self):
+        return len(self.pending) + len(self.completed) + len(self.timed_out)
+
+    def add(self, path, name, on_arrival=None):
+        self.pending.append(CloudExport(path, name, self.clock(), on_arrival))
+
+    def poll(self, force=False):
+        if not self.pending:
+            return
+
+        now = self.clock()
+        if not force and self.last_poll is not None and now - self.last_poll < self.poll_interval:
+            return
+        self.last_poll = now
+
+        # one listing per folder instead of a stat per export
+        folders = {}
+        for export in self.pending:
+            folders.setdefault(os.path.dirname(export.path), []).append(export)
+
+        for folder, exports in folders.items():
+            try:
+                names = set(entry.name for entry in os.scandir(folder))
+            except OSError:
+                names = set()
+
+            for export in exports:
+                if os.path.basename(export.path) in names:
+                    export.arrived = now
+                    self.pending.remove(export)
+                    self.completed.append(export)
+                    if export.on_arrival is not None:
+                        export.on_arrival()
+                elif now - export.started > self.timeout:
+                    self.pending.remove(export)
+                    self.timed_out.append(export)
+
+    def finish(self, waiter=None, wait_timeout=0):
+        self.poll(force=True)
+
+        if waiter is not None and wait_timeout > 0 and self.pending:
+            def is_ready():
+                self.poll(force=True)
+                return not self.pending
+            waiter.wait("cloud export", is_ready, wait_timeout, initial_delay=0.5, max_delay=5)
+
+    def summary(self, limit=20, include_completed=False):
+        lines = ["f3z cloud exports: {} completed, {} pending, {} timed out".format(
+            len(self.completed), len(self.pending), len(self.timed_out))]
+
+        groups = [("Pending", self.pending), ("Timed out", self.timed_out)]
+        if include_completed:
+            groups.insert(0, ("Completed", self.completed))
+
+        for title, exports in groups:
+            for export in exports[:limit]:
+                lines.append("{}: {}".format(title, export.path))
+            if len(exports) > limit:
+                lines.append("{}: ... and {} more".format(title, len(exports) - limit))
+
+        return "\n".join(lines)
@@ -0,0 +1,134 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import time
+
+
+def link_or_copy(source_path, target_path):
+    try:
+        os.link(source_path, target_path)
+    except FileExistsError:
+        raise
+    except OSError:
+        # other volume or file system without hard links. Copied under a temp name, a cut copy is never taken
+        part_path = target_path + ".part"
+        shutil.copyfile(source_path, part_path)
+        os.replace(part_path, target_path)
+
+
+class ComponentCache(object):
+    """Content cache of exported component files shared between occurrences and documents.
+
+    Entries are keyed by the version of the data file owning the component,
+    the component id and the kind of export, and evicted least recently used
+    first once the cache grows over max_size bytes.
+    """
+
+    def __init__(self, cache_path, max_size):
+        self.cache_path = cache_path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.folders = set()  # made already, no need to ask the disk again
+
+        os.makedirs(cache_path, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(cache_path, 'index.db'))
+        with self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+            """)
+
+        self.size = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha1("\0".join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+    def fetch(self, key, file_path):
+        if key is None or self.max_size <= 0:
+            return False
+
+        row = self.connection.execute(
+            "SELECT path FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return False
+
+        try:
+            link_or_copy(os.path.join(self.cache_path, row[0]), file_path)
+        except OSError:
+            self._remove(key, row[0])
+            self.misses += 1
+            return False
+
+        with self.connection:
+            self.connection.execute(
+                "UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+
+        self.hits += 1
+        return True
+
+    def store(self, key, file_path):
+        if key is None or self.max_size <= 0:
+            return
+
+        size = os.path.getsize(file_path)
+        if size > self.max_size:
+            return
+
+        entry_path = os.path.join(key[:2], key + os.path.splitext(file_path)[1])
+        blob_path = os.path.join(self.cache_path, entry_path)
+        folder_path = os.path.dirname(blob_path)
+        if folder_path not in self.folders:
+            os.makedirs(folder_path, exist_ok=True)
+            self.folders.add(folder_path)
+        try:
+            link_or_copy(file_path, blob_path)
+        except FileExistsError:
+            os.remove(blob_path)
+            link_or_copy(file_path, blob_path)
+
+        with self.connection:
+            row = self.connection.execute(
+                "SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.size -= row[0]
+            self.connection.execute(
+                "INSERT OR REPLACE INTO entries (key, path, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, entry_path, size, time.time()))
+        self.size += size
+
+        self._evict()
+
+    def _evict(self):
+        while self.size > self.max_size:
+            row = self.connection.execute(
+                "SELECT key, path FROM entries ORDER BY last_used LIMIT 1").fetchone()
+            if row is None:
+                self.size = 0
+                return
+            self._remove(row[0], row[1])
+
+    def _remove(self, key, entry_path):
+        row = self.connection.execute(
+            "SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+        with self.connection:
+            self.connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+        if row is not None:
+            self.size -= row[0]
+
+        try:
+            os.remove(os.path.join(self.cache_path, entry_path))
+        except OSError:
+            pass
@@ -0,0 +1,117 @@
+import ctypes
+import os
+import sys
+from collections import OrderedDict
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def process_memory():
+    # resident memory of Fusion in bytes, None when it can't be told
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+
+    if sys.platform == 'win32':
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", ctypes.c_ulong),
+                        ("PageFaultCount", ctypes.c_ulong),
+                        ("PeakWorkingSetSize", ctypes.c_size_t),
+                        ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t),
+                        ("PeakPagefileUsage", ctypes.c_size_t)]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        try:
+            process = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+                return counters.WorkingSetSize
+        except (AttributeError, OSError):
+            pass
+        return None
+
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class DocumentPool(object):
+    """Keeps recently exported documents open, so related files don't load the same designs again.
+
+    An assembly opens with all its references, when the parts were just
+    exported and are still open Fusion doesn't download and regenerate them
+    again. Least recently used documents are closed when there are more than
+    max_documents, or when Fusion uses more than max_memory bytes. With
+    max_documents 0 every document is closed right away.
+    """
+
+    def __init__(self, documents, log, max_documents=0, max_memory=0, memory=process_memory):
+        self.documents = documents
+        self.log = log
+        self.max_documents = max_documents
+        self.max_memory = max_memory
+        self.memory = memory
+        self.open_documents = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.open_documents)
+
+    def open(self, file, version_id):
+        document = self.open_documents.pop(version_id, None)
+        if document is not None:
+            if document.isValid:
+                self.hits += 1
+                return document
+
+        self.misses += 1
+        return self.documents.open(file)
+
+    def release(self, document, version_id):
+        if self.max_documents <= 0:
+            document.close(False)
+            return
+
+        self.open_documents[version_id] = document
+        self._evict()
+
+    def close_all(self):
+        while self.open_documents:
+            self._close_oldest()
+
+    def summary(self):
+        return "Open documents: {} reused, {} opened, {} closed early".format(
+            self.hits, self.misses, self.evictions)
+
+    def _evict(self):
+        while len(self.open_documents) > self.max_documents:
+            self._close_oldest()
+            self.evictions += 1
+
+        if self.max_memory > 0:
+            while self.open_documents:
+                memory = self.memory()
+                if memory is None or memory <= self.max_memory:
+                    break
+                self.log.info("Fusion uses {:.0f} MB, closing a document".format(memory / (1024 * 1024)))
+                self._close_oldest()
+                self.evictions += 1
+
+    def _close_oldest(self):
+        version_id, document = self.open_documents.popitem(last=False)
+        try:
+            if document.isValid:
+                document.close(False)
+        except BaseException as ex:
+            self.log.exception("Failed to close document \"{}\"".format(version_id), exc_info=ex)
@@ -0,0 +1,161 @@
+import re
+
+
+class ExportIgnore(object):
+    """Compiled exportignore.txt rules.
+
+    Every non empty line is a rule. Plain rules match when they are a
+    substring of the path, rules with * or ? are globs (* and ? don't cross
+    folders, ** does). A leading ! turns a rule into an exception, lines
+    starting with # are comments, \\! and \\# escape them. Like in .gitignore
+    the last matching rule wins.
+
+    Plain rules are matched all at once by an Aho-Corasick automaton, so the
+    cost of a check depends on the path length and not on the number of rules.
+    A handful of rules is cheaper to scan one by one, see
+    benchmarks/bench_exportignore.py.
+    """
+
+    max_scanned_rules = 32
+
+    def __init__(self, text=""):
+        self.rules_count = 0
+        self.negated = []
+        self.globs = []
+        self.literals = []
+
+        # automaton: goto transitions, fail links and the highest rule index ending in every state
+        self.goto = [{}]
+        self.fail = [0]
+        self.best = [-1]
+
+        for line in text.splitlines():
+            rule = line.strip()
+            if not rule or rule.startswith('#'):
+                continue
+
+            negated = rule.startswith('!')
+            if negated:
+                rule = rule[1:]
+            elif rule.startswith('\\!') or rule.startswith('\\#'):
+                rule = rule[1:]
+            if not rule:
+                continue
+
+            index = self.rules_count
+            self.rules_count += 1
+            self.negated.append(negated)
+
+            if '*' in rule or '?' in rule:
+                self.globs.append((index, re.compile(self._translate(rule))))
+            else:
+                self.literals.append((index, rule))
+
+        self.globs.reverse()
+        self.literals.reverse()
+        self.has_negated = any(self.negated)
+
+        self.use_automaton = len(self.literals) > self.max_scanned_rules
+        if self.use_automaton:
+            for index, rule in self.literals:
+                self._add(rule, index)
+            self._build()
+
+    def __len__(self):
+        return self.rules_count
+
+    def match(self, file_path):
+        if self.rules_count == 0:
+            return False
+
+        if self.use_automaton:
+            matched = self._match_automaton(file_path)
+        else:
+            matched = -1
+            for index, rule in self.literals:
+                if rule in file_path:
+                    matched = index
+                    break
+
+        for index, pattern in self.globs:
+            if index < matched:
+                break
+            if pattern.search(file_path):
+                matched = index
+                break
+
+        return matched >= 0 and not self.negated[matched]
+
+    def _match_automaton(self, file_path):
+        goto = self.goto
+        fail = self.fail
+        best = self.best
+        has_negated = self.has_negated
+
+        matched = -1
+        state = 0
+        for char in file_path:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+
+            if best[state] > matched:
+                matched = best[state]
+                if not has_negated:
+                    # any match ignores the file
+                    return matched
+
+        return matched
+
+    def _add(self, rule, index):
+        state = 0
+        for char in rule:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.best.append(-1)
+                self.goto[state][char] = next_state
+            state = next_state
+
+        self.best[state] = max(self.best[state], index)
+
+    def _build(self):
+        # breadth first, so fail links always point to already finished states
+        queue = list(self.goto[0].values())
+        position = 0
+        while position < len(queue):
+            state = queue[position]
+            position += 1
+
+            for char, next_state in self.goto[state].items():
+                fail_state = self.fail[state]
+                while fail_state and char not in self.goto[fail_state]:
+                    fail_state = self.fail[fail_state]
+                self.fail[next_state] = self.goto[fail_state].get(char, 0)
+                self.best[next_state] = max(
+                    self.best[next_state], self.best[self.fail[next_state]])
+                queue.append(next_state)
+
+    @staticmethod
+    def _translate(rule):
+        pattern = ''
+        position = 0
+        while position < len(rule):
+            char = rule[position]
+            if rule.startswith('**', position):
+                pattern += '.*'
+                position += 2
+                continue
+            if char == '*':
+                pattern += '[^/\\\\]*'
+            elif char == '?':
+                pattern += '[^/\\\\]'
+            elif char in '/\\':
+                pattern += '[/\\\\]'
+            else:
+                pattern += re.escape(char)
+            position += 1
+
+        return pattern
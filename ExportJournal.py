@@ -0,0 +1,175 @@
+import json
+import os
+import time
+import uuid
+
+
+class JournalUnit(object):
+    def __init__(self, kind, id, parent, version=None):
+        self.kind = kind
+        self.id = id
+        self.parent = parent
+        self.version = version
+        self.open_children = set()
+        self.closed = False
+        self.done = False
+
+
+class ExportJournal(object):
+    """Write-ahead journal of hub -> project -> file -> component progress.
+
+    Every unit is journaled when it starts. A unit is done once it is ended
+    and all its children are done, its done record is fsync'd, so a done
+    unit survives a crash of Fusion. Files end when their archive is
+    complete, not when the main thread moves on.
+
+    A run that didn't finish can be resumed: done units are skipped without
+    touching Fusion or the disk and units that were in progress are retried
+    first. The journal is a JSON lines file, a record cut by a crash is
+    ignored.
+    """
+
+    def __init__(self, journal_path):
+        self.journal_path = journal_path
+        self.run_id = None
+        self.finished = False
+        self.resumed = False
+
+        # state of the run to resume from
+        self.done_units = {}
+        self.started_units = {}
+        self.last_component = {}
+
+        self.journal = None
+
+    def start(self, resume=False):
+        if resume:
+            self._load()
+
+        if resume and self.run_id is not None and not self.finished:
+            self.resumed = True
+            self.journal = open(self.journal_path, 'a', encoding='utf-8')
+            self._write({"event": "resume"}, sync=True)
+        else:
+            self.resumed = False
+            self.done_units = {}
+            self.started_units = {}
+            self.last_component = {}
+            self.run_id = uuid.uuid4().hex
+            self.journal = open(self.journal_path, 'w', encoding='utf-8')
+            self._write({"event": "run"}, sync=True)
+
+        self.finished = False
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    def is_done(self, kind, id, version=None):
+        if not self.resumed:
+            return False
+
+        done_version = self.done_units.get((kind, id), False)
+        if done_version is False:
+            return False
+        return version is None or done_version is None or done_version == version
+
+    def interrupted(self, kind, parent_id):
+        # units of the previous run that were started under parent but never finished
+        if not self.resumed:
+            return []
+        return [id for (unit_kind, id), unit_parent_id in self.started_units.items()
+                if unit_kind == kind and unit_parent_id == parent_id and (kind, id) not in self.done_units]
+
+    def begin(self, kind, id, parent=None, version=None):
+        unit = JournalUnit(kind, id, parent, version)
+        if parent is not None:
+            parent.open_children.add(unit)
+
+        self._write({"event": "begin", "unit": kind, "id": id, "version": version,
+                     "parent": parent.id if parent is not None else None})
+        return unit
+
+    def mark(self, kind, id, parent):
+        # progress inside of a unit, not waited for, just tells where a crash happened
+        self._write({"event": "mark", "unit": kind, "id": id, "parent": parent.id})
+
+    def end(self, unit):
+        # no more children will be added
+        unit.closed = True
+        self._complete(unit)
+
+    def abandon(self, unit):
+        # given up on purpose, a resumed run starts it over instead of taking it as a crash
+        if unit.parent is not None:
+            unit.parent.open_children.discard(unit)
+        self._write({"event": "abandon", "unit": unit.kind, "id": unit.id})
+
+    def fail(self, unit, reason):
+        # not a crash, a resumed run tries it again in the listing. It stays open,
+        # the run isn't finished with a failed file
+        self._write({"event": "failed", "unit": unit.kind, "id": unit.id, "reason": reason}, sync=True)
+
+    def skip(self, kind, id, parent, version=None):
+        # nothing to do for the unit, cheap to find out again, so not fsync'd
+        self.done_units[(kind, id)] = version
+        self._write({"event": "done", "unit": kind, "id": id, "version": version,
+                     "parent": parent.id})
+
+    def _complete(self, unit):
+        while unit is not None and unit.closed and not unit.done and not unit.open_children:
+            unit.done = True
+            self.done_units[(unit.kind, unit.id)] = unit.version
+            self._write({"event": "done", "unit": unit.kind, "id": unit.id, "version": unit.version},
+                        sync=True)
+
+            parent = unit.parent
+            if parent is None:
+                self.finished = True
+                self._write({"event": "finished"}, sync=True)
+                return
+
+            parent.open_children.discard(unit)
+            unit = parent
+
+    def _load(self):
+        if not os.path.exists(self.journal_path):
+            return
+
+        with open(self.journal_path, encoding='utf-8') as journal:
+            for line in journal:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # cut by a crash
+
+                event = record.get("event")
+                if event == "run":
+                    self.run_id = record.get("run")
+                    self.finished = False
+                    self.done_units = {}
+                    self.started_units = {}
+                    self.last_component = {}
+                elif event == "begin":
+                    self.started_units[(record["unit"], record["id"])] = record.get("parent")
+                elif event in ("abandon", "failed"):
+                    self.started_units.pop((record["unit"], record["id"]), None)
+                    self.last_component.pop(record["id"], None)
+                elif event == "done":
+                    self.done_units[(record["unit"], record["id"])] = record.get("version")
+                elif event == "mark":
+                    self.last_component[record.get("parent")] = record.get("id")
+                elif event == "finished":
+                    self.finished = True
+
+    def _write(self, values, sync=False):
+        if self.journal is None:
+            return
+
+        values["run"] = self.run_id
+        values["time"] = round(time.time(), 3)
+        self.journal.write(json.dumps(values, ensure_ascii=False) + "\n")
+        self.journal.flush()
+        if sync:
+            os.fsync(self.journal.fileno())
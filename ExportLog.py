@@ -0,0 +1,113 @@
+import copy
+import json
+import logging
+import queue
+from collections import OrderedDict
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+FILE = 15
+ARTIFACT = 5
+logging.addLevelName(FILE, "FILE")
+logging.addLevelName(ARTIFACT, "ARTIFACT")
+
+log_verbosities = OrderedDict([
+    ("summary", logging.INFO),  # runs, hubs, projects and problems
+    ("file", FILE),  # every data file version
+    ("artifact", ARTIFACT),  # every component and exported file
+])
+default_log_verbosity = "file"
+
+log_formats = ("text", "json")
+default_log_format = "text"
+
+
+class ExportLogger(logging.Logger):
+    def file(self, msg, *args, **kwargs):
+        if self.isEnabledFor(FILE):
+            self._log(FILE, msg, args, **kwargs)
+
+    def artifact(self, msg, *args, **kwargs):
+        if self.isEnabledFor(ARTIFACT):
+            self._log(ARTIFACT, msg, args, **kwargs)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Queues records for the writer thread, drops them instead of waiting when the queue is full."""
+
+    def __init__(self, records):
+        super().__init__(records)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # the message is made here, its arguments may change later. The traceback is kept apart for the json format
+        exc_text = record.exc_text
+        if record.exc_info:
+            exc_text = logging.Formatter().formatException(record.exc_info)
+
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        record.exc_text = exc_text
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class DrainingQueueListener(QueueListener):
+    def enqueue_sentinel(self):
+        # waits for room in a full queue, the writer empties it
+        self.queue.put(self._sentinel)
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record):
+        values = OrderedDict([
+            ("time", round(record.created, 3)),
+            ("level", record.levelname),
+            ("thread", record.threadName),
+            ("message", record.getMessage()),
+        ])
+        if record.exc_text:
+            values["exception"] = record.exc_text
+        return json.dumps(values, ensure_ascii=False)
+
+
+class ExportLog(object):
+    """Writes the log of an export on a background thread.
+
+    The main thread only puts records into a queue, so a slow output folder
+    doesn't slow the export down. When the writer can't keep up and the queue
+    is full, records are dropped and counted instead of waiting. The file is
+    rotated by size.
+    """
+
+    def __init__(self, log, log_path, log_format=default_log_format, max_bytes=0, backup_count=0, queue_size=0):
+        if log_format not in log_formats:
+            raise ValueError("Unknown log format \"{}\"".format(log_format))
+
+        self.log = log
+        self.file_handler = RotatingFileHandler(log_path, 'a', max_bytes, backup_count, 'utf-8', delay=True)
+        if log_format == "json":
+            self.file_handler.setFormatter(JsonLinesFormatter())
+        else:
+            self.file_handler.setFormatter(
+                logging.Formatter(u'%(asctime)s - %(levelname)s - %(message)s'))
+
+        self.handler = DroppingQueueHandler(queue.Queue(queue_size))
+        self.listener = DrainingQueueListener(self.handler.queue, self.file_handler)
+        self.listener.start()
+        self.log.addHandler(self.handler)
+
+    def close(self):
+        self.log.removeHandler(self.handler)
+        self.listener.stop()
+        if self.handler.dropped:
+            self.file_handler.handle(logging.makeLogRecord({
+                "levelno": logging.WARNING, "levelname": "WARNING",
+                "msg": "{} log records dropped, the log couldn't be written fast enough".format(self.handler.dropped)}))
+        self.file_handler.close()
@@ -0,0 +1,403 @@
+import hashlib
+import os
+import sqlite3
+import time
+
+# version of the exportignore.txt syntax, 2 brought ! exceptions and # comments
+exportignore_syntax = "2"
+
+
+def file_digest(file_path, chunk_size=1024 * 1024):
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ExportManifest(object):
+    """Index of already exported data files stored in the output root.
+
+    A data file version is skipped with a single lookup when its row exists and
+    the output folder it was written to has not been touched since. Rows of a
+    folder that changed on disk are dropped, and so the files in it are probed
+    again the old way.
+    """
+
+    def __init__(self, output_path, file_name='exportmanifest.db'):
+        self.output_path = output_path
+        self.connection = sqlite3.connect(os.path.join(output_path, file_name))
+        self.checked_folders = {}
+
+        with self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+                CREATE TABLE IF NOT EXISTS versions (
+                    version_id TEXT PRIMARY KEY,
+                    file_id TEXT NOT NULL,
+                    version_number INTEGER NOT NULL,
+                    is_assembly INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS files (
+                    file_id TEXT NOT NULL,
+                    version_id TEXT NOT NULL,
+                    version_number INTEGER NOT NULL,
+                    folder TEXT NOT NULL,
+                    is_assembly INTEGER NOT NULL,
+                    exported_at REAL NOT NULL,
+                    PRIMARY KEY (file_id, version_id)
+                );
+                CREATE INDEX IF NOT EXISTS files_folder ON files (folder);
+                CREATE TABLE IF NOT EXISTS artifacts (
+                    file_id TEXT NOT NULL,
+                    version_id TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    sha1 TEXT,
+                    PRIMARY KEY (file_id, version_id, kind)
+                );
+                CREATE TABLE IF NOT EXISTS folders (
+                    folder TEXT PRIMARY KEY,
+                    mtime REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS ignored_paths (
+                    file_id TEXT NOT NULL,
+                    version_id TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    PRIMARY KEY (file_id, version_id, path)
+                );
+                CREATE TABLE IF NOT EXISTS ignore_checked (
+                    file_id TEXT NOT NULL,
+                    version_id TEXT NOT NULL,
+                    PRIMARY KEY (file_id, version_id)
+                );
+                CREATE TABLE IF NOT EXISTS stale_versions (
+                    file_id TEXT NOT NULL,
+                    version_id TEXT NOT NULL,
+                    PRIMARY KEY (file_id, version_id)
+                );
+                CREATE TABLE IF NOT EXISTS child_references (
+                    version_id TEXT PRIMARY KEY,
+                    child_ids TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS failures (
+                    file_id TEXT PRIMARY KEY,
+                    count INTEGER NOT NULL,
+                    reason TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS quarantine (
+                    file_id TEXT PRIMARY KEY,
+                    version_id TEXT,
+                    name TEXT NOT NULL,
+                    reason TEXT NOT NULL,
+                    seconds REAL,
+                    quarantined_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS timings (
+                    file_id TEXT PRIMARY KEY,
+                    seconds REAL NOT NULL,
+                    size INTEGER NOT NULL,
+                    runs INTEGER NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+            """)
+
+    def close(self):
+        self.connection.close()
+
+    def update_ignore_rules(self, exportignore, ignore):
+        # ignore is the ExportIgnore of exportignore. Returns the number of versions to export again
+        rules = set(line.strip() for line in exportignore.splitlines() if line.strip())
+
+        stale = set()
+        row = self.connection.execute(
+            "SELECT value FROM meta WHERE key = 'exportignore'").fetchone()
+        if row is not None and row[0] != "\n".join(sorted(rules)):
+            # versions with a path left out before and wanted now
+            for file_id, version_id, path in self.connection.execute(
+                    "SELECT ignored_paths.file_id, ignored_paths.version_id, ignored_paths.path FROM ignored_paths "
+                    "JOIN files ON files.file_id = ignored_paths.file_id AND files.version_id = ignored_paths.version_id"):
+                if not ignore.match(path):
+                    stale.add((file_id, version_id))
+
+            # versions recorded without their ignored paths could miss anything a loosened rule left out
+            old_rules = set(line for line in row[0].splitlines() if line)
+            syntax = self.connection.execute(
+                "SELECT value FROM meta WHERE key = 'exportignore_syntax'").fetchone()
+            if self._is_loosened(old_rules, rules, syntax is None):
+                stale.update(self.connection.execute(
+                    "SELECT file_id, version_id FROM files WHERE NOT EXISTS (SELECT 1 FROM ignore_checked "
+                    "WHERE ignore_checked.file_id = files.file_id AND ignore_checked.version_id = files.version_id)"))
+
+        self.mark_stale(stale)
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('exportignore', ?)",
+                ("\n".join(sorted(rules)),))
+            self.connection.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('exportignore_syntax', ?)", (exportignore_syntax,))
+        return len(stale)
+
+    @staticmethod
+    def _is_loosened(old_rules, rules, is_old_syntax):
+        # a rule went away or an exception came in. Before the syntax had ! and #, such lines were plain rules
+        def ignoring(lines):
+            return set(line for line in lines if not line.startswith('!') and not line.startswith('#'))
+
+        def negations(lines):
+            return set(line for line in lines if line.startswith('!'))
+
+        old_ignoring = old_rules if is_old_syntax else ignoring(old_rules)
+        old_negations = set() if is_old_syntax else negations(old_rules)
+        return bool(old_ignoring - ignoring(rules) or negations(rules) - old_negations)
+
+    def mark_stale(self, versions):
+        # exported again by the next export, which writes over the archive. Until then the archive stays
+        # on disk, but isn't taken as complete by its existence
+        with self.connection:
+            for file_id, version_id in versions:
+                for table in ("files", "artifacts", "ignored_paths", "ignore_checked"):
+                    self.connection.execute(
+                        "DELETE FROM {} WHERE file_id = ? AND version_id = ?".format(table), (file_id, version_id))
+                self.connection.execute(
+                    "INSERT OR IGNORE INTO stale_versions (file_id, version_id) VALUES (?, ?)", (file_id, version_id))
+
+    def is_stale(self, file_id, version_id):
+        return self.connection.execute(
+            "SELECT 1 FROM stale_versions WHERE file_id = ? AND version_id = ?", (file_id, version_id)).fetchone() is not None
+
+    def invalidate_folder(self, folder):
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM artifacts WHERE (file_id, version_id) IN "
+                "(SELECT file_id, version_id FROM files WHERE folder = ?)", (folder,))
+            self.connection.execute(
+                "DELETE FROM files WHERE folder = ?", (folder,))
+            self.connection.execute(
+                "DELETE FROM folders WHERE folder = ?", (folder,))
+
+    def is_exported(self, file_id, version_id):
+        row = self.connection.execute(
+            "SELECT folder FROM files WHERE file_id = ? AND version_id = ?", (file_id, version_id)).fetchone()
+        if row is None:
+            return False
+
+        return self._is_folder_unchanged(row[0])
+
+    def exported_version_numbers(self, file_id):
+        return set(row[0] for row in self.connection.execute(
+            "SELECT version_number FROM files WHERE file_id = ?", (file_id,)))
+
+    def assembly_flag(self, version_id):
+        row = self.connection.execute(
+            "SELECT is_assembly FROM versions WHERE version_id = ?", (version_id,)).fetchone()
+        if row is None:
+            return None
+
+        return bool(row[0])
+
+    def record_version(self, file_id, version_id, version_number, is_assembly):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO versions (version_id, file_id, version_number, is_assembly) VALUES (?, ?, ?, ?)",
+                (version_id, file_id, version_number, int(is_assembly)))
+
+    def record(self, file_id, version_id, version_number, folder_path, is_assembly, artifacts, hash_artifacts=True, digests=None,
+               ignored_paths=None):
+        folder = self._relative(folder_path)
+
+        rows = []
+        for kind, path in artifacts.items():
+            sha1 = (digests or {}).get(kind)
+            if sha1 is None and hash_artifacts:
+                sha1 = file_digest(path)
+            rows.append((file_id, version_id, kind, self._relative(path),
+                         os.path.getsize(path), sha1))
+
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO versions (version_id, file_id, version_number, is_assembly) VALUES (?, ?, ?, ?)",
+                (version_id, file_id, version_number, int(is_assembly)))
+            self.connection.execute(
+                "INSERT OR REPLACE INTO files (file_id, version_id, version_number, folder, is_assembly, exported_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (file_id, version_id, version_number, folder, int(is_assembly), time.time()))
+            self.connection.execute(
+                "DELETE FROM artifacts WHERE file_id = ? AND version_id = ?", (file_id, version_id))
+            self.connection.executemany(
+                "INSERT INTO artifacts (file_id, version_id, kind, path, size, sha1) VALUES (?, ?, ?, ?, ?, ?)", rows)
+            # paths left out by exportignore.txt, None when not known like for adopted files
+            self.connection.execute(
+                "DELETE FROM ignored_paths WHERE file_id = ? AND version_id = ?", (file_id, version_id))
+            self.connection.execute(
+                "DELETE FROM ignore_checked WHERE file_id = ? AND version_id = ?", (file_id, version_id))
+            if ignored_paths is not None:
+                self.connection.execute(
+                    "INSERT INTO ignore_checked (file_id, version_id) VALUES (?, ?)", (file_id, version_id))
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO ignored_paths (file_id, version_id, path) VALUES (?, ?, ?)",
+                    [(file_id, version_id, path) for path in ignored_paths])
+            self.connection.execute(
+                "DELETE FROM stale_versions WHERE file_id = ? AND version_id = ?", (file_id, version_id))
+            # our own writes changed the folder, remember its new state
+            mtime = os.stat(folder_path).st_mtime
+            self.connection.execute(
+                "INSERT OR REPLACE INTO folders (folder, mtime) VALUES (?, ?)", (folder, mtime))
+
+        self.checked_folders[folder] = True
+
+    def child_references(self, version_id):
+        # ids of data files referenced by a version, None when not known yet
+        row = self.connection.execute(
+            "SELECT child_ids FROM child_references WHERE version_id = ?", (version_id,)).fetchone()
+        if row is None:
+            return None
+
+        return [child_id for child_id in row[0].split("\n") if child_id]
+
+    def record_child_references(self, version_id, child_ids):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO child_references (version_id, child_ids) VALUES (?, ?)",
+                (version_id, "\n".join(child_ids)))
+
+    def record_timing(self, file_id, seconds, size):
+        # moving average, so a single slow run doesn't stick
+        row = self.connection.execute(
+            "SELECT seconds, runs FROM timings WHERE file_id = ?", (file_id,)).fetchone()
+        runs = 1
+        if row is not None:
+            seconds = (row[0] + seconds) / 2
+            runs = row[1] + 1
+
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO timings (file_id, seconds, size, runs, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (file_id, seconds, size, runs, time.time()))
+
+    def record_failure(self, file_id, reason):
+        # failures in a row, a successful export starts over
+        row = self.connection.execute(
+            "SELECT count FROM failures WHERE file_id = ?", (file_id,)).fetchone()
+        count = row[0] + 1 if row is not None else 1
+
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO failures (file_id, count, reason, updated_at) VALUES (?, ?, ?, ?)",
+                (file_id, count, reason, time.time()))
+        return count
+
+    def clear_failures(self, file_id):
+        with self.connection:
+            self.connection.execute("DELETE FROM failures WHERE file_id = ?", (file_id,))
+
+    def quarantine(self, file_id, version_id, name, reason, seconds=None):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO quarantine (file_id, version_id, name, reason, seconds, quarantined_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (file_id, version_id, name, reason, seconds, time.time()))
+
+    def quarantined(self):
+        # file id -> (name, reason)
+        return dict((row[0], (row[1], row[2])) for row in self.connection.execute(
+            "SELECT file_id, name, reason FROM quarantine ORDER BY quarantined_at"))
+
+    def release(self, file_id):
+        with self.connection:
+            self.connection.execute("DELETE FROM quarantine WHERE file_id = ?", (file_id,))
+            self.connection.execute("DELETE FROM failures WHERE file_id = ?", (file_id,))
+
+    def file_history(self, file_ids, chunk_size=500):
+        # export times and ids of files with any exported version
+        timings = {}
+        exported = set()
+        for index in range(0, len(file_ids), chunk_size):
+            chunk = file_ids[index:index + chunk_size]
+            placeholders = ",".join("?" * len(chunk))
+            timings.update(self.connection.execute(
+                "SELECT file_id, seconds FROM timings WHERE file_id IN ({})".format(placeholders), chunk))
+            exported.update(row[0] for row in self.connection.execute(
+                "SELECT DISTINCT file_id FROM files WHERE file_id IN ({})".format(placeholders), chunk))
+
+        return timings, exported
+
+    def version_sizes(self, file_ids, chunk_size=500):
+        # bytes on disk of the latest exported version of files
+        sizes = {}
+        for index in range(0, len(file_ids), chunk_size):
+            chunk = file_ids[index:index + chunk_size]
+            placeholders = ",".join("?" * len(chunk))
+            sizes.update(self.connection.execute(
+                "SELECT artifacts.file_id, SUM(artifacts.size) FROM artifacts "
+                "JOIN files ON files.file_id = artifacts.file_id AND files.version_id = artifacts.version_id "
+                "WHERE artifacts.file_id IN ({}) AND files.version_number = "
+                "(SELECT MAX(version_number) FROM files AS latest WHERE latest.file_id = artifacts.file_id) "
+                "GROUP BY artifacts.file_id".format(placeholders), chunk))
+
+        return sizes
+
+    def median_version_size(self):
+        sizes = sorted(row[0] for row in self.connection.execute(
+            "SELECT SUM(size) FROM artifacts GROUP BY file_id, version_id"))
+        if not sizes:
+            return None
+
+        return sizes[len(sizes) // 2]
+
+    def median_file_seconds(self):
+        count = self.connection.execute("SELECT COUNT(*) FROM timings").fetchone()[0]
+        if count == 0:
+            return None
+
+        row = self.connection.execute(
+            "SELECT seconds FROM timings ORDER BY seconds LIMIT 1 OFFSET ?", (count // 2,)).fetchone()
+        return row[0]
+
+    def artifact_digests(self):
+        return set(row[0] for row in self.connection.execute(
+            "SELECT DISTINCT sha1 FROM artifacts WHERE sha1 IS NOT NULL"))
+
+    def merge(self, manifest_path):
+        # rows of another manifest, like the one of a shard, replace the rows here
+        self.connection.execute("ATTACH DATABASE ? AS other", (manifest_path,))
+        try:
+            with self.connection:
+                for table in ("versions", "files", "artifacts", "folders", "ignored_paths", "ignore_checked",
+                              "stale_versions", "child_references", "failures", "quarantine", "timings"):
+                    columns = ", ".join(row[1] for row in self.connection.execute(
+                        "PRAGMA other.table_info({})".format(table)))
+                    if columns:
+                        self.connection.execute("INSERT OR REPLACE INTO {0} ({1}) SELECT {1} FROM other.{0}".format(
+                            table, columns))
+                # exported by the other one since they went stale here
+                self.connection.execute(
+                    "DELETE FROM stale_versions WHERE EXISTS (SELECT 1 FROM other.files "
+                    "WHERE other.files.file_id = stale_versions.file_id AND other.files.version_id = stale_versions.version_id)")
+        finally:
+            self.connection.execute("DETACH DATABASE other")
+        self.checked_folders.clear()
+
+    def _is_folder_unchanged(self, folder):
+        if folder in self.checked_folders:
+            return self.checked_folders[folder]
+
+        row = self.connection.execute(
+            "SELECT mtime FROM folders WHERE folder = ?", (folder,)).fetchone()
+        try:
+            mtime = os.stat(os.path.join(self.output_path, folder)).st_mtime
+        except OSError:
+            mtime = None
+
+        unchanged = row is not None and mtime is not None and row[0] == mtime
+        if not unchanged:
+            self.invalidate_folder(folder)
+
+        self.checked_folders[folder] = unchanged
+        return unchanged
+
+    def _relative(self, path):
+        return os.path.relpath(path, self.output_path)
@@ -0,0 +1,106 @@
+import json
+import os
+import time
+from collections import OrderedDict
+
+from .JsonFile import write_json
+
+
+class ExportPlan(object):
+    """Data file versions a run would export or skip, with estimated time and size.
+
+    Made without opening any document, from the listing, exportignore.txt,
+    the output folders and the manifest. The estimates come from the timings
+    and artifact sizes of earlier runs, files never exported get the median.
+    Sizes are before deduplication in the blob store.
+
+    The plan is saved as JSON and can be exported as is, without listing and
+    checking the hub again. Split into shards, it is exported by several
+    workstations at once, balanced by the estimated time.
+    """
+
+    def __init__(self, output_path, options=None, created=None):
+        self.output_path = output_path
+        self.options = options or {}
+        self.created = created if created is not None else time.time()
+        self.items = []
+
+    def add(self, file, version, project_id, file_folder_path, action, reason=None, seconds=0.0, size=0):
+        self.items.append(OrderedDict([
+            ("file_id", file.id),
+            ("version_id", version.versionId),
+            ("version_number", version.versionNumber),
+            ("is_latest", version is file),
+            ("name", file.name),
+            ("project_id", project_id),
+            ("folder_id", file.parentFolder.id),
+            ("folder_path", os.path.relpath(os.path.dirname(file_folder_path), self.output_path)),
+            ("action", action),
+            ("reason", reason),
+            ("seconds", round(seconds, 1)),
+            ("bytes", size),
+        ]))
+
+    def exports(self):
+        return [item for item in self.items if item["action"] == "export"]
+
+    def summary(self, free_bytes=None):
+        exports = self.exports()
+        seconds = sum(item["seconds"] for item in exports)
+        size = sum(item["bytes"] for item in exports)
+
+        reasons = OrderedDict()
+        for item in self.items:
+            if item["action"] != "export":
+                reasons[item["reason"]] = reasons.get(item["reason"], 0) + 1
+
+        lines = ["{} versions to export, about {:.1f} hours and {:.1f} GB".format(
+            len(exports), seconds / 3600, size / (1024 * 1024 * 1024))]
+        for reason, count in reasons.items():
+            lines.append("{} skipped: {}".format(count, reason))
+        if free_bytes is not None:
+            lines.append("{:.1f} GB free in the output folder".format(free_bytes / (1024 * 1024 * 1024)))
+            if size > free_bytes:
+                lines.append("Not enough free space for the export!")
+        return "\n".join(lines)
+
+    def split(self, count, weights=None):
+        # whole files go to the shard with the least estimated time for its weight, the most expensive first
+        weights = list(weights) if weights else [1.0] * count
+        seconds = OrderedDict()
+        for item in self.exports():
+            seconds[item["file_id"]] = seconds.get(item["file_id"], 0.0) + item["seconds"]
+
+        loads = [0.0] * count
+        owners = {}
+        for file_id in sorted(seconds, key=lambda file_id: (-seconds[file_id], file_id)):
+            index = min(range(count), key=lambda index: ((loads[index] + seconds[file_id]) / weights[index], index))
+            owners[file_id] = index
+            loads[index] += seconds[file_id]
+
+        plans = []
+        for index in range(count):
+            options = OrderedDict(self.options)
+            options["shard"] = OrderedDict([("index", index), ("count", count), ("weights", weights)])
+            plan = ExportPlan(self.output_path, options, self.created)
+            plan.items = [item for item in self.exports() if owners[item["file_id"]] == index]
+            plans.append(plan)
+        return plans
+
+    def save(self, plan_path):
+        values = OrderedDict([
+            ("created", round(self.created, 3)),
+            ("output_path", self.output_path),
+            ("options", self.options),
+            ("items", self.items),
+        ])
+        write_json(plan_path, values)
+
+    @classmethod
+    def load(cls, plan_path):
+        with open(plan_path, encoding='utf-8') as f:
+            values = json.load(f)
+
+        plan = cls(values["output_path"], values.get("options"), values.get("created"))
+        plan.items = values.get("items", [])
+        return plan
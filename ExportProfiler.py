@@ -0,0 +1,138 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class PhaseStats(object):
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.bytes = 0
+
+
+class ExportProfiler(object):
+    """Durations, written bytes and counts of export phases, per phase, file and component.
+
+    Every measurement is appended as a JSON line to the report file, so runs
+    can be compared later. record() may be called from worker threads.
+    """
+
+    def __init__(self, report_path=None, clock=time.perf_counter):
+        self.clock = clock
+        self.run_id = uuid.uuid4().hex
+        self.lock = threading.Lock()
+        self.report = open(report_path, 'a', encoding='utf-8') if report_path else None
+
+        self.started = clock()
+        self.phases = OrderedDict()
+        self.files = {}
+        self.components = {}
+        self.files_count = 0
+        self.bytes = 0
+
+        self.file = None
+        self.component = None
+        self.file_started = None
+        self.file_bytes = 0
+
+    def close(self):
+        with self.lock:
+            if self.report is not None:
+                self.report.close()
+                self.report = None
+
+    @contextmanager
+    def phase(self, name, output_path=None):
+        started = self.clock()
+        try:
+            yield
+        finally:
+            size = 0
+            if output_path is not None:
+                try:
+                    size = os.path.getsize(output_path)
+                except OSError:
+                    pass
+            self.file_bytes += size
+            self.record(name, self.clock() - started, size, self.file, self.component)
+
+    def record(self, name, seconds, size=0, file=None, component=None):
+        with self.lock:
+            stats = self.phases.setdefault(name, PhaseStats())
+            stats.count += 1
+            stats.seconds += seconds
+            stats.bytes += size
+            self.bytes += size
+
+            if component is not None:
+                key = (file, component)
+                self.components[key] = self.components.get(key, 0.0) + seconds
+
+            self._write({"phase": name, "file": file, "component": component,
+                         "seconds": round(seconds, 6), "bytes": size})
+
+    def begin_file(self, file):
+        self.file = file
+        self.component = None
+        self.file_started = self.clock()
+        self.file_bytes = 0
+
+    def end_file(self):
+        if self.file is None:
+            return None
+
+        seconds = self.clock() - self.file_started
+        with self.lock:
+            self.files[self.file] = self.files.get(self.file, 0.0) + seconds
+            self.files_count += 1
+            self._write({"phase": "file", "file": self.file, "component": None,
+                         "seconds": round(seconds, 6), "bytes": self.file_bytes})
+
+        self.file = None
+        self.component = None
+        return seconds
+
+    def throughput(self):
+        elapsed = max(self.clock() - self.started, 1e-9)
+        return self.files_count / elapsed * 3600, self.bytes / elapsed / (1024 * 1024)
+
+    def slowest_files(self, top=5):
+        return sorted(self.files.items(), key=lambda item: item[1], reverse=True)[:top]
+
+    def slowest_components(self, top=5):
+        return sorted(self.components.items(), key=lambda item: item[1], reverse=True)[:top]
+
+    def summary(self, top=5, with_phases=False):
+        files_per_hour, megabytes_per_second = self.throughput()
+        lines = ["Throughput: {:.0f} files/hour, {:.2f} MB/s".format(
+            files_per_hour, megabytes_per_second)]
+
+        if with_phases:
+            lines.append("Phases:")
+            for name, stats in self.phases.items():
+                lines.append("  {}: {} calls, {:.1f}s, {:.1f} MB".format(
+                    name, stats.count, stats.seconds, stats.bytes / (1024 * 1024)))
+
+        if self.files:
+            lines.append("Slowest files:")
+            for file, seconds in self.slowest_files(top):
+                lines.append("  {:.1f}s {}".format(seconds, file))
+
+        if self.components:
+            lines.append("Slowest components:")
+            for (file, component), seconds in self.slowest_components(top):
+                lines.append("  {:.1f}s {} / {}".format(seconds, file, component))
+
+        return "\n".join(lines)
+
+    def _write(self, values):
+        if self.report is None:
+            return
+
+        values["run"] = self.run_id
+        values["time"] = round(time.time(), 3)
+        self.report.write(json.dumps(values, ensure_ascii=False) + "\n")
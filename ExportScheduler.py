@@ -0,0 +1,186 @@
+from collections import OrderedDict
+
+schedule_policies = ("folder", "cheapest", "recent", "never_exported", "references")
+default_schedule_policy = "folder"
+
+
+class ExportScheduler(object):
+    """Orders the files of a project by the chosen policy.
+
+    folder          listing order, files are exported while folders are still listed
+    cheapest        lowest estimated export time first
+    recent          most recently modified first
+    never_exported  files without any exported version first, cheapest of them first
+    references      files sharing references back to back, referenced files before their assemblies
+
+    The estimate of a file is its own export time of previous runs kept in the
+    manifest. Files without history get the median of all known times, times
+    assembly_factor for assemblies, which take a cloud export and open their
+    references too.
+    """
+
+    assembly_factor = 3.0
+    default_seconds = 30.0
+    default_bytes = 10 * 1024 * 1024
+
+    def __init__(self, manifest, policy=default_schedule_policy, catalog=None):
+        if policy not in schedule_policies:
+            raise ValueError("Unknown schedule policy \"{}\"".format(policy))
+
+        self.manifest = manifest
+        self.catalog = catalog
+        self.policy = policy
+        self.history = {}
+        self.exported = set()
+        self.typical_seconds = None
+        self.sizes = {}
+        self.typical_bytes = None
+
+    @property
+    def is_reordering(self):
+        return self.policy != "folder"
+
+    def order(self, files):
+        entries = [(file, file.id) for file in files]
+        if not self.is_reordering:
+            return [file for file, file_id in entries]
+
+        if self.policy == "references":
+            return [file for file, file_id in self._group_by_references(entries)]
+
+        self.prefetch([file_id for file, file_id in entries])
+
+        costs = {}
+        for file, file_id in entries:
+            is_assembly = None
+            if self.history[file_id] is None:
+                is_assembly = self.manifest.assembly_flag(file.versionId)
+            costs[file_id] = self.estimate(file_id, is_assembly)
+
+        if self.policy == "cheapest":
+            entries.sort(key=lambda entry: costs[entry[1]])
+        elif self.policy == "recent":
+            # sort is stable, folder order is kept between equal dates
+            entries.sort(key=lambda entry: entry[0].dateModified, reverse=True)
+        else:
+            entries.sort(key=lambda entry: (entry[1] in self.exported, costs[entry[1]]))
+
+        return [file for file, file_id in entries]
+
+    def _group_by_references(self, entries):
+        # union-find over files and the files they reference, also the ones outside of the project
+        roots = {}
+
+        def find(file_id):
+            roots.setdefault(file_id, file_id)
+            while roots[file_id] != file_id:
+                roots[file_id] = roots[roots[file_id]]
+                file_id = roots[file_id]
+            return file_id
+
+        children = {}
+        for file, file_id in entries:
+            child_ids = self.child_references(file, file_id)
+            children[file_id] = child_ids
+            for child_id in child_ids:
+                roots[find(child_id)] = find(file_id)
+
+        groups = OrderedDict()
+        for entry in entries:
+            groups.setdefault(find(entry[1]), []).append(entry)
+
+        levels = {}
+
+        def level(file_id):
+            # 0 for files not referencing anything in the project, an assembly comes after its parts
+            if file_id not in levels:
+                levels[file_id] = 0  # guard against cycles
+                levels[file_id] = max([level(child_id) + 1 for child_id in children.get(file_id, ())
+                                       if child_id in children] or [0])
+            return levels[file_id]
+
+        ordered = []
+        for group in groups.values():
+            group.sort(key=lambda entry: level(entry[1]))
+            ordered.extend(group)
+        return ordered
+
+    def child_references(self, file, file_id):
+        version_id = file.versionId
+        child_ids = self.manifest.child_references(version_id)
+        if child_ids is not None:
+            return child_ids
+        if self.catalog is not None:
+            child_ids = self.catalog.child_references(version_id)
+            if child_ids is not None:
+                return child_ids
+
+        is_assembly = self.manifest.assembly_flag(version_id)
+        if is_assembly is False:
+            return []
+
+        references = file.childReferences
+        child_ids = [references.item(index).id for index in range(references.count)]
+        self.manifest.record_child_references(version_id, child_ids)
+        if is_assembly is None:
+            # saves the slow hasChildReferences call when the file is exported
+            self.manifest.record_version(file_id, version_id, file.versionNumber, bool(child_ids))
+        return child_ids
+
+    def prefetch(self, file_ids):
+        file_ids = [file_id for file_id in file_ids if file_id not in self.history]
+        if not file_ids:
+            return
+
+        history, exported = self.manifest.file_history(file_ids)
+        for file_id in file_ids:
+            self.history[file_id] = history.get(file_id)
+        self.exported.update(exported)
+
+    def estimate(self, file_id, is_assembly=None):
+        self.prefetch([file_id])
+        seconds = self.history[file_id]
+        if seconds is not None:
+            return seconds
+
+        if self.typical_seconds is None:
+            self.typical_seconds = self.manifest.median_file_seconds() or self.default_seconds
+
+        seconds = self.typical_seconds
+        if is_assembly:
+            seconds *= self.assembly_factor
+        return seconds
+
+    def prefetch_sizes(self, file_ids):
+        file_ids = [file_id for file_id in file_ids if file_id not in self.sizes]
+        if not file_ids:
+            return
+
+        sizes = self.manifest.version_sizes(file_ids)
+        for file_id in file_ids:
+            self.sizes[file_id] = sizes.get(file_id)
+
+    def estimate_size(self, file_id, is_assembly=None):
+        # a new version takes about as much space as the last exported one
+        self.prefetch_sizes([file_id])
+        size = self.sizes[file_id]
+        if size is not None:
+            return size
+
+        if self.typical_bytes is None:
+            self.typical_bytes = self.manifest.median_version_size() or self.default_bytes
+
+        size = self.typical_bytes
+        if is_assembly:
+            size *= self.assembly_factor
+        return int(size)
+
+    def fits(self, file_id, remaining_seconds):
+        # files without history are always tried, there is nothing to tell they won't fit
+        if remaining_seconds is None:
+            return True
+
+        self.prefetch([file_id])
+        if self.history[file_id] is None:
+            return True
+        return self.history[file_id] <= remaining_seconds
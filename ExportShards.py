@@ -0,0 +1,285 @@
+import glob
+import hashlib
+import heapq
+import json
+import math
+import os
+import re
+import time
+from collections import OrderedDict
+
+from .JsonFile import write_json
+
+report_file_name = "shardreport.json"
+log_record_start = re.compile(r'^\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3} - ')
+
+
+class ExportShard(object):
+    """One of count deterministic partitions of the data files of a hub.
+
+    A file belongs to the shard with the highest rendezvous hash score of
+    its id, so every workstation works out the same partition on its own
+    and a file stays in its shard as long as the count and the weights
+    don't change. A shard with a bigger weight gets a bigger share, for
+    faster workstations. Balancing by the cost of the files is done by
+    splitting an export plan instead, see ExportPlan.split().
+
+    State files of a sharded run have the shard in their name, so several
+    shards can export into one shared output root.
+    """
+
+    def __init__(self, index=0, count=1, weights=None):
+        if count < 1:
+            raise ValueError("Shard count must be 1 or more")
+        if not 0 <= index < count:
+            raise ValueError("Shard {} is not one of {}".format(index + 1, count))
+
+        weights = [float(weight) for weight in weights] if weights else [1.0] * count
+        if len(weights) != count:
+            raise ValueError("{} shard weights given for {} shards".format(len(weights), count))
+        if min(weights) <= 0:
+            raise ValueError("Shard weights must be above 0")
+
+        self.index = index
+        self.count = count
+        self.weights = weights
+
+    @property
+    def is_sharded(self):
+        return self.count > 1
+
+    @property
+    def name(self):
+        return "shard{}of{}".format(self.index + 1, self.count)
+
+    def file_name(self, file_name):
+        # exportjournal.jsonl -> exportjournal.shard2of4.jsonl
+        if not self.is_sharded:
+            return file_name
+        root, extension = os.path.splitext(file_name)
+        return "{}.{}{}".format(root, self.name, extension)
+
+    def owner(self, file_id):
+        if self.count == 1:
+            return 0
+
+        best_index = 0
+        best_score = None
+        for index, weight in enumerate(self.weights):
+            digest = hashlib.sha1("{}\0{}".format(index, file_id).encode('utf-8')).digest()
+            uniform = (int.from_bytes(digest[:8], 'big') + 0.5) / 2.0 ** 64
+            score = -weight / math.log(uniform)
+            if best_score is None or score > best_score:
+                best_index = index
+                best_score = score
+        return best_index
+
+    def includes(self, file_id):
+        return self.owner(file_id) == self.index
+
+    def values(self):
+        return OrderedDict([("index", self.index), ("count", self.count), ("weights", self.weights)])
+
+
+class ShardReport(object):
+    """What a shard saw and did, for putting the shards of an export together.
+
+    Files of the hub listing are either assigned to the shard or left to
+    others, assigned files that weren't done (deferred, cancelled) are
+    left with a reason. Files after a stop are never listed at all.
+    """
+
+    def __init__(self, shard, assignment="hash"):
+        self.shard = shard
+        self.assignment = assignment  # "hash", or "plan" for the shards of a split plan
+        self.assigned = OrderedDict()  # file id -> name
+        self.others = OrderedDict()  # file id -> name
+        self.left = OrderedDict()  # file id -> reason
+
+    def assign(self, file):
+        self.assigned[file.id] = file.name
+
+    def other(self, file):
+        self.others[file.id] = file.name
+
+    def leave(self, file, reason):
+        self.left.setdefault(file.id, reason)
+
+    def save(self, report_path, values):
+        report = OrderedDict([
+            ("shard", self.shard.values()),
+            ("assignment", self.assignment),
+            ("saved", round(time.time(), 3)),
+        ])
+        report.update(values)
+        report["assigned"] = self.assigned
+        report["others"] = self.others
+        report["left"] = self.left
+        write_json(report_path, report)
+
+
+class ShardMerge(object):
+    """Puts the shard reports of an export together and checks them.
+
+    Overlaps are files done by more than one shard, gaps are files no shard
+    did: the shard they belong to never reported, didn't list them or left
+    them. Shards split with different counts or weights can't be checked
+    against each other and are reported as mismatched.
+    """
+
+    def __init__(self, reports):
+        self.reports = reports  # (folder, report values)
+
+    @classmethod
+    def find(cls, roots):
+        reports = []
+        root_name, extension = os.path.splitext(report_file_name)
+        for root in roots:
+            for report_path in sorted(glob.glob(os.path.join(glob.escape(root), root_name + ".shard*" + extension))):
+                with open(report_path, encoding='utf-8') as f:
+                    reports.append((root, json.load(f)))
+        return cls(reports)
+
+    def check(self):
+        result = OrderedDict([
+            ("shards", 0), ("missing", []), ("duplicated", []), ("mismatched", []), ("unfinished", []),
+            ("totals", OrderedDict((key, 0) for key in ("exported", "skipped", "deferred", "quarantined", "held_quarantined", "issues"))),
+            ("overlaps", OrderedDict()), ("gaps", OrderedDict()),
+        ])
+        if not self.reports:
+            return result
+
+        # the last saved report of a shard counts, older ones are of earlier runs
+        reports = sorted(self.reports, key=lambda item: item[1].get("saved", 0))
+        latest = reports[-1][1]["shard"]
+        by_index = OrderedDict()
+        for root, report in reports:
+            shard_values = report["shard"]
+            if shard_values["count"] != latest["count"] or shard_values["weights"] != latest["weights"]:
+                result["mismatched"].append(self._name(shard_values))
+                continue
+            if shard_values["index"] in by_index and by_index[shard_values["index"]][0] != root:
+                result["duplicated"].append(self._name(shard_values))
+            by_index[shard_values["index"]] = (root, report)
+
+        shard = ExportShard(0, latest["count"], latest["weights"])
+        result["shards"] = shard.count
+        result["missing"] = ["shard{}of{}".format(index + 1, shard.count)
+                             for index in range(shard.count) if index not in by_index]
+
+        done = OrderedDict()  # file id -> [shard names]
+        left = OrderedDict()
+        names = {}
+        for index, (root, report) in sorted(by_index.items()):
+            name = self._name(report["shard"])
+            for key in result["totals"]:
+                result["totals"][key] += report.get(key, 0)
+            if report.get("status") not in ("completed", "completed_with_issues"):
+                result["unfinished"].append(name)
+            names.update(report["others"])
+            names.update(report["assigned"])
+            for file_id in report["assigned"]:
+                if file_id in report["left"]:
+                    left[file_id] = "left by {}: {}".format(name, report["left"][file_id])
+                else:
+                    done.setdefault(file_id, []).append(name)
+
+        for file_id, shard_names in done.items():
+            if len(shard_names) > 1:
+                result["overlaps"][file_id] = shard_names
+        for file_id, reason in left.items():
+            if file_id not in done:
+                result["gaps"][file_id] = reason
+
+        # every listed file has to be done by its shard, only hashed shards know where a file belongs
+        for root, report in by_index.values():
+            if report.get("assignment") != "hash":
+                continue
+            for file_id in report["others"]:
+                if file_id in done or file_id in result["gaps"]:
+                    continue
+                owner = shard.owner(file_id)
+                if owner not in by_index:
+                    result["gaps"][file_id] = "shard{}of{} didn't report".format(owner + 1, shard.count)
+                else:
+                    result["gaps"][file_id] = "not listed by shard{}of{}".format(owner + 1, shard.count)
+
+        result["names"] = dict((file_id, names.get(file_id))
+                               for file_id in list(result["overlaps"]) + list(result["gaps"]))
+        return result
+
+    @staticmethod
+    def problems(result):
+        return (len(result["missing"]) + len(result["duplicated"]) + len(result["mismatched"]) +
+                len(result["overlaps"]) + len(result["gaps"]))
+
+    @staticmethod
+    def summary(result, limit=10):
+        totals = result["totals"]
+        lines = ["{} shards: {} files exported, {} skipped, {} deferred, {} quarantined, "
+                 "{} held in quarantine, {} issues".format(
+                     result["shards"], totals["exported"], totals["skipped"], totals["deferred"],
+                     totals["quarantined"], totals["held_quarantined"], totals["issues"])]
+        for key in ("missing", "duplicated", "mismatched", "unfinished"):
+            if result[key]:
+                lines.append("{}: {}".format(key.capitalize(), ", ".join(result[key])))
+        for key in ("overlaps", "gaps"):
+            if result[key]:
+                lines.append("{} {}:".format(len(result[key]), key))
+                for file_id, value in list(result[key].items())[:limit]:
+                    lines.append("  {} ({}): {}".format(
+                        result["names"].get(file_id), file_id, ", ".join(value) if isinstance(value, list) else value))
+        return "\n".join(lines)
+
+    def save(self, report_path, result):
+        write_json(report_path, result)
+
+    def merge_logs(self, log_path):
+        # records of all shards in the order they were written, each with its shard
+        streams = [self._log_records(os.path.join(root, report["log"]), self._name(report["shard"]))
+                   for root, report in self.reports if report.get("log")]
+        count = 0
+        with open(log_path, 'w', encoding='utf-8') as f:
+            for _, _, name, record in heapq.merge(*streams):
+                f.write("[{}] {}".format(name, record))
+                count += 1
+        return count
+
+    def manifest_paths(self):
+        return [os.path.join(root, report["manifest"]) for root, report in self.reports if report.get("manifest")]
+
+    def _log_records(self, log_path, name):
+        # (time, line number, shard, text) of every record, a record of the text log may span lines
+        if not os.path.exists(log_path):
+            return
+        with open(log_path, encoding='utf-8', errors='replace') as f:
+            if log_path.endswith(".jsonl"):
+                for number, line in enumerate(f):
+                    try:
+                        record_time = json.loads(line).get("time", 0)
+                    except ValueError:
+                        continue
+                    yield [record_time, number, name, line]
+                return
+
+            record = None
+            for number, line in enumerate(f):
+                if log_record_start.match(line) or record is None:
+                    if record is not None:
+                        yield record
+                    record = [self._log_time(line), number, name, line]
+                else:
+                    record[3] += line
+            if record is not None:
+                yield record
+
+    @staticmethod
+    def _log_time(line):
+        try:
+            return time.mktime(time.strptime(line[:19], "%Y-%m-%d %H:%M:%S")) + int(line[20:23]) / 1000
+        except ValueError:
+            return 0
+
+    @staticmethod
+    def _name(shard_values):
+        return "shard{}of{}".format(shard_values["index"] + 1, shard_values["count"])
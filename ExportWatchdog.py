@@ -0,0 +1,114 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from .JsonFile import write_json
+
+# what happens to quarantined files: exported after the rest of their project, not exported, or exported as any other
+quarantine_policies = ("defer", "skip", "retry")
+default_quarantine_policy = "defer"
+
+
+class ExportBudgetExceeded(Exception):
+    pass
+
+
+class ExportWatchdog(object):
+    """Watches the Fusion calls of the main thread from a background thread.
+
+    A call into Fusion can't be interrupted. When one runs over its budget the
+    watchdog logs it and leaves a state file with the file and the call, which
+    is removed once the call returns. If Fusion hangs for good and is killed,
+    the next run finds the state file and quarantines the file instead of
+    hanging on it again.
+
+    Only plain values are handed to the thread, it never touches the API.
+    """
+
+    def __init__(self, state_path, log, interval=5.0, clock=time.monotonic):
+        self.state_path = state_path
+        self.log = log
+        self.interval = interval
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+        self.file = None  # (file id, version id, name) of the file being exported
+        self.call = None  # (label, started, budget, reported)
+
+    def previous_overrun(self):
+        # left behind by a run that never came back from a call over its budget
+        if not os.path.exists(self.state_path):
+            return None
+
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                return json.load(f)
+        except ValueError:
+            return None
+        finally:
+            self._remove_state()
+
+    @contextmanager
+    def watch(self, label, budget):
+        if budget <= 0 or self.file is None:
+            yield
+            return
+
+        self._start()
+        with self.lock:
+            self.call = [label, self.clock(), budget, False]
+        try:
+            yield
+        finally:
+            with self.lock:
+                reported = self.call[3]
+                self.call = None
+            if reported:
+                self._remove_state()
+
+    def close(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def _start(self):
+        if self.thread is None:
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self._run, name="TehExport watchdog", daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            # under the lock, a call that just returned removes the state file after it is written
+            with self.lock:
+                call = self.call
+                if call is None or call[3]:
+                    continue
+                label, started, budget, reported = call
+                seconds = self.clock() - started
+                if seconds <= budget:
+                    continue
+                call[3] = True
+
+                file_id, version_id, name = self.file
+                self.log.warning("\"{}\" is in {} for {:.0f}s, over its budget of {}s".format(
+                    name, label, seconds, budget))
+                self._write_state({"file_id": file_id, "version_id": version_id, "name": name,
+                                   "label": label, "seconds": round(seconds, 1), "budget": budget})
+
+    def _write_state(self, state):
+        try:
+            write_json(self.state_path, state, indent=None)
+        except OSError as ex:
+            self.log.exception("Failed to write \"{}\"".format(self.state_path), exc_info=ex)
+
+    def _remove_state(self):
+        try:
+            os.remove(self.state_path)
+        except OSError:
+            pass
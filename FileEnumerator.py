@@ -0,0 +1,88 @@
+import os
+
+
+class FolderFrame(object):
+    def __init__(self, folder, folder_path, folder_id=None):
+        self.folder = folder
+        self.folder_path = folder_path
+        self.folder_id = folder_id
+        self.files = folder.dataFiles
+        self.files_count = self.files.count
+        self.file_index = 0
+        self.folders = folder.dataFolders
+        self.folders_count = self.folders.count
+        self.folder_index = 0
+
+
+class FileEnumerator(object):
+    """Lists data files of a folder tree lazily, depth first, in the same order as a full listing.
+
+    Files are handed out while folders are still being listed. Only one level
+    of folder collections is kept per depth and file proxies are taken one by
+    one, so memory doesn't grow with the size of the project. `discovered` is
+    the number of files seen so far and `finished` tells when it is final.
+
+    `folder_id` is the id of the folder of the file handed out last, given
+    the id of the top folder. on_folder is called with the id, parent id,
+    name and path of every sub folder as it is listed.
+    """
+
+    def __init__(self, folder, folder_path, name, folder_paths=None, folder_id=None, on_folder=None):
+        self.folder = folder
+        self.folder_path = folder_path
+        self.name = name
+        self.folder_paths = folder_paths if folder_paths is not None else {}
+        self.top_folder_id = folder_id
+        self.folder_id = folder_id
+        self.on_folder = on_folder
+        self.discovered = 0
+        self.finished = False
+
+    def __iter__(self):
+        stack = [FolderFrame(self.folder, self.folder_path, self.top_folder_id)]
+        self.discovered += stack[0].files_count
+
+        while stack:
+            frame = stack[-1]
+
+            if frame.file_index < frame.files_count:
+                file = frame.files.item(frame.file_index)
+                frame.file_index += 1
+                self.folder_id = frame.folder_id
+                if not self.finished:
+                    # every folder is listed already, the total is final
+                    self.finished = all(
+                        pending.folder_index >= pending.folders_count for pending in stack)
+                yield file
+                continue
+
+            if frame.folder_index < frame.folders_count:
+                sub_folder = frame.folders.item(frame.folder_index)
+                frame.folder_index += 1
+                sub_folder_id = sub_folder.id
+                sub_folder_name = sub_folder.name
+                sub_folder_path = os.path.join(frame.folder_path, self.name(sub_folder_name))
+                self.folder_paths[sub_folder_id] = sub_folder_path
+                if self.on_folder is not None:
+                    self.on_folder(sub_folder_id, frame.folder_id, sub_folder_name, sub_folder_path)
+
+                sub_frame = FolderFrame(sub_folder, sub_folder_path, sub_folder_id)
+                self.discovered += sub_frame.files_count
+                stack.append(sub_frame)
+                continue
+
+            stack.pop()
+
+        self.finished = True
+
+    def batches(self, max_pending):
+        # bounded look ahead for callers that want to reorder files without listing everything first
+        batch = []
+        for file in self:
+            batch.append(file)
+            if len(batch) >= max_pending:
+                yield batch
+                batch = []
+
+        if batch:
+            yield batch
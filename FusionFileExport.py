@@ -5,36 +5,155 @@ import adsk.fusion
 import adsk.cam
 import traceback
 
-from logging import Logger, FileHandler, Formatter
 from threading import Thread
 
 import time
 import os
 import re
 import shutil
+import sys
+from functools import lru_cache
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from .ExportManifest import ExportManifest
+from .ComponentCache import ComponentCache, link_or_copy
+from .ArchivePipeline import ArchivePipeline
+from .ArchiveWriter import default_archive_format, archive_extension
+from .ExportIgnore import ExportIgnore
+from .FileEnumerator import FileEnumerator
+from .ReadinessWaiter import ReadinessWaiter
+from .CloudExportTracker import CloudExportTracker
+from .ExportProfiler import ExportProfiler
+from .ExportJournal import ExportJournal
+from .ExportScheduler import ExportScheduler, default_schedule_policy
+from .DocumentPool import DocumentPool
+from .BlobStore import BlobStore
+from .OutputTree import OutputTree
+from .ExportPlan import ExportPlan
+from .ExportLog import ExportLog, ExportLogger, log_verbosities, default_log_verbosity, default_log_format
+from .ExportWatchdog import ExportWatchdog, ExportBudgetExceeded, default_quarantine_policy
+from .VersionSelector import VersionSelector, default_version_policy
+from .UiPump import UiPump, ExportCancelled
+from .ExportShards import ExportShard, ShardReport, ShardMerge, report_file_name
+from .StlAssembler import StlAssembler, default_stl_mode
+from .HubCatalog import HubCatalog, catalog_file_name
 
 max_output_path_length = 230
 ignore_already_exported_files = True
+component_cache_max_size = 5 * 1024 * 1024 * 1024  # bytes, 0 to disable
+deduplicate_outputs = True  # same content in the output tree is hard linked to one copy in the blob store
+archive_workers = 2
+archive_max_pending_size = 512 * 1024 * 1024  # bytes waiting for archiving in the temp folder
+activation_timeout = 10  # seconds to wait for activeHub/activeProject to switch
+cloud_export_timeout = 60 * 60  # seconds after which a missing f3z is reported as timed out
+cloud_export_poll_interval = 10  # seconds between looking for arrived f3z files
+cloud_export_final_wait = 30  # seconds to wait for pending f3z files at the end of the run
+open_documents_cache_size = 0  # documents kept open for related files, 0 closes every document right away
+open_documents_max_memory = 8 * 1024 * 1024 * 1024  # bytes used by Fusion above which kept documents are closed
+cache_output_listings = True  # output folders are listed once instead of probing every path, pays off on network shares
+file_time_budget = 60 * 60  # seconds for a file, the rest of it is dropped and the file quarantined, 0 for no limit
+component_time_budget = 15 * 60  # seconds for the exports of a component, over it the file is quarantined, 0 for no limit
+quarantine_after_failures = 2  # runs in a row a file failed or was interrupted in before it is quarantined
+log_max_size = 50 * 1024 * 1024  # bytes of output.log before it is rotated, 0 to never rotate
+log_backup_count = 5  # rotated logs kept
+log_queue_size = 100000  # records waiting for the log writer, more are dropped
+ui_pump_interval = 0.25  # seconds between processing Fusion events and checking for cancel and pause
+stl_units_per_cm = 10.0  # length unit of stl files written by Fusion when it can't be measured, mm
+scheduler_window = 0  # files of a project ordered at once by reordering schedule policies, 0 for the whole project
+
+component_phases = ("step", "stl body", "stl merge", "iges", "dxf")
+
+name_forbidden_symbols = re.compile('[^a-zA-Z0-9а-яА-ЯЁё_ \\.,\\[\\]+-]')
+
+
+@lru_cache(maxsize=65536)
+def sanitize_name(name):
+    name = name_forbidden_symbols.sub('_', name).strip()
+
+    if name.lower().endswith('.stp') or name.lower().endswith('.stl') or name.lower().endswith('.igs'):
+        name = name[0: -4] + "_" + name[-3:]
+
+    if name.lower().endswith('.step'):
+        name = name[0: -5] + "_" + name[-4:]
+
+    return name
 
 
 class FusionFileExport(object):
-    def __init__(self, app, output_path):
+    def __init__(self, app, output_path, interactive=True, extra_exportignore="",
+                 log_verbosity=default_log_verbosity, log_format=default_log_format, shard=None):
         self.app = app
         self.ui = self.app.userInterface
         self.data = self.app.data
         self.documents = self.app.documents
-        self.log = Logger("Fusion 360 Total Export")
+        self.log = ExportLogger("Fusion 360 Total Export")
+        self.log.setLevel(log_verbosities[log_verbosity])
+        self.log_format = log_format
+        self.export_log = None
         self.num_issues = 0
         self.was_cancelled = False
-        self.has_cloud_export = False
-        self.temp_foler_name = "_temp"
+        self.was_out_of_time = False
+        self.interactive = interactive
+        self.time_budget = 0  # seconds, 0 for no limit
+        self.deadline = None
+        self.cloud_exports = CloudExportTracker(
+            cloud_export_timeout, cloud_export_poll_interval)
+        # several shards can share the output root, each has its own state files
+        self.shard = shard or ExportShard()
+        self.shard_report = None
+        self.temp_foler_name = self.shard.file_name("_temp")
+        self.cache_folder_name = self.shard.file_name("_cache")
+        self.meshes_folder_name = "_meshes"
+        self.blobs_folder_name = "_blobs"
+        self.plan_file_name = "exportplan.json"
         self.exportignore = ""
+        self.extra_exportignore = extra_exportignore
+        self.exportignore_rules = ExportIgnore()
 
         self.export_step = True
         self.export_stl = False
         self.export_iges = False
+        self.stl_mode = default_stl_mode
+        self.archive_format = default_archive_format
+        self.resume = False
+        self.schedule_policy = default_schedule_policy
+        self.version_policy = default_version_policy
+        self.version_interval = 10
+        self.quarantine_policy = default_quarantine_policy
+        self.default_settings = self._settings()
 
         self.output_path = output_path
+        self.manifest = None
+        self.catalog = None
+        self.journal = None
+        self.project_unit = None
+        self.file_unit = None
+        self.component_cache = None
+        self.blob_store = None
+        self.written_components = set()
+        # tessellated bodies and put together components of the file being exported
+        self.stl_assembler = StlAssembler()
+        self.mesh_paths = {}
+        self.component_meshes = {}
+        self.mesh_count = 0
+        self.stl_units_per_cm = None
+        self.folder_paths = {}
+        self.output_tree = OutputTree(cache_output_listings)
+        self.profiler = ExportProfiler()
+        self.archive_pipeline = ArchivePipeline(
+            self.log, archive_workers, archive_max_pending_size, adsk.doEvents, self.profiler)
+        self.archive_stream = None
+        self.scheduler = None
+        self.version_selector = None
+        self.document_pool = DocumentPool(
+            self.documents, self.log, open_documents_cache_size, open_documents_max_memory)
+        self.waiter = ReadinessWaiter(adsk.doEvents)
+        self.watchdog = ExportWatchdog(os.path.join(output_path, self.shard.file_name('watchdog.json')), self.log)
+        self.quarantined = {}
+        self.file_started = None
+        self.file_overruns = []
+        self.ignored_paths = []
         self.initializeOutputPath()
 
         self.project_index = 0
@@ -45,19 +164,57 @@ class FusionFileExport(object):
 
         self.file_exported_count = 0
         self.file_skipped_count = 0
+        self.file_deferred_count = 0
+        self.file_quarantined_count = 0
+        self.file_held_quarantined_count = 0  # skipped or deferred for being quarantined before
 
         self.progress_dialog = self.ui.createProgressDialog()
+        # creating the pause file in the output folder pauses the export at the next component
+        self.ui_pump = UiPump(self.progress_dialog, adsk.doEvents, self._refresh_viewport,
+                              os.path.join(output_path, 'pause'), ui_pump_interval)
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        pass
+        self.document_pool.close_all()
+        self.watchdog.close()
+        if self.manifest is not None:
+            self.manifest.close()
+        if self.catalog is not None:
+            self.catalog.close()
+        if self.journal is not None:
+            self.journal.close()
+        if self.component_cache is not None:
+            self.component_cache.close()
+        self.profiler.close()
+        if self.export_log is not None:
+            self.export_log.close()
 
     def initializeOutputPath(self):
+        self.manifest = ExportManifest(self.output_path, self.shard.file_name('exportmanifest.db'))
+        # the catalog is made by catalogActiveHub, exports only read it
+        if os.path.exists(os.path.join(self.output_path, catalog_file_name)):
+            self.catalog = HubCatalog(os.path.join(self.output_path, catalog_file_name))
+        self.journal = ExportJournal(os.path.join(
+            self.output_path, self.shard.file_name('exportjournal.jsonl')))
+        self.component_cache = ComponentCache(os.path.join(
+            self.output_path, self.cache_folder_name), component_cache_max_size)
+        if deduplicate_outputs:
+            self.blob_store = BlobStore(os.path.join(
+                self.output_path, self.blobs_folder_name))
+
+        overrun = self.watchdog.previous_overrun()
+        if overrun is not None:
+            self.manifest.quarantine(overrun["file_id"], overrun["version_id"], overrun["name"],
+                                     "never came back from {} in the previous run".format(overrun["label"]),
+                                     overrun["seconds"])
+        self.quarantined = self.manifest.quarantined()
+
         if os.path.exists(os.path.join(self.output_path, self.temp_foler_name)):
-            dialogResult = self.ui.messageBox("Temp folder {} could contain not actual data. Do you really want to continue?".format(
-                self.temp_foler_name), 'Fusion 360 total exporter', adsk.core.MessageBoxButtonTypes.YesNoButtonType, adsk.core.MessageBoxIconTypes.InformationIconType)
+            dialogResult = self._message("Temp folder {} could contain not actual data. Do you really want to continue?".format(
+                self.temp_foler_name), 'Fusion 360 total exporter', adsk.core.MessageBoxButtonTypes.YesNoButtonType, adsk.core.MessageBoxIconTypes.InformationIconType,
+                adsk.core.DialogResults.DialogYes)
             if dialogResult == adsk.core.DialogResults.DialogNo:
                 return
 
@@ -65,45 +222,159 @@ class FusionFileExport(object):
             f = open(os.path.join(self.output_path, 'exportignore.txt'))
             self.exportignore = f.read()
             f.close()
+        if self.extra_exportignore:
+            self.exportignore += "\n" + self.extra_exportignore
+
+        self.exportignore_rules = ExportIgnore(self.exportignore)
 
-        file_handler = FileHandler(os.path.join(
-            self.output_path, 'output.log'), 'a', 'utf-8')
-        file_handler.setFormatter(
-            Formatter(u'%(asctime)s - %(levelname)s - %(message)s'))
-        self.log.addHandler(file_handler)
+        stale_count = self.manifest.update_ignore_rules(self.exportignore, self.exportignore_rules)
+
+        self.export_log = ExportLog(
+            self.log, os.path.join(self.output_path, self._log_file_name()),
+            self.log_format, log_max_size, log_backup_count, log_queue_size)
+        if stale_count:
+            self.log.info("exportignore.txt changed, {} exported versions miss files wanted now and are exported again".format(
+                stale_count))
+
+        self.profiler = ExportProfiler(
+            os.path.join(self.output_path, self.shard.file_name('timings.jsonl')))
+        self.archive_pipeline.profiler = self.profiler
+
+    def _log_file_name(self):
+        return self.shard.file_name('output.jsonl' if self.log_format == "json" else 'output.log')
 
     def showExportResult(self):
+        self.document_pool.close_all()
+        self._finish_archives()
+        self.progress_dialog.message = "Waiting for cloud exports"
+        self.cloud_exports.finish(self.waiter, cloud_export_final_wait)
+        self.num_issues += len(self.cloud_exports.timed_out)
         self.progress_dialog.hide()
 
+        if len(self.cloud_exports) > 0:
+            self.log.info(self.cloud_exports.summary(
+                limit=len(self.cloud_exports), include_completed=True))
+
+        if self.document_pool.hits + self.document_pool.misses > 0:
+            self.log.info(self.document_pool.summary())
+        if self.quarantined:
+            self.log.info("Quarantined files:\n{}".format("\n".join(
+                "{}: {}".format(name, reason) for name, reason in self.quarantined.values())))
+        if self.waiter.stats:
+            self.log.info("Time spent waiting for Fusion:\n{}".format(
+                self.waiter.summary()))
+        if self.ui_pump.paused_seconds > 0:
+            self.log.info("Paused for {:.0f}s".format(self.ui_pump.paused_seconds))
+        self.log.info(self.profiler.summary(top=20, with_phases=True))
+        if self.shard_report is not None:
+            self._save_shard_report()
+
         if self.was_cancelled:
-            self.ui.messageBox("Cancelled!")
+            self._message("Cancelled! {} files exported, resume the export to go on".format(
+                self.file_exported_count))
+        elif self.was_out_of_time or self.file_deferred_count > 0:
+            self._message("Time budget of {}s is used up, resume the export to go on.\n{} files exported, {} files skipped, {} files deferred".format(
+                self.time_budget, self.file_exported_count, self.file_skipped_count, self.file_deferred_count))
         elif self.num_issues > 0:
-            self.ui.messageBox("The exporting process ran into {num_issues} issue{english_plurals}. Please check the log for more information".format(
+            self._message("The exporting process ran into {num_issues} issue{english_plurals}. Please check the log for more information\n{cache_summary}\n\n{timings_summary}".format(
                 num_issues=self.num_issues,
-                english_plurals="s" if self.num_issues > 1 else ""
+                english_plurals="s" if self.num_issues > 1 else "",
+                cache_summary=self._cache_summary(),
+                timings_summary=self.profiler.summary()
             ))
         else:
-            self.ui.messageBox("Export finished completely successfully!\n{file_exported_count} files exported, {file_skipped_count} files skipped".format(
+            self._message("Export finished completely successfully!\n{file_exported_count} files exported, {file_skipped_count} files skipped\n{cache_summary}\n\n{timings_summary}".format(
                 file_skipped_count=self.file_skipped_count,
-                file_exported_count=self.file_exported_count
+                file_exported_count=self.file_exported_count,
+                cache_summary=self._cache_summary(),
+                timings_summary=self.profiler.summary()
             ))
 
-        if self.has_cloud_export:
-            self.ui.messageBox(
-                "Wait for cloud export finish before closing Fusion360", "Warning!", 0, 3)  # OK, Warning
+        if self.cloud_exports.pending or self.cloud_exports.timed_out:
+            self._message(
+                "Wait for cloud export finish before closing Fusion360\n\n{}".format(self.cloud_exports.summary()), "Warning!", 0, 3)  # OK, Warning
 
         if os.path.exists(os.path.join(self.output_path, self.temp_foler_name)):
-            self.ui.messageBox(
+            self._message(
                 "Please delete the temp foler {} manually".format(self.temp_foler_name))
 
+    def exportStatus(self):
+        if self.was_cancelled:
+            return "cancelled"
+        elif self.was_out_of_time or self.file_deferred_count > 0:
+            return "out_of_time"
+        elif self.num_issues > 0:
+            return "completed_with_issues"
+        return "completed"
+
+    def _save_shard_report(self):
+        report_path = os.path.join(self.output_path, self.shard.file_name(report_file_name))
+        self.log.info("{}: {} files of the shard, {} of other shards, {} left, report in \"{}\"".format(
+            self.shard.name, len(self.shard_report.assigned), len(self.shard_report.others),
+            len(self.shard_report.left), report_path))
+        try:
+            self.shard_report.save(report_path, OrderedDict([
+                ("status", self.exportStatus()),
+                ("exported", self.file_exported_count),
+                ("skipped", self.file_skipped_count),
+                ("deferred", self.file_deferred_count),
+                ("quarantined", self.file_quarantined_count),
+                ("held_quarantined", self.file_held_quarantined_count),
+                ("issues", self.num_issues),
+                ("journal_finished", self.journal.finished),
+                ("log", self._log_file_name()),
+                ("manifest", self.shard.file_name('exportmanifest.db')),
+            ]))
+        except OSError as ex:
+            self.num_issues += 1
+            self.log.exception("Failed to write \"{}\"".format(report_path), exc_info=ex)
+
+    def _finish_archives(self):
+        self.progress_dialog.message = "Waiting for archives to finish"
+        failed = self.archive_pipeline.drain()
+        self.num_issues += len(failed)
+        self._clear_meshes()
+
+        temp_folder_path = os.path.join(self.output_path, self.temp_foler_name)
+        if os.path.isdir(temp_folder_path) and not os.listdir(temp_folder_path):
+            os.rmdir(temp_folder_path)
+            self.output_tree.forget(temp_folder_path)
+
+    def _collect_archives(self):
+        self.num_issues += len(self.archive_pipeline.collect())
+
+    def _cache_summary(self):
+        summary = "Component cache: {} hits, {} misses".format(
+            self.component_cache.hits, self.component_cache.misses)
+        if self.blob_store is not None:
+            summary += "\n" + self.blob_store.summary()
+        if self.quarantined:
+            summary += "\nQuarantined: {} files, {} new, {} skipped or deferred, see the log".format(
+                len(self.quarantined), self.file_quarantined_count, self.file_held_quarantined_count)
+        return summary
+
+    def collectGarbage(self):
+        self.log.info("Collecting garbage of the blob store")
+        if self.blob_store is None:
+            self._message("Output deduplication is off, there is no blob store")
+            return
+
+        removed_count, removed_bytes = self.blob_store.collect_garbage(
+            self.manifest.artifact_digests())
+        message = "{} unreferenced blobs removed, {:.1f} MB freed\nHard links save {:.1f} MB".format(
+            removed_count, removed_bytes / (1024 * 1024), self.blob_store.space_saved() / (1024 * 1024))
+        self.log.info(message)
+        self._message(message)
+
     def exportActiveHub(self):
         self.log.info("Starting export Active Hub")
-        self.ui.messageBox(
+        self._message(
             "Searching for and exporting files will take a while, depending on how many files you have.\n\n"
             "You won't be able to do anything else. It has to do everything in the main thread and open and close every file.\n\n"
             "Take an early lunch."
         )
 
+        self._start_run()
         self.progress_dialog.show("Exporting data!", "", 0, 1, 1)
         self._exportHub(self.data.activeHub)
         self.log.info("Done exporting")
@@ -115,13 +386,14 @@ class FusionFileExport(object):
         product = self.app.activeProduct
         design = adsk.fusion.Design.cast(product)
         if not design.parentDocument.dataFile:
-            self.ui.messageBox("Current file is not saved!", 'Error',
+            self._message("Current file is not saved!", 'Error',
                                adsk.core.MessageBoxButtonTypes.OKButtonType, adsk.core.MessageBoxIconTypes.CriticalIconType)
             return        
 
         self.project_index = 0
         self.projects_count = 1
 
+        self._start_run()
         self.progress_dialog.show("Exporting data!", "", 0, 1, 1)
         self._exportProject(design.parentDocument.dataFile.parentProject)
         self.log.info("Done exporting")
@@ -133,7 +405,7 @@ class FusionFileExport(object):
         product = self.app.activeProduct
         design = adsk.fusion.Design.cast(product)
         if not design.parentDocument.dataFile:
-            self.ui.messageBox("Current file is not saved!", 'Error',
+            self._message("Current file is not saved!", 'Error',
                                adsk.core.MessageBoxButtonTypes.OKButtonType, adsk.core.MessageBoxIconTypes.CriticalIconType)
             return
 
@@ -145,129 +417,838 @@ class FusionFileExport(object):
         self.log.info("Done exporting")
         self.showExportResult()
 
+    def exportProjects(self, project_ids):
+        self.log.info("Starting export of {} projects".format(len(project_ids)))
+
+        self.project_index = 0
+        self.projects_count = len(project_ids)
+
+        self._start_run()
+        job_unit = self.journal.begin("job", "projects")
+        self.progress_dialog.show("Exporting data!", "", 0, 1, 1)
+        all_projects = self.data.activeHub.dataProjects
+        for project_index, project_id in enumerate(project_ids):
+            self.project_index = project_index
+            if self.journal.is_done("project", project_id):
+                continue
+
+            project = all_projects.itemById(project_id)
+            if project is None:
+                self.num_issues += 1
+                self.log.error("Project \"{}\" not found in the active hub".format(project_id))
+                continue
+
+            self._exportProject(project, job_unit)
+            if self._should_stop():
+                break
+        else:
+            self.journal.end(job_unit)
+
+        self.log.info("Done exporting")
+        self.showExportResult()
+
+    def exportFiles(self, file_ids):
+        self.log.info("Starting export of {} files".format(len(file_ids)))
+        self._exportFileIds(file_ids, "files", self._write_file_versions)
+
+    def exportPlan(self, plan_path=None):
+        if plan_path is None:
+            # the shard's part of a split plan, or the whole plan divided by hash
+            plan_path = os.path.join(self.output_path, self.shard.file_name(self.plan_file_name))
+            if not os.path.exists(plan_path):
+                plan_path = os.path.join(self.output_path, self.plan_file_name)
+        if not os.path.exists(plan_path):
+            self._message("There is no export plan \"{}\", make one first".format(plan_path), 'Error',
+                          adsk.core.MessageBoxButtonTypes.OKButtonType, adsk.core.MessageBoxIconTypes.CriticalIconType)
+            return
+
+        plan = ExportPlan.load(plan_path)
+        if not self._apply_plan_settings(plan, plan_path):
+            return
+
+        items = plan.exports()
+        self.log.info("Starting export of {} planned versions from \"{}\"".format(len(items), plan_path))
+
+        # folders are known from the plan, nothing is listed or climbed up again
+        planned_versions = OrderedDict()
+        for item in items:
+            self.folder_paths.setdefault(item["folder_id"], os.path.join(self.output_path, item["folder_path"]))
+            planned_versions.setdefault(item["file_id"], []).append(item)
+
+        shard_values = plan.options.get("shard")
+        if shard_values is not None and shard_values["index"] != self.shard.index:
+            self.log.warning("\"{}\" is the plan of shard {}, exported as {}".format(
+                plan_path, shard_values["index"] + 1, self.shard.name))
+
+        self._exportFileIds(list(planned_versions), "plan",
+                            lambda file: self._write_planned_versions(file, planned_versions[file.id]),
+                            "hash" if shard_values is None else "plan")
+
+    def splitPlan(self, shard_count, shard_weights=None, plan_path=None):
+        plan_path = plan_path or os.path.join(self.output_path, self.plan_file_name)
+        if not os.path.exists(plan_path):
+            self._message("There is no export plan \"{}\", make one first".format(plan_path), 'Error',
+                          adsk.core.MessageBoxButtonTypes.OKButtonType, adsk.core.MessageBoxIconTypes.CriticalIconType)
+            return
+
+        plan = ExportPlan.load(plan_path)
+        weights = ExportShard(0, shard_count, shard_weights).weights
+        lines = []
+        for index, shard_plan in enumerate(plan.split(shard_count, weights)):
+            shard = ExportShard(index, shard_count, weights)
+            shard_plan_path = os.path.join(os.path.dirname(plan_path), shard.file_name(os.path.basename(plan_path)))
+            shard_plan.save(shard_plan_path)
+            lines.append("{}: {}".format(shard.name, shard_plan.summary().splitlines()[0]))
+
+        message = "Plan \"{}\" split into {} shards\n{}".format(plan_path, shard_count, "\n".join(lines))
+        self.log.info(message)
+        self._message(message)
+
+    def mergeShards(self, shard_paths=None):
+        self.log.info("Merging shard reports")
+        merge = ShardMerge.find(shard_paths or [self.output_path])
+        if not merge.reports:
+            self._message("No shard reports found in {}".format(", ".join(shard_paths or [self.output_path])))
+            return None
+
+        result = merge.check()
+        own_manifest_path = os.path.join(self.output_path, self.shard.file_name('exportmanifest.db'))
+        for manifest_path in merge.manifest_paths():
+            if os.path.exists(manifest_path) and os.path.abspath(manifest_path) != os.path.abspath(own_manifest_path):
+                self.manifest.merge(manifest_path)
+        log_path = os.path.join(self.output_path, 'shards.log')
+        records_count = merge.merge_logs(log_path)
+        self.log.info("{} log records of the shards merged into \"{}\"".format(records_count, log_path))
+
+        report_path = os.path.join(self.output_path, 'shards.json')
+        merge.save(report_path, result)
+
+        problems = merge.problems(result)
+        self.num_issues += problems
+        summary = merge.summary(result)
+        if problems > 0:
+            self.log.warning(summary)
+        else:
+            self.log.info(summary)
+        self._message(summary)
+        return result
+
+    def planActiveHub(self, plan_path=None):
+        self.log.info("Planning export of the active hub")
+
+        plan = self._start_plan()
+        self.progress_dialog.show("Planning export", "", 0, 1, 1)
+        all_projects = self.data.activeHub.dataProjects
+        self.projects_count = all_projects.count
+        for project_index in range(self.projects_count):
+            self.project_index = project_index
+            self._planProject(all_projects.item(project_index), plan)
+            if self.was_cancelled:
+                break
+
+        self._finish_plan(plan, plan_path)
+
+    def planCurrentProject(self, plan_path=None):
+        self.log.info("Planning export of the current project")
+
+        product = self.app.activeProduct
+        design = adsk.fusion.Design.cast(product)
+        if not design.parentDocument.dataFile:
+            self._message("Current file is not saved!", 'Error',
+                          adsk.core.MessageBoxButtonTypes.OKButtonType, adsk.core.MessageBoxIconTypes.CriticalIconType)
+            return
+
+        self.project_index = 0
+        self.projects_count = 1
+
+        plan = self._start_plan()
+        self.progress_dialog.show("Planning export", "", 0, 1, 1)
+        self._planProject(design.parentDocument.dataFile.parentProject, plan)
+        self._finish_plan(plan, plan_path)
+
+    def catalogActiveHub(self):
+        self.log.info("Cataloging the active hub")
+        catalog_path = os.path.join(self.output_path, catalog_file_name)
+        if self.catalog is None:
+            self.catalog = HubCatalog(catalog_path)
+
+        hub = self.data.activeHub
+        hub_id = hub.id
+        self.catalog.begin()
+        self.catalog.record_hub(hub_id, hub.name)
+        self.progress_dialog.show("Cataloging hub", "", 0, 1, 1)
+        all_projects = hub.dataProjects
+        self.projects_count = all_projects.count
+        for project_index in range(self.projects_count):
+            self.project_index = project_index
+            self._catalogProject(all_projects.item(project_index), hub_id)
+            if self.was_cancelled:
+                break
+        else:
+            removed = self.catalog.finish_hub(hub_id)
+            if removed:
+                self.log.info("{} projects are gone from the hub".format(removed))
+        self.progress_dialog.hide()
+
+        if self.was_cancelled:
+            self._message("Cancelled! Projects catalogued so far are kept")
+            return
+
+        summary = self.catalog.summary()
+        self.log.info("Catalog saved to \"{}\": {}".format(catalog_path, summary))
+        self._message("Catalog saved to \"{}\"\n\n{}".format(catalog_path, summary))
+
+    def exportCatalog(self, project_ids=None):
+        hub_id = self.data.activeHub.id
+        refreshed_at = self.catalog.refreshed(hub_id) if self.catalog is not None else None
+        if refreshed_at is None:
+            self._message("The active hub isn't catalogued, catalog it first", 'Error',
+                          adsk.core.MessageBoxButtonTypes.OKButtonType, adsk.core.MessageBoxIconTypes.CriticalIconType)
+            return
+
+        # files and folders are known from the catalog, only files with something to export are looked up
+        self.folder_paths.update(self.catalog.folder_paths(self.output_path, hub_id))
+        designs = self.catalog.designs(hub_id, project_ids)
+        version_selector = self._version_selector()
+        file_ids = [file_id for file_id, version_number in designs
+                    if not version_selector.is_done(file_id, version_number)]
+        self.file_skipped_count += len(designs) - len(file_ids)
+        self.log.info("Starting export of {} of {} catalogued designs, the catalog is {:.1f} hours old".format(
+            len(file_ids), len(designs), (time.time() - refreshed_at) / 3600))
+
+        self._exportFileIds(file_ids, "catalog", self._write_file_versions)
+
+    def _exportFileIds(self, file_ids, job_id, write, assignment="hash"):
+        self.files_count = len(file_ids)
+
+        self._start_run(assignment)
+        self.project_unit = self.journal.begin("job", job_id)
+        self.progress_dialog.show("Exporting data!", "Exporting design %v of %m", 0, len(file_ids), 1)
+        for file_index, file_id in enumerate(file_ids):
+            self.file_index = file_index
+            self.ui_pump.progress(file_index + 1)
+            if self.ui_pump.poll():
+                self._cancelled()
+            if self._should_stop():
+                break
+
+            file = self.data.findFileById(file_id)
+            if file is None:
+                self.num_issues += 1
+                self.log.error("File \"{}\" not found".format(file_id))
+                continue
+
+            if not self._is_in_shard(file, assignment):
+                continue
+
+            if self.journal.resumed and self._is_journaled(file, ()):
+                self.file_skipped_count += 1
+                continue
+
+            write(file)
+            self._collect_archives()
+            self.cloud_exports.poll()
+        else:
+            self.journal.end(self.project_unit)
+        self.project_unit = None
+
+        self.log.info("Done exporting")
+        self.showExportResult()
+
+    def _message(self, text, title="", buttons=adsk.core.MessageBoxButtonTypes.OKButtonType,
+                 icon=adsk.core.MessageBoxIconTypes.NoIconIconType, default=adsk.core.DialogResults.DialogOK):
+        if self.interactive:
+            return self.ui.messageBox(text, title, buttons, icon)
+
+        # nobody is there to click, log it and take the default answer
+        self.log.info("{}{}".format(title + ": " if title else "", text))
+        return default
+
+    def _cancelled(self):
+        if not self.was_cancelled:
+            self.log.info("The process was cancelled!")
+        self.was_cancelled = True
+
+    def _refresh_viewport(self):
+        viewport = self.app.activeViewport
+        if viewport is not None:
+            viewport.refresh()
+
+    def _should_stop(self):
+        if self.was_cancelled or self.was_out_of_time:
+            return True
+
+        if self.deadline is not None and time.time() >= self.deadline:
+            self.log.info("Time budget of {}s is used up".format(self.time_budget))
+            self.was_out_of_time = True
+            return True
+
+        return False
+
+    def _remaining_time(self):
+        if self.deadline is None:
+            return None
+        return self.deadline - time.time()
+
+    def _start_run(self, assignment="hash"):
+        if self.time_budget > 0:
+            self.deadline = time.time() + self.time_budget
+        if self.shard.is_sharded:
+            self.log.info("Exporting {} by {}".format(self.shard.name, assignment))
+            self.shard_report = ShardReport(self.shard, assignment)
+        self.scheduler = ExportScheduler(self.manifest, self.schedule_policy, self.catalog)
+        self.journal.start(self.resume)
+        if self.journal.resumed:
+            self.log.info("Resuming export, {} units already done".format(
+                len(self.journal.done_units)))
+        elif self.resume:
+            self.log.info("Nothing to resume, starting a new export")
+
     def _exportAllHubs(self):
         if len(self.data.dataHubs) > 1:
-            self.ui.messageBox("The API doesn't support activating a hub and you can only work with the contents of a hub in Fusion when that hub is active. \n\nScript will work only in active hub. \n\nhttps://forums.autodesk.com/t5/fusion-360-api-and-scripts/how-to-select-teams-hub-from-python-api/m-p/10748918")
+            self._message("The API doesn't support activating a hub and you can only work with the contents of a hub in Fusion when that hub is active. \n\nScript will work only in active hub. \n\nhttps://forums.autodesk.com/t5/fusion-360-api-and-scripts/how-to-select-teams-hub-from-python-api/m-p/10748918")
 
         all_hubs = self.data.dataHubs
         for hub_index in range(all_hubs.count):
             hub = all_hubs.item(hub_index)
             self._exportHub(hub)
-            if self.was_cancelled:
+            if self._should_stop():
                 return
 
     def _exportHub(self, hub):
 
         self.log.info("Exporting hub \"{}\"".format(hub.name))
         self.data.activeHub = hub
-        time.sleep(1)
+        hub_id = hub.id
+        if not self.waiter.wait("activeHub", lambda: self.data.activeHub.id == hub_id, activation_timeout):
+            self.log.warning("Hub \"{}\" is not active after {}s".format(
+                hub.name, activation_timeout))
         self.log.info("activeHub hub \"{}\"".format(
             self.data.activeHub.name))
 
         if hub.id == self.data.activeHub.id:
+            hub_unit = self.journal.begin("hub", hub_id)
             all_projects = hub.dataProjects
-            for project_index in range(all_projects.count):
+            self.projects_count = all_projects.count
+            for project_index in range(self.projects_count):
 
+                self.project_index = project_index
                 project = all_projects.item(project_index)
-                self._exportProject(project)
+                if self.journal.is_done("project", project.id):
+                    self.log.info(
+                        "Project \"{}\" is done according to the journal".format(project.name))
+                    continue
 
-                if self.was_cancelled:
+                self._exportProject(project, hub_unit)
+
+                if self._should_stop():
                     return
 
+            self.journal.end(hub_unit)
             self.log.info("Finished exporting hub \"{}\"".format(hub.name))
 
-    def _exportProject(self, project):
+    def _exportProject(self, project, hub_unit=None):
         self.log.info(
             "Exporting project \"{}\"".format(project.name))
         self.data.activeProject = project
-        time.sleep(1)
+        project_id = project.id
+        if not self.waiter.wait("activeProject", lambda: self.data.activeProject.id == project_id, activation_timeout):
+            self.log.warning("Project \"{}\" is not active after {}s".format(
+                project.name, activation_timeout))
 
         self.log.info("activeProject \"{}\"".format(project.name))
 
+        self.project_unit = self.journal.begin("project", project_id, hub_unit)
+
+        # files that were being exported when the previous run died go first, without listing anything
+        retried = set()
+        for file_id in self.journal.interrupted("file", project_id):
+            file = self.data.findFileById(file_id)
+            if file is None:
+                continue
+
+            last_component = self.journal.last_component.get(file_id)
+            if self.manifest.record_failure(file_id, "interrupted at component \"{}\"".format(last_component)) >= quarantine_after_failures:
+                self._quarantine(file, "interrupted {} runs in a row, last at component \"{}\"".format(
+                    quarantine_after_failures, last_component))
+            if file_id in self.quarantined and self.quarantine_policy != "retry":
+                continue  # the policy applies when it comes up in the listing
+
+            self.log.file("Retrying \"{}\" interrupted in the previous run at component \"{}\"".format(
+                file.name, last_component))
+            retried.add(file_id)
+            self._write_file_versions(file)
+            self._collect_archives()
+
         folder = project.rootFolder
 
-        files = []
-        files.extend(self._get_files_for(folder))
+        # export starts as soon as the first folder is listed, the total is refined on the way
+        files = self._enumerate_files(folder)
 
-        self.progress_dialog.message = "Project: {} of {}\nExporting design %v of %m".format(
+        self.progress_dialog.message = "Project: {} of {}\nExporting design %v of %m (listing folders...)".format(
             self.project_index + 1,
             self.projects_count
         )
-        self.progress_dialog.maximumValue = len(files)
+        self.progress_dialog.maximumValue = 1
         self.progress_dialog.reset()
 
-        if not files:
-            self.log.info("No files to export for this project")
-            return
+        file_index = 0
+        deferred_count = self.file_deferred_count
+        quarantined_files = []
+        is_listing = True
+        for file in self._scheduled(files):
+            self.ui_pump.progress(file_index + 1, files.discovered)
+            if self.ui_pump.poll():
+                self._cancelled()
+                return
 
-        for file_index in range(len(files)):
-            self.app.activeViewport.refresh()
-            adsk.doEvents()
+            if self._should_stop():
+                return
+
+            file_index += 1
+            if not self._is_in_shard(file):
+                continue
+
+            if self.journal.resumed and self._is_journaled(file, retried):
+                self.file_skipped_count += 1
+            elif file.id in self.quarantined and self.quarantine_policy == "skip":
+                self.file_skipped_count += 1
+                self.file_held_quarantined_count += 1
+                self._leave(file, "quarantined")
+                self.log.file("Skipped quarantined \"{}\": {}".format(file.name, self.quarantined[file.id][1]))
+            elif file.id in self.quarantined and self.quarantine_policy == "defer":
+                quarantined_files.append(file)
+            elif self.deadline is not None and not self.scheduler.fits(file.id, self._remaining_time()):
+                # left for the next run, a cheaper file may still fit
+                self.file_deferred_count += 1
+                self._leave(file, "deferred")
+                self.log.file("Deferred \"{}\", it doesn't fit into the remaining time".format(file.name))
+            else:
+                self._write_file_versions(file)
+            self._collect_archives()
+            self.cloud_exports.poll()
+
+            if is_listing and files.finished:
+                is_listing = False
+                self.progress_dialog.message = "Project: {} of {}\nExporting design %v of %m".format(
+                    self.project_index + 1,
+                    self.projects_count
+                )
 
-            if self.progress_dialog.wasCancelled:
-                self.log.info("The process was cancelled!")
-                self.was_cancelled = True
+        # known troublemakers don't hold up the rest of the project
+        for position, file in enumerate(quarantined_files):
+            if self.ui_pump.poll():
+                self._cancelled()
+            if self._should_stop():
+                for file in quarantined_files[position:]:
+                    self._leave(file, "stopped")
                 return
 
-            file: adsk.core.DataFile = files[file_index]
-            self.progress_dialog.progressValue = file_index + 1
-            self._write_data_file(file)
+            if self.deadline is not None and not self.scheduler.fits(file.id, self._remaining_time()):
+                self.file_deferred_count += 1
+                self.file_held_quarantined_count += 1
+                self._leave(file, "deferred")
+                self.log.file("Deferred quarantined \"{}\", it doesn't fit into the remaining time".format(file.name))
+                continue
+
+            self.log.file("Exporting quarantined \"{}\" last: {}".format(file.name, self.quarantined[file.id][1]))
+            self._write_file_versions(file)
+            self._collect_archives()
+            self.cloud_exports.poll()
+
+        if self.file_deferred_count == deferred_count:
+            self.journal.end(self.project_unit)
+        # else deferred files are left for a resumed run
+        self.project_unit = None
+
+        if file_index == 0:
+            self.log.info("No files to export for this project")
+            return
 
         self.log.info(
             "Finished exporting project \"{}\"".format(project.name))
 
-    def _get_files_for(self, folder):
-        files = []
-        for file in folder.dataFiles:
-            files.append(file)
+    def _is_in_shard(self, file, assignment="hash"):
+        if self.shard_report is None:
+            return True
+        if assignment == "hash" and not self.shard.includes(file.id):
+            self.shard_report.other(file)
+            return False
+        self.shard_report.assign(file)
+        return True
 
-        for sub_folder in folder.dataFolders:
-            files.extend(self._get_files_for(sub_folder))
+    def _leave(self, file, reason):
+        # a file of the shard that isn't done in this run
+        if self.shard_report is not None:
+            self.shard_report.leave(file, reason)
 
-        return files
+    def _scheduled(self, files):
+        if self.scheduler is None:
+            self.scheduler = ExportScheduler(self.manifest, self.schedule_policy, self.catalog)
+        if not self.scheduler.is_reordering:
+            return files
 
-    def _write_data_file(self, file: adsk.core.DataFile):
-        if file.fileExtension != "f3d" and file.fileExtension != "f3z":
-            self.log.info("Not exporting file \"{}\"".format(file.name))
+        return (file
+                for batch in files.batches(scheduler_window or sys.maxsize)
+                for file in self.scheduler.order(batch))
+
+    def _select_versions(self, file):
+        return self._version_selector().select(file)
+
+    def _version_selector(self):
+        if self.version_selector is None:
+            self.version_selector = VersionSelector(self.manifest, self.version_policy, self.version_interval)
+        return self.version_selector
+
+    def _write_file_versions(self, file):
+        try:
+            versions = self._select_versions(file)
+        except BaseException as ex:
+            self.num_issues += 1
+            self.log.exception(
+                "Failed to list versions of \"{}\"".format(file.name), exc_info=ex)
+            return
+
+        if not versions:
             self.file_skipped_count += 1
+            self._journal_skip(file)
+            self.log.file("No new versions of \"{}\"".format(file.name))
             return
 
-        root_folder = self.output_path
-        # self.log.info("Exporting file \"{}\"".format(file.name))
+        # the latest version goes last, once it is done the journal has the whole file done
+        for position, version in enumerate(versions):
+            self._write_data_file(version, is_latest=version is file)
 
-        try:
-            file_folder = file
-            file_folder_path = ""
+            if self.ui_pump.poll():
+                self._cancelled()
+            if self._should_stop():
+                if position < len(versions) - 1:
+                    self._leave(file, "stopped")
+                return
 
-            while True:
-                file_folder = file_folder.parentFolder
-                if not file_folder.isRoot:
-                    file_folder_path = os.path.join(
-                        self._name(file_folder.name), file_folder_path)
+    def _write_planned_versions(self, file, items):
+        version_ids = [item["version_id"] for item in items]
+        versions = {}
+        if file.versionId in version_ids:
+            versions[file.versionId] = file
+        if len(versions) < len(version_ids):
+            for version in file.versions:
+                version_id = version.versionId
+                if version_id in version_ids and version_id not in versions:
+                    versions[version_id] = version
+
+        for version_id in version_ids:
+            version = versions.get(version_id)
+            if version is None:
+                self.num_issues += 1
+                self.log.error("Planned version \"{}\" of \"{}\" not found".format(version_id, file.name))
+                continue
+
+            self._write_data_file(version, is_latest=version is file)
+            if self._should_stop():
+                return
+
+    def _settings(self):
+        # what a plan is made with, exporting it takes the same
+        return OrderedDict([
+            ("export_step", self.export_step),
+            ("export_stl", self.export_stl),
+            ("export_iges", self.export_iges),
+            ("stl_mode", self.stl_mode),
+            ("archive_format", self.archive_format),
+            ("version_policy", self.version_policy),
+            ("version_interval", self.version_interval),
+            ("quarantine_policy", self.quarantine_policy),
+        ])
+
+    def _apply_plan_settings(self, plan, plan_path):
+        # settings left at their defaults take the plan's, changed ones have to agree with it
+        planned = OrderedDict((name, plan.options[name]) for name in self.default_settings if name in plan.options)
+        conflicts = ["{} is {}, planned with {}".format(name, value, planned[name])
+                     for name, value in self._settings().items()
+                     if name in planned and value != planned[name] and value != self.default_settings[name]]
+        if conflicts:
+            self.num_issues += 1
+            message = "Not exporting \"{}\", it was planned with other settings:\n{}".format(
+                plan_path, "\n".join(conflicts))
+            self.log.error(message)
+            self._message(message, 'Error', adsk.core.MessageBoxButtonTypes.OKButtonType,
+                          adsk.core.MessageBoxIconTypes.CriticalIconType)
+            return False
+
+        for name, value in planned.items():
+            setattr(self, name, value)
+        return True
 
-                if file_folder.parentFolder is None:
-                    break
+    def _start_plan(self):
+        self.scheduler = ExportScheduler(self.manifest, self.schedule_policy, self.catalog)
+        return ExportPlan(self.output_path, self._settings())
 
-            parent_project = file_folder.parentProject
+    def _planProject(self, project, plan):
+        self.log.info("Planning project \"{}\"".format(project.name))
+        project_id = project.id
+
+        files = self._enumerate_files(project.rootFolder)
+        self.progress_dialog.message = "Project: {} of {}\nPlanning design %v of %m".format(
+            self.project_index + 1,
+            self.projects_count
+        )
+        self.progress_dialog.maximumValue = 1
+        self.progress_dialog.reset()
+
+        file_index = 0
+        for batch in files.batches(500):
+            file_ids = [file.id for file in batch]
+            self.scheduler.prefetch(file_ids)
+            self.scheduler.prefetch_sizes(file_ids)
+
+            for file, file_id in zip(batch, file_ids):
+                file_index += 1
+                self.ui_pump.progress(file_index, files.discovered)
+                if self.ui_pump.poll():
+                    self._cancelled()
+                    return
+
+                try:
+                    self._plan_file(file, file_id, project_id, plan)
+                except BaseException as ex:
+                    self.num_issues += 1
+                    self.log.exception(
+                        "Failed to plan \"{}\"".format(file.name), exc_info=ex)
+
+    def _plan_file(self, file, file_id, project_id, plan):
+        # the checks of _write_data_file, without opening anything
+        file_folder_path = os.path.join(
+            self._folder_path(file.parentFolder),
+            self._name(file.name) + "." + file.fileExtension
+        )
+
+        if file.fileExtension != "f3d" and file.fileExtension != "f3z":
+            plan.add(file, file, project_id, file_folder_path, "skip", "not a design")
+            return
+
+        if self.is_ignoring_file(file_folder_path):
+            plan.add(file, file, project_id, file_folder_path, "skip", "exportignore.txt")
+            return
+
+        versions = self._select_versions(file)
+        if not versions:
+            plan.add(file, file, project_id, file_folder_path, "skip", "no new versions")
+            return
+
+        for version in versions:
+            reason = self._plan_skip_reason(file_id, version, file_folder_path, version is file)
+            if reason is not None:
+                plan.add(file, version, project_id, file_folder_path, "skip", reason)
+                continue
+
+            is_assembly = self._assembly_flag(version.versionId)
+            plan.add(file, version, project_id, file_folder_path, "export", None,
+                     self.scheduler.estimate(file_id, is_assembly),
+                     self.scheduler.estimate_size(file_id, is_assembly))
+
+    def _plan_skip_reason(self, file_id, version, file_folder_path, is_latest):
+        file_export_path, assembly_export_path, zip_acrhive_path = self._export_paths(
+            version, file_folder_path)
+
+        if max_output_path_length > 0 and len(file_export_path) > max_output_path_length:
+            return "path too long"
+
+        if file_id in self.quarantined and self.quarantine_policy == "skip":
+            return "quarantined"
+
+        if not ignore_already_exported_files:
+            return None
+
+        if self.manifest.is_exported(file_id, version.versionId):
+            return "already exported"
+
+        if self.manifest.is_stale(file_id, version.versionId):
+            return None
+
+        if self.output_tree.exists(file_export_path) and self.output_tree.exists(zip_acrhive_path):
+            is_assembly = self._assembly_flag(version.versionId)
+            if is_assembly is None:
+                is_assembly = version.hasChildReferences
+            if not (is_assembly and is_latest) or self.output_tree.exists(assembly_export_path):
+                return "already exists"
+
+        return None
+
+    def _finish_plan(self, plan, plan_path=None):
+        self.progress_dialog.hide()
+        if self.was_cancelled:
+            self._message("Cancelled!")
+            return
+
+        plan_path = plan_path or os.path.join(self.output_path, self.plan_file_name)
+        plan.save(plan_path)
+
+        summary = plan.summary(shutil.disk_usage(self.output_path).free)
+        self.log.info("Export plan saved to \"{}\"\n{}".format(plan_path, summary))
+        self._message("Export plan saved to \"{}\"\n\n{}".format(plan_path, summary))
+
+    def _assembly_flag(self, version_id):
+        is_assembly = self.manifest.assembly_flag(version_id)
+        if is_assembly is None and self.catalog is not None:
+            is_assembly = self.catalog.assembly_flag(version_id)
+        return is_assembly
+
+    def _catalogProject(self, project, hub_id):
+        self.log.info("Cataloging project \"{}\"".format(project.name))
+        project_id = project.id
+        root_folder = project.rootFolder
+        root_folder_id = root_folder.id
+        root_folder_path = self._folder_path(root_folder)
+        self.catalog.record_project(project_id, hub_id, project.name, root_folder_id)
+        self.catalog.record_folder(root_folder_id, project_id, None, root_folder.name,
+                                   os.path.relpath(root_folder_path, self.output_path))
+
+        files = FileEnumerator(
+            root_folder, root_folder_path, self._name, self.folder_paths, root_folder_id,
+            lambda folder_id, parent_id, name, folder_path: self.catalog.record_folder(
+                folder_id, project_id, parent_id, name, os.path.relpath(folder_path, self.output_path)))
+        self.progress_dialog.message = "Project: {} of {}\nCataloging file %v of %m".format(
+            self.project_index + 1,
+            self.projects_count
+        )
+        self.progress_dialog.maximumValue = 1
+        self.progress_dialog.reset()
+
+        position = 0
+        changed_count = 0
+        batch = []
+        for file in files:
+            position += 1
+            self.ui_pump.progress(position, files.discovered)
+            if self.ui_pump.poll():
+                self._cancelled()
+                return
+
+            batch.append((file, files.folder_id, position))
+            if len(batch) >= 500:
+                changed_count += self._catalog_files(batch, project_id)
+                batch = []
+        if batch:
+            changed_count += self._catalog_files(batch, project_id)
+
+        removed_count = self.catalog.finish_project(project_id)
+        self.log.info("Catalogued project \"{}\": {} files, {} new or changed, {} removed".format(
+            project.name, position, changed_count, removed_count))
+
+    def _catalog_files(self, batch, project_id):
+        # only files with a new version are read again
+        file_ids = [file.id for file, folder_id, position in batch]
+        version_ids = self.catalog.version_ids(file_ids)
+        sizes = self.manifest.version_sizes(file_ids)
+
+        unchanged = []
+        changed = []
+        for (file, folder_id, position), file_id in zip(batch, file_ids):
+            version_id = file.versionId
+            if version_ids.get(file_id) == version_id:
+                unchanged.append((project_id, folder_id, position, sizes.get(file_id), file_id))
+                continue
+
+            try:
+                changed.append(self._catalog_file(file, file_id, version_id, project_id, folder_id, position,
+                                                  sizes.get(file_id)))
+            except BaseException as ex:
+                self.num_issues += 1
+                self.log.exception(
+                    "Failed to catalog \"{}\"".format(file.name), exc_info=ex)
+
+        self.catalog.touch_files(unchanged)
+        self.catalog.record_files(changed)
+        return len(changed)
+
+    def _catalog_file(self, file, file_id, version_id, project_id, folder_id, position, size):
+        extension = file.fileExtension
+        child_ids = []
+        if extension == "f3d" or extension == "f3z":
+            # references known from exports save the slow hasChildReferences call
+            child_ids = self.manifest.child_references(version_id)
+            if child_ids is None:
+                is_assembly = self.manifest.assembly_flag(version_id)
+                if is_assembly is None:
+                    is_assembly = file.hasChildReferences
+                child_ids = []
+                if is_assembly:
+                    references = file.childReferences
+                    child_ids = [references.item(index).id for index in range(references.count)]
+
+        return OrderedDict([
+            ("file_id", file_id),
+            ("project_id", project_id),
+            ("folder_id", folder_id),
+            ("position", position),
+            ("name", file.name),
+            ("extension", extension),
+            ("version_id", version_id),
+            ("version_number", file.versionNumber),
+            ("date_created", file.dateCreated),
+            ("date_modified", file.dateModified),
+            ("is_assembly", bool(child_ids)),
+            ("size", size),
+            ("child_ids", child_ids),
+        ])
+
+    def _is_journaled(self, file, retried):
+        file_id = file.id
+        return file_id in retried or self.journal.is_done("file", file_id, file.versionId)
+
+    def _get_files_for(self, folder):
+        return list(self._enumerate_files(folder))
+
+    def _enumerate_files(self, folder):
+        # output path of every folder is known while going top-down, no need to climb up for every file later
+        return FileEnumerator(folder, self._folder_path(folder), self._name, self.folder_paths)
+
+    def _folder_path(self, folder):
+        folder_id = folder.id
+        folder_path = self.folder_paths.get(folder_id)
+        if folder_path is not None:
+            return folder_path
+
+        if folder.isRoot:
+            parent_project = folder.parentProject
             parent_hub = parent_project.parentHub
+            folder_path = os.path.join(
+                self.output_path,
+                "Hub {}".format(self._name(parent_hub.name)),
+                "{}".format(self._name(parent_project.name))
+            )
+        else:
+            folder_path = os.path.join(self._folder_path(
+                folder.parentFolder), self._name(folder.name))
+
+        self.folder_paths[folder_id] = folder_path
+        return folder_path
+
+    def _write_data_file(self, file: adsk.core.DataFile, is_latest=True):
+        if file.fileExtension != "f3d" and file.fileExtension != "f3z":
+            self.log.file("Not exporting file \"{}\"".format(file.name))
+            self.file_skipped_count += 1
+            return
+
+        root_folder = self.output_path
+        # self.log.file("Exporting file \"{}\"".format(file.name))
 
+        try:
             file_folder_path = self._take(
-                root_folder,
-                "Hub {}".format(self._name(parent_hub.name)),
-                "{}".format(self._name(parent_project.name)),
-                file_folder_path,
+                self._folder_path(file.parentFolder),
                 self._name(file.name) + "." + file.fileExtension
             )
 
-            self.log.info("Exporting file \"{}\" to \"{}\"".format(
+            self.log.file("Exporting file \"{}\" to \"{}\"".format(
                 file.name, file_folder_path))
 
             if self.is_ignoring_file(file_folder_path):
-                self.log.info(
+                self.log.file(
                     "File \"{}\" found in exportignore.txt".format(file_folder_path))
                 return
 
-            if not os.path.exists(file_folder_path):
+            if not self.output_tree.exists(file_folder_path):
                 self.num_issues += 1
                 self.log.exception(
                     "Couldn't make root folder\"{}\"".format(file_folder_path))
@@ -279,61 +1260,108 @@ class FusionFileExport(object):
                 "Failed while working on \"{}\"".format(file.name), exc_info=ex)
             raise
 
-        file_export_path = os.path.join(file_folder_path, self._name(
-            file.name)) + " v" + str(file.versionNumber)
-        # fix for names with dots. Fusion trying to interpretate symbols after last dot as extensoin
-        file_export_path = file_export_path + ".f3d"
-
-        # only for check. can't pass into Fusion. Not self._name(file.name)
-        assembly_export_path = os.path.join(
-            file_folder_path, file.name) + ".f3z"
-        zip_acrhive_path = file_export_path + "_files"
+        file_export_path, assembly_export_path, zip_acrhive_path = self._export_paths(
+            file, file_folder_path)
 
         if max_output_path_length > 0 and len(file_export_path) > max_output_path_length:
             self.file_skipped_count += 1
-            self.log.info(
+            self.log.file(
                 "Path is too long. Skip \"{}\"".format(file_export_path))
             return
 
-        is_assembly = file.hasChildReferences  # very slow call ~0.2s
-        is_file_export_path_exist = os.path.exists(file_export_path)
-        is_assembly_export_path_exist = os.path.exists(assembly_export_path)
-        is_zip_acrhive_exist = os.path.exists(zip_acrhive_path + ".zip")
+        if ignore_already_exported_files and self.manifest.is_exported(file.id, file.versionId):
+            self.file_skipped_count += 1
+            self._journal_skip(file)
+            self.log.file(
+                "File \"{}\" already exported".format(file_export_path))
+            return
 
-        if ignore_already_exported_files and is_file_export_path_exist and (not is_assembly or is_assembly_export_path_exist) and is_zip_acrhive_exist:
+        is_assembly = self._assembly_flag(file.versionId)
+        if is_assembly is None:
+            is_assembly = file.hasChildReferences  # very slow call ~0.2s
+            self.manifest.record_version(
+                file.id, file.versionId, file.versionNumber, is_assembly)
+        # cloud export makes the f3z of the latest version only, older versions go without it
+        has_assembly_export = is_assembly and is_latest
+
+        is_file_export_path_exist = self.output_tree.exists(file_export_path)
+        is_assembly_export_path_exist = self.output_tree.exists(assembly_export_path)
+        is_zip_acrhive_exist = self.output_tree.exists(zip_acrhive_path)
+        # the archive misses files exportignore.txt lets in now, it is written over
+        is_stale = self.manifest.is_stale(file.id, file.versionId)
+
+        if ignore_already_exported_files and is_file_export_path_exist and (not has_assembly_export or is_assembly_export_path_exist) and is_zip_acrhive_exist and not is_stale:
             self.file_skipped_count += 1
-            self.log.info(
+            self.log.file(
                 "All data files \"{}\" already exists".format(file_export_path))
+            # adopt files exported before the manifest existed without reading them back
+            self._record_manifest(file, file_folder_path, is_assembly, file_export_path,
+                                  assembly_export_path if has_assembly_export else None, zip_acrhive_path,
+                                  hash_artifacts=False)
+            self._journal_skip(file)
             return
 
         document = None
+        failure = None
+        cancelled = False
+        file_unit = self.journal.begin(
+            "file", file.id, self.project_unit, file.versionId)
+        self.file_unit = file_unit
+        self.file_started = time.time()
+        self.file_overruns = []
+        ignored_paths = self.ignored_paths = []
+        self.watchdog.file = (file.id, file.versionId, file.name)
+        self.profiler.begin_file(os.path.relpath(
+            file_folder_path, self.output_path))
         try:
-            document = self.documents.open(file)
+            with self._phase("documents.open"):
+                document = self.document_pool.open(file, file.versionId)
 
             if document is None:
                 raise Exception("Documents.open returned None")
+            self._check_file_budget()
 
-            document.activate()
+            with self._phase("activate"):
+                document.activate()
 
-            self.log.info("Writing to \"{}\" \"{}\"".format(
+            self.log.file("Writing to \"{}\" \"{}\"".format(
                 file_folder_path, file_export_path))
 
-            if not os.path.exists(file_export_path + ".png"):
-                self.app.activeViewport.refresh()
-                adsk.doEvents()
-                self.app.activeViewport.saveAsImageFile(
-                    file_export_path + '.png', 512, 512)
+            if not self.output_tree.exists(file_export_path + ".png"):
+                with self._phase("saveAsImageFile", self._part_path(file_export_path + '.png')):
+                    self.app.activeViewport.refresh()
+                    adsk.doEvents()
+                    self.app.activeViewport.saveAsImageFile(
+                        self._part_path(file_export_path + '.png'), 512, 512)
+                self._move_part(file_export_path + '.png')
                 self.check_exported_file(file_export_path + '.png')
 
-            if is_assembly and not is_assembly_export_path_exist:
-                self.has_cloud_export = True
-                self.log.info("f3z file. executing cloud export into \"{}\"".format(
+            def record_manifest():
+                self._record_manifest(file, file_folder_path, is_assembly, file_export_path,
+                                      assembly_export_path if has_assembly_export else None, zip_acrhive_path,
+                                      ignored_paths=ignored_paths)
+
+            def finish_file():
+                # the file is done once everything is on disk, the f3z is tracked separately
+                self.output_tree.added(zip_acrhive_path)
+                try:
+                    record_manifest()
+                except BaseException as ex:
+                    self.journal.fail(file_unit, str(ex))
+                    raise
+                self.journal.end(file_unit)
+
+            if has_assembly_export and not is_assembly_export_path_exist:
+                self.log.file("f3z file. executing cloud export into \"{}\"".format(
                     assembly_export_path))
-                returnValue = self.app.executeTextCommand(
-                    u'data.fileExport f3z "' + file_folder_path + '"')
-                self.log.info(
+                with self._phase("cloud export"):
+                    returnValue = self.app.executeTextCommand(
+                        u'data.fileExport f3z "' + file_folder_path + '"')
+                self.log.file(
                     "cloud export status: \"{}\"".format(returnValue))
-                time.sleep(5)
+                # don't wait for the cloud, the tracker notices when the f3z arrives
+                self.cloud_exports.add(
+                    assembly_export_path, file.name, record_manifest)
 
             if not is_file_export_path_exist:
                 fusion_document: adsk.fusion.FusionDocument = adsk.fusion.FusionDocument.cast(
@@ -342,19 +1370,28 @@ class FusionFileExport(object):
                 export_manager: adsk.fusion.ExportManager = design.exportManager
 
                 # Write f3d/f3z file
-                options = export_manager.createFusionArchiveExportOptions(
-                    file_export_path)
-                export_manager.execute(options)
+                with self._phase("f3d", self._part_path(file_export_path)):
+                    options = export_manager.createFusionArchiveExportOptions(
+                        self._part_path(file_export_path))
+                    export_manager.execute(options)
+                self._move_part(file_export_path)
                 self.check_exported_file(file_export_path)
+                self._check_file_budget()
 
                 # self._write_component(file_folder_path, design.rootComponent)
 
-            if not os.path.exists(zip_acrhive_path) or os.path.getsize(zip_acrhive_path) < 50:
+            archive_submitted = False
+            if is_stale or not is_zip_acrhive_exist or os.path.getsize(zip_acrhive_path) < 50:
                 fusion_document: adsk.fusion.FusionDocument = adsk.fusion.FusionDocument.cast(
                     document)
                 design: adsk.fusion.Design = fusion_document.design
                 export_manager: adsk.fusion.ExportManager = design.exportManager
 
+                # leftovers of an interrupted run would be taken as already written
+                shutil.rmtree(os.path.join(root_folder, self.temp_foler_name,
+                                           self._name(file.versionId)), ignore_errors=True)
+                self.output_tree.forget(os.path.join(
+                    root_folder, self.temp_foler_name, self._name(file.versionId)))
                 temp_rootComponent_folder_path = self._take(
                     root_folder,
                     self.temp_foler_name,
@@ -362,36 +1399,166 @@ class FusionFileExport(object):
                 )
 
                 # if len(os.listdir(temp_rootComponent_folder_path)) > 0:
-                #   self.log.info("Using cache files for archive \"{}\" -> \"{}\"".format(file.id, file.name))
+                #   self.log.file("Using cache files for archive \"{}\" -> \"{}\"".format(file.id, file.name))
                 # else:
-                self.log.info(
+                self.log.file(
                     "Exporting files for archive \"{}\" -> \"{}\"".format(file.id, file.name))
-                self._write_component(
-                    temp_rootComponent_folder_path, design.rootComponent)
 
-                shutil.make_archive(zip_acrhive_path, 'zip',
-                                    temp_rootComponent_folder_path)
-                self.check_exported_file(zip_acrhive_path + '.zip')
-
-            self.log.info("Finished exporting file \"{}\"".format(file.name))
+                # every exported file goes into the archive in background right away,
+                # the manifest is updated once the archive is complete
+                self.archive_stream = self.archive_pipeline.open(
+                    zip_acrhive_path, self.archive_format, temp_rootComponent_folder_path, finish_file,
+                    self.profiler.file)
+                archive_submitted = True
+                try:
+                    self.written_components.clear()
+                    self._clear_meshes()
+                    self._write_component(
+                        temp_rootComponent_folder_path, design.rootComponent, file.versionId)
+                except ExportCancelled:
+                    self.archive_stream.cancel()
+                    raise
+                except BaseException:
+                    self.archive_stream.abort(
+                        "Export of \"{}\" failed".format(file.name))
+                    raise
+                else:
+                    self.archive_stream.close()
+                finally:
+                    self.archive_stream = None
+                    # the temp folder is removed once archived
+                    self.output_tree.forget(temp_rootComponent_folder_path)
+                    self._clear_meshes()
+
+            if not archive_submitted:
+                finish_file()
+
+            self.log.file("Finished exporting file \"{}\"".format(file.name))
+
+        except ExportCancelled:
+            # not a failure of the file, it starts over when the export is resumed
+            self._cancelled()
+            self.journal.abandon(file_unit)
+            self._leave(file, "cancelled")
+            self.log.file("Abandoned \"{}\"".format(file.name))
+            cancelled = True
 
         except BaseException as ex:
             self.num_issues += 1
             self.log.exception(
                 "Failed while working on \"{}\"".format(file.name), exc_info=ex)
+            self.journal.fail(file_unit, str(ex))
+            failure = ex
 
         finally:
             try:
                 if document is not None:
-                    document.close(False)
+                    with self._phase("document.close"):
+                        self.document_pool.release(document, file.versionId)
             except BaseException as ex:
                 self.num_issues += 1
                 self.log.exception(
                     "Failed to close \"{}\"".format(file.name), exc_info=ex)
+            file_bytes = self.profiler.file_bytes
+            seconds = self.profiler.end_file()
+            self.file_unit = None
+            self.watchdog.file = None
+            if not cancelled:
+                if seconds is not None:
+                    # history for the scheduler estimates of the next runs
+                    self.manifest.record_timing(file.id, seconds, file_bytes)
+                self._judge_file(file, failure, seconds)
+
+        if not cancelled:
+            self.file_exported_count += 1
+
+    def _judge_file(self, file, failure, seconds):
+        if isinstance(failure, ExportBudgetExceeded):
+            self._quarantine(file, str(failure), seconds)
+        elif failure is not None:
+            if self.manifest.record_failure(file.id, str(failure)) >= quarantine_after_failures:
+                self._quarantine(file, "failed {} runs in a row, last with: {}".format(
+                    quarantine_after_failures, failure), seconds)
+        elif self.file_overruns:
+            self._quarantine(file, "; ".join(self.file_overruns), seconds)
+        else:
+            self.manifest.clear_failures(file.id)
+            if file.id in self.quarantined:
+                self.log.info("\"{}\" exported fine, released from quarantine".format(file.name))
+                self.manifest.release(file.id)
+                del self.quarantined[file.id]
+
+    def _quarantine(self, file, reason, seconds=None):
+        # a file failing again keeps its quarantine with the latest reason, it isn't quarantined anew
+        if file.id in self.quarantined:
+            self.log.warning("Still quarantined \"{}\": {}".format(file.name, reason))
+        else:
+            self.log.warning("Quarantined \"{}\": {}".format(file.name, reason))
+            self.file_quarantined_count += 1
+        self.manifest.quarantine(file.id, file.versionId, file.name, reason, seconds)
+        self.quarantined[file.id] = (file.name, reason)
+
+    def _check_file_budget(self):
+        if file_time_budget > 0 and self.file_started is not None:
+            seconds = time.time() - self.file_started
+            if seconds > file_time_budget:
+                raise ExportBudgetExceeded("export took {:.0f}s, over the file budget of {}s".format(
+                    seconds, file_time_budget))
+
+    @contextmanager
+    def _phase(self, name, output_path=None):
+        budget = component_time_budget if name in component_phases else file_time_budget
+        started = time.time()
+        with self.profiler.phase(name, output_path), self.watchdog.watch(name, budget):
+            yield
+
+        seconds = time.time() - started
+        if budget > 0 and seconds > budget:
+            self.file_overruns.append("{} of \"{}\" took {:.0f}s, over its budget of {}s".format(
+                name, self.profiler.component or "", seconds, budget))
+
+    def _export_paths(self, file, file_folder_path):
+        file_export_path = os.path.join(file_folder_path, self._name(
+            file.name)) + " v" + str(file.versionNumber)
+        # fix for names with dots. Fusion trying to interpretate symbols after last dot as extensoin
+        file_export_path = file_export_path + ".f3d"
+
+        # only for check. can't pass into Fusion. Not self._name(file.name)
+        assembly_export_path = os.path.join(
+            file_folder_path, file.name) + ".f3z"
+        zip_acrhive_path = file_export_path + "_files" + \
+            archive_extension(self.archive_format)
+        return file_export_path, assembly_export_path, zip_acrhive_path
+
+    def _journal_skip(self, file):
+        if self.project_unit is not None:
+            self.journal.skip("file", file.id, self.project_unit, file.versionId)
+
+    def _record_manifest(self, file, file_folder_path, is_assembly, file_export_path, assembly_export_path, zip_acrhive_path, hash_artifacts=True,
+                         ignored_paths=None):
+        artifacts = {
+            "f3d": file_export_path,
+            "png": file_export_path + ".png",
+            "archive": zip_acrhive_path,
+        }
+        if assembly_export_path is not None:
+            artifacts["f3z"] = assembly_export_path
+
+        # cloud f3z export could still be in progress. Such file is probed again next time
+        for path in artifacts.values():
+            if not os.path.exists(path):
+                return
 
-        self.file_exported_count += 1
+        # hashed while archived, no need to read the archive again
+        digests = {"archive": self.archive_pipeline.digests.pop(zip_acrhive_path, None)}
+        if self.blob_store is not None and hash_artifacts:
+            for kind, path in artifacts.items():
+                digests[kind] = self.blob_store.store(path, digests.get(kind))
 
-    def _write_component(self, component_base_path, component: adsk.fusion.Component):
+        self.manifest.record(file.id, file.versionId, file.versionNumber,
+                             file_folder_path, is_assembly, artifacts, hash_artifacts, digests, ignored_paths)
+
+    def _write_component(self, component_base_path, component: adsk.fusion.Component, owner_version_id):
         # design = component.parentDesign
 
         output_path = os.path.join(
@@ -401,18 +1568,31 @@ class FusionFileExport(object):
             self.log.error("Path is too long. Skip \"{}\"".format(output_path))
             return
 
+        # same component under the same parent. Everything is already written
+        component_key = ComponentCache.key(owner_version_id, component.id)
+        if (component_key, output_path) in self.written_components:
+            return component_key
+        self.written_components.add((component_key, output_path))
+
         output_path = self._take(output_path)
+        self.profiler.component = component.name
+        if self.file_unit is not None:
+            self.journal.mark("component", self.profiler.component, self.file_unit)
 
-        self.log.info("Writing component \"{}\" to \"{}\"".format(
+        self.log.artifact("Writing component \"{}\" to \"{}\"".format(
             component.name, output_path))
 
+        self._check_file_budget()
+        self.ui_pump.checkpoint()
+        component_started = time.time()
+        meshes = []
         try:
             if self.export_step:
-                self._write_step(output_path, component)
+                self._write_step(output_path, component, component_key)
             if self.export_stl:
-                self._write_stl(output_path, component)
+                meshes = self._write_stl(output_path, component, component_key)
             if self.export_iges:
-                self._write_iges(output_path, component)
+                self._write_iges(output_path, component, component_key)
         except Exception as ex:
             self.num_issues += 1
             self.log.exception("Failed " + output_path, exc_info=ex)
@@ -420,148 +1600,320 @@ class FusionFileExport(object):
         sketches = component.sketches
         for sketch_index in range(sketches.count):
             sketch = sketches.item(sketch_index)
-            self._write_dxf(os.path.join(output_path, sketch.name), sketch)
+            self.ui_pump.checkpoint()
+            self._write_dxf(os.path.join(output_path, sketch.name), sketch, component_key)
+
+        seconds = time.time() - component_started
+        if component_time_budget > 0 and seconds > component_time_budget:
+            self.file_overruns.append("component \"{}\" took {:.0f}s, over its budget of {}s".format(
+                component.name, seconds, component_time_budget))
 
+        is_merging_stl = self.export_stl and self.stl_mode != "bodies"
+        occurrence_meshes = []
         occurrences = component.occurrences
         for occurrence_index in range(occurrences.count):
             occurrence = occurrences.item(occurrence_index)
             sub_component = occurrence.component
-            sub_path = self._take(component_base_path,
-                                  self._name(component.name))
-            self._write_component(sub_path, sub_component)
 
-    def _write_step(self, output_path, component: adsk.fusion.Component):
-        file_path = output_path + ".stp"
+            # components of referenced designs are shared across documents
+            sub_owner_version_id = owner_version_id
+            if occurrence.isReferencedComponent:
+                reference = occurrence.documentReference
+                if reference is not None and reference.dataFile is not None:
+                    sub_owner_version_id = reference.dataFile.versionId
 
-        if self.is_ignoring_file(file_path):
-            self.log.info(
-                "File \"{}\" found in exportignore.txt".format(file_path))
-            return
-
-        if os.path.exists(file_path):
-            self.log.info("Step file \"{}\" already exists".format(file_path))
-            return
+            sub_component_key = self._write_component(output_path, sub_component, sub_owner_version_id)
+            if is_merging_stl and sub_component_key is not None:
+                occurrence_meshes.append((sub_component_key, occurrence.transform2.asArray()))
 
-        self.log.info("Writing step file \"{}\"".format(file_path))
-        export_manager = component.parentDesign.exportManager
-
-        options = export_manager.createSTEPExportOptions(
-            output_path, component)
-        export_manager.execute(options)
+        # after the occurrences, their stl files are the parts of this one
+        if is_merging_stl:
+            try:
+                self._write_stl_component(output_path, component_key, meshes, occurrence_meshes)
+            except Exception as ex:
+                self.num_issues += 1
+                self.log.exception("Failed " + output_path, exc_info=ex)
 
-        self.check_exported_file(file_path)
+        return component_key
 
-    def _write_stl(self, output_path, component: adsk.fusion.Component):
-        file_path = output_path + ".stl"
+    def _write_step(self, output_path, component: adsk.fusion.Component, component_key=None):
+        file_path = output_path + ".stp"
 
         if self.is_ignoring_file(file_path):
-            self.log.info(
+            self.log.artifact(
                 "File \"{}\" found in exportignore.txt".format(file_path))
             return
 
-        if os.path.exists(file_path):
-            self.log.info("Stl file \"{}\" already exists".format(file_path))
+        if self._is_written(file_path):
+            self.log.artifact("Step file \"{}\" already exists".format(file_path))
+            return
+
+        cache_key = ComponentCache.key(component_key, ".stp") if component_key else None
+        if self._fetch_cached(cache_key, file_path):
+            self.log.artifact("Step file \"{}\" taken from cache".format(file_path))
+            self._archive(file_path)
             return
 
-        self.log.info("Writing stl file \"{}\"".format(file_path))
+        self.log.artifact("Writing step file \"{}\"".format(file_path))
         export_manager = component.parentDesign.exportManager
 
-        try:
-            options = export_manager.createSTLExportOptions(
-                component, output_path)
+        with self._phase("step", file_path):
+            options = export_manager.createSTEPExportOptions(
+                output_path, component)
             export_manager.execute(options)
-        except BaseException as ex:
-            self.log.exception(
-                "Failed writing stl file \"{}\"".format(file_path), exc_info=ex)
 
-            if component.occurrences.count + component.bRepBodies.count + component.meshBodies.count > 0:
-                self.num_issues += 1
+        if self.check_exported_file(file_path):
+            self.component_cache.store(cache_key, file_path)
+            self._archive(file_path)
 
-        self.check_exported_file(file_path)
+    def _write_stl(self, output_path, component: adsk.fusion.Component, component_key=None):
+        # every body is tessellated once, the stl of the component is put together from the meshes later
+        if self.stl_mode == "merged" and component_key in self.component_meshes:
+            return []
+        if self.stl_mode == "merged" and self._fetch_mesh(ComponentCache.key(component_key, "merged stl")):
+            self.component_meshes[component_key] = self._mesh_path(ComponentCache.key(component_key, "merged stl"))
+            return []
 
         bRepBodies = component.bRepBodies
         meshBodies = component.meshBodies
 
+        meshes = []
         if (bRepBodies.count + meshBodies.count) > 0:
-            self._take(output_path)
+            if self.stl_mode != "merged":
+                self._take(output_path)
             for index in range(bRepBodies.count):
                 body = bRepBodies.item(index)
-                self._write_stl_body(os.path.join(
-                    output_path, body.name), body)
+                meshes.append(self._write_stl_body(os.path.join(
+                    output_path, body.name), body,
+                    ComponentCache.key(component_key, "body", body.name) if component_key else None))
 
             for index in range(meshBodies.count):
                 body = meshBodies.item(index)
-                self._write_stl_body(os.path.join(
-                    output_path, body.name), body)
+                meshes.append(self._write_stl_body(os.path.join(
+                    output_path, body.name), body,
+                    ComponentCache.key(component_key, "mesh", body.name) if component_key else None))
+
+        return [mesh_path for mesh_path in meshes if mesh_path is not None]
 
-    def _write_stl_body(self, output_path, body):
+    def _write_stl_body(self, output_path, body, cache_key=None):
         file_path = output_path + ".stl"
 
         if self.is_ignoring_file(file_path):
-            self.log.info(
+            self.log.artifact(
                 "File \"{}\" found in exportignore.txt".format(file_path))
-            return
+            return None
 
-        if os.path.exists(file_path):
-            self.log.info(
+        is_file_needed = self.stl_mode != "merged"
+        if is_file_needed and self._is_written(file_path):
+            self.log.artifact(
                 "Stl body file \"{}\" already exists".format(file_path))
+            if self.stl_mode == "bodies":
+                return None
+            is_file_needed = False
+
+        mesh_path = self._mesh_path(cache_key)
+        if self._fetch_mesh(cache_key):
+            self.log.artifact(
+                "Stl body \"{}\" taken from cache".format(file_path))
+        else:
+            self.log.artifact("Writing stl body file \"{}\"".format(file_path))
+            export_manager = body.parentComponent.parentDesign.exportManager
+
+            try:
+                with self._phase("stl body", file_path):
+                    options = export_manager.createSTLExportOptions(body, mesh_path)
+                    export_manager.execute(options)
+            except BaseException as ex:
+                # Probably an empty model, ignore it
+                self.num_issues += 1
+                self.log.exception(
+                    "Probably an empty model \"{}\"".format(file_path), exc_info=ex)
+
+            if not self.check_exported_file(mesh_path):
+                return None
+            self.component_cache.store(cache_key, mesh_path)
+            if cache_key is not None:
+                self.mesh_paths[cache_key] = mesh_path
+            if self.stl_units_per_cm is None:
+                self._calibrate_stl_units(body, mesh_path)
+
+        if is_file_needed:
+            self._place_mesh(mesh_path, file_path)
+        return mesh_path
+
+    def _write_stl_component(self, output_path, component_key, meshes, occurrence_meshes):
+        # the bodies of the component and its occurrences, each moved into place
+        file_path = output_path + ".stl"
+
+        if self.is_ignoring_file(file_path):
+            self.log.artifact(
+                "File \"{}\" found in exportignore.txt".format(file_path))
             return
 
-        self.log.info("Writing stl body file \"{}\"".format(file_path))
-        export_manager = body.parentComponent.parentDesign.exportManager
+        cache_key = ComponentCache.key(component_key, "merged stl")
+        mesh_path = self._mesh_path(cache_key)
+        if component_key in self.component_meshes:
+            mesh_path = self.component_meshes[component_key]
+        elif self._fetch_mesh(cache_key):
+            self.log.artifact("Stl file \"{}\" taken from cache".format(file_path))
+        else:
+            parts = [(body_mesh_path, None) for body_mesh_path in meshes]
+            parts.extend((self.component_meshes[sub_key], matrix) for sub_key, matrix in occurrence_meshes
+                         if sub_key in self.component_meshes)
+            if not parts:
+                return
 
-        try:
-            options = export_manager.createSTLExportOptions(body, file_path)
-            export_manager.execute(options)
-        except BaseException as ex:
-            # Probably an empty model, ignore it
-            self.num_issues += 1
-            self.log.exception(
-                "Probably an empty model \"{}\"".format(file_path), exc_info=ex)
-            pass
+            self.log.artifact("Writing stl file \"{}\" of {} parts".format(file_path, len(parts)))
+            with self._phase("stl merge", file_path):
+                self.stl_assembler.merge(mesh_path, parts, self.stl_units_per_cm or stl_units_per_cm)
+            self.output_tree.added(mesh_path)
+            self.component_cache.store(cache_key, mesh_path)
+            self.mesh_paths[cache_key] = mesh_path
+        self.component_meshes[component_key] = mesh_path
 
-        self.check_exported_file(file_path)
+        if self._is_written(file_path):
+            self.log.artifact("Stl file \"{}\" already exists".format(file_path))
+            return
+        self._place_mesh(mesh_path, file_path)
+
+    def _mesh_path(self, cache_key):
+        if cache_key in self.mesh_paths:
+            return self.mesh_paths[cache_key]
+        if cache_key is None:
+            self.mesh_count += 1
+        folder_path = os.path.join(self.output_path, self.temp_foler_name, self.meshes_folder_name)
+        self.output_tree.makedirs(folder_path)
+        return os.path.join(folder_path, "{}.stl".format(cache_key or "mesh{}".format(self.mesh_count)))
+
+    def _fetch_mesh(self, cache_key):
+        # tessellated already for this file, or by an earlier file
+        if cache_key is None:
+            return False
+        if cache_key in self.mesh_paths:
+            return True
+        mesh_path = self._mesh_path(cache_key)
+        if not self._fetch_cached(cache_key, mesh_path):
+            return False
+        self.mesh_paths[cache_key] = mesh_path
+        return True
 
-    def _write_iges(self, output_path, component: adsk.fusion.Component):
+    def _place_mesh(self, mesh_path, file_path):
+        # hard linked, the archive takes the file away and the mesh stays for the stl of the component
+        try:
+            link_or_copy(mesh_path, file_path)
+        except FileExistsError:
+            os.remove(file_path)
+            link_or_copy(mesh_path, file_path)
+        self.output_tree.added(file_path)
+        self._archive(file_path)
+
+    def _calibrate_stl_units(self, body, mesh_path):
+        # the api works in cm, Fusion writes stl files in a length unit of its own
+        try:
+            box = body.boundingBox
+            size_cm = max(box.maxPoint.x - box.minPoint.x, box.maxPoint.y - box.minPoint.y,
+                          box.maxPoint.z - box.minPoint.z)
+            self.stl_units_per_cm = self.stl_assembler.units_per_cm(mesh_path, size_cm)
+        except (AttributeError, ValueError, OSError) as ex:
+            self.log.artifact("Couldn't find out the stl length unit: {}".format(ex))
+
+    def _clear_meshes(self):
+        self.mesh_paths.clear()
+        self.component_meshes.clear()
+        self.stl_units_per_cm = None
+        folder_path = os.path.join(self.output_path, self.temp_foler_name, self.meshes_folder_name)
+        shutil.rmtree(folder_path, ignore_errors=True)
+        self.output_tree.forget(folder_path)
+
+    def _write_iges(self, output_path, component: adsk.fusion.Component, component_key=None):
         file_path = output_path + ".igs"
 
         if self.is_ignoring_file(file_path):
-            self.log.info(
+            self.log.artifact(
                 "File \"{}\" found in exportignore.txt".format(file_path))
             return
 
-        if os.path.exists(file_path):
-            self.log.info("Iges file \"{}\" already exists".format(file_path))
+        if self._is_written(file_path):
+            self.log.artifact("Iges file \"{}\" already exists".format(file_path))
+            return
+
+        cache_key = ComponentCache.key(component_key, ".igs") if component_key else None
+        if self._fetch_cached(cache_key, file_path):
+            self.log.artifact("Iges file \"{}\" taken from cache".format(file_path))
+            self._archive(file_path)
             return
 
-        self.log.info("Writing iges file \"{}\"".format(file_path))
+        self.log.artifact("Writing iges file \"{}\"".format(file_path))
 
         export_manager = component.parentDesign.exportManager
 
-        options = export_manager.createIGESExportOptions(file_path, component)
-        export_manager.execute(options)
-        self.check_exported_file(file_path)
+        with self._phase("iges", file_path):
+            options = export_manager.createIGESExportOptions(file_path, component)
+            export_manager.execute(options)
+        if self.check_exported_file(file_path):
+            self.component_cache.store(cache_key, file_path)
+            self._archive(file_path)
 
-    def _write_dxf(self, output_path, sketch: adsk.fusion.Sketch):
+    def _write_dxf(self, output_path, sketch: adsk.fusion.Sketch, component_key=None):
         file_path = output_path + ".dxf"
 
         if self.is_ignoring_file(file_path):
-            self.log.info(
+            self.log.artifact(
                 "File \"{}\" found in exportignore.txt".format(file_path))
             return
 
-        if os.path.exists(file_path):
-            self.log.info(
+        if self._is_written(file_path):
+            self.log.artifact(
                 "DXF sketch file \"{}\" already exists".format(file_path))
             return
 
-        self.log.info("Writing dxf sketch file \"{}\"".format(file_path))
+        cache_key = ComponentCache.key(component_key, "sketch", os.path.basename(output_path)) if component_key else None
+        if self._fetch_cached(cache_key, file_path):
+            self.log.artifact(
+                "DXF sketch file \"{}\" taken from cache".format(file_path))
+            self._archive(file_path)
+            return
+
+        self.log.artifact("Writing dxf sketch file \"{}\"".format(file_path))
 
-        if not sketch.saveAsDXF(file_path):
+        with self._phase("dxf", file_path):
+            is_saved = sketch.saveAsDXF(file_path)
+        if not is_saved:
             self.log.error("Could not saveAsDXF \"{}\"".format(
                 sketch.errorOrWarningMessage))
 
-        self.check_exported_file(file_path)
+        if self.check_exported_file(file_path):
+            self.component_cache.store(cache_key, file_path)
+            self._archive(file_path)
+
+    def _is_written(self, file_path):
+        if self.archive_stream is not None and file_path in self.archive_stream:
+            return True
+
+        return self.output_tree.exists(file_path)
+
+    def _fetch_cached(self, cache_key, file_path):
+        if not self.component_cache.fetch(cache_key, file_path):
+            return False
+
+        self.output_tree.added(file_path)
+        return True
+
+    def _archive(self, file_path):
+        if self.archive_stream is not None:
+            self.archive_stream.add(file_path)
+
+    def _part_path(self, file_path):
+        # written under a temp name and renamed into place, a crash never leaves a half written file.
+        # Extension is kept, Fusion appends its own otherwise
+        name, extension = os.path.splitext(file_path)
+        return name + ".part" + extension
+
+    def _move_part(self, file_path):
+        part_path = self._part_path(file_path)
+        if os.path.exists(part_path):
+            os.replace(part_path, file_path)
+            self.output_tree.added(file_path)
 
     def _take(self, *path):
         out_path = os.path.join(*path)
@@ -570,31 +1922,26 @@ class FusionFileExport(object):
             self.num_issues += 1
             self.log.error("Path is too long \"{}\"".format(out_path))
 
-        os.makedirs(out_path, exist_ok=True)
+        self.output_tree.makedirs(out_path)
         return out_path
 
     def _name(self, name):
-        name = re.sub('[^a-zA-Z0-9а-яА-ЯЁё_ \.,\[\]+-]', '_', name).strip()
-
-        if name.lower().endswith('.stp') or name.lower().endswith('.stl') or name.lower().endswith('.igs'):
-            name = name[0: -4] + "_" + name[-3:]
-
-        if name.lower().endswith('.step'):
-            name = name[0: -5] + "_" + name[-4:]
-
-        return name
+        return sanitize_name(name)
 
     def is_ignoring_file(self, file_path):
-        for line in self.exportignore.splitlines():
-            if line.strip() and line.strip() in file_path:
-                return True
-
-        return False
+        if not self.exportignore_rules.match(file_path):
+            return False
+        # kept with the exported version, a later change of the rules finds it missing the file
+        if self.file_unit is not None:
+            self.ignored_paths.append(file_path)
+        return True
 
     def check_exported_file(self, file_path):
+        # written by Fusion, the tree doesn't know about it yet
         if not os.path.exists(file_path):
             self.log.error("Exported file \"{}\" not found".format(file_path))
             self.num_issues += 1
             return False
 
+        self.output_tree.added(file_path)
         return True
@@ -0,0 +1,253 @@
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+
+catalog_file_name = "catalog.db"
+design_extensions = ("f3d", "f3z")
+
+
+class HubCatalog(object):
+    """Hubs, projects, folders and data files of the cloud in a local SQLite database.
+
+    A refresh walks the folder listings without opening any document. Files
+    whose version id didn't change since the last refresh are only marked as
+    seen, everything else about them is read again. Rows not seen by a
+    refresh that went through a whole project are gone from the cloud and
+    dropped.
+
+    Sizes are the bytes of the latest exported version in the manifest, the
+    API doesn't tell the size of a cloud file.
+    """
+
+    def __init__(self, catalog_path):
+        self.catalog_path = catalog_path
+        self.connection = sqlite3.connect(catalog_path)
+        self.refreshed_at = None
+
+        with self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS hubs (
+                    hub_id TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    refreshed_at REAL
+                );
+                CREATE TABLE IF NOT EXISTS projects (
+                    project_id TEXT PRIMARY KEY,
+                    hub_id TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    root_folder_id TEXT NOT NULL,
+                    seen_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS projects_hub ON projects (hub_id);
+                CREATE TABLE IF NOT EXISTS folders (
+                    folder_id TEXT PRIMARY KEY,
+                    project_id TEXT NOT NULL,
+                    parent_id TEXT,
+                    name TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    seen_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS folders_project ON folders (project_id);
+                CREATE TABLE IF NOT EXISTS files (
+                    file_id TEXT PRIMARY KEY,
+                    project_id TEXT NOT NULL,
+                    folder_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    name TEXT NOT NULL,
+                    extension TEXT NOT NULL,
+                    version_id TEXT NOT NULL,
+                    version_number INTEGER NOT NULL,
+                    date_created INTEGER,
+                    date_modified INTEGER,
+                    is_assembly INTEGER NOT NULL,
+                    size INTEGER,
+                    seen_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS files_project ON files (project_id, position);
+                CREATE INDEX IF NOT EXISTS files_version ON files (version_id);
+                CREATE INDEX IF NOT EXISTS files_modified ON files (date_modified);
+                CREATE TABLE IF NOT EXISTS file_references (
+                    file_id TEXT NOT NULL,
+                    child_id TEXT NOT NULL,
+                    PRIMARY KEY (file_id, child_id)
+                );
+                CREATE INDEX IF NOT EXISTS file_references_child ON file_references (child_id);
+            """)
+
+    def close(self):
+        self.connection.close()
+
+    def begin(self):
+        # rows of this refresh are seen at its start, anything seen before it is stale once a project is through
+        self.refreshed_at = time.time()
+        return self.refreshed_at
+
+    def record_hub(self, hub_id, name):
+        with self.connection:
+            self.connection.execute("INSERT OR IGNORE INTO hubs (hub_id, name) VALUES (?, ?)", (hub_id, name))
+            self.connection.execute("UPDATE hubs SET name = ? WHERE hub_id = ?", (name, hub_id))
+
+    def record_project(self, project_id, hub_id, name, root_folder_id):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO projects (project_id, hub_id, name, root_folder_id, seen_at) VALUES (?, ?, ?, ?, ?)",
+                (project_id, hub_id, name, root_folder_id, self.refreshed_at))
+
+    def record_folder(self, folder_id, project_id, parent_id, name, path):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO folders (folder_id, project_id, parent_id, name, path, seen_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (folder_id, project_id, parent_id, name, path, self.refreshed_at))
+
+    def version_ids(self, file_ids, chunk_size=500):
+        # file id -> version id of the last refresh
+        version_ids = {}
+        for index in range(0, len(file_ids), chunk_size):
+            chunk = file_ids[index:index + chunk_size]
+            version_ids.update(self.connection.execute(
+                "SELECT file_id, version_id FROM files WHERE file_id IN ({})".format(",".join("?" * len(chunk))), chunk))
+        return version_ids
+
+    def touch_files(self, rows):
+        # (project id, folder id, position, size, file id) of files with an unchanged version
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE files SET project_id = ?, folder_id = ?, position = ?, size = ?, seen_at = ? WHERE file_id = ?",
+                [row[:4] + (self.refreshed_at,) + row[4:] for row in rows])
+
+    def record_files(self, files):
+        # dicts of the files table columns and "child_ids"
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO files (file_id, project_id, folder_id, position, name, extension, version_id, "
+                "version_number, date_created, date_modified, is_assembly, size, seen_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(file["file_id"], file["project_id"], file["folder_id"], file["position"], file["name"],
+                  file["extension"], file["version_id"], file["version_number"], file["date_created"],
+                  file["date_modified"], int(file["is_assembly"]), file["size"], self.refreshed_at)
+                 for file in files])
+            self.connection.executemany(
+                "DELETE FROM file_references WHERE file_id = ?", [(file["file_id"],) for file in files])
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO file_references (file_id, child_id) VALUES (?, ?)",
+                [(file["file_id"], child_id) for file in files for child_id in file["child_ids"]])
+
+    def finish_project(self, project_id):
+        # the whole project was listed, what wasn't seen is deleted or moved out of it
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM file_references WHERE file_id IN "
+                "(SELECT file_id FROM files WHERE project_id = ? AND seen_at < ?)", (project_id, self.refreshed_at))
+            removed = self.connection.execute(
+                "DELETE FROM files WHERE project_id = ? AND seen_at < ?", (project_id, self.refreshed_at)).rowcount
+            self.connection.execute(
+                "DELETE FROM folders WHERE project_id = ? AND seen_at < ?", (project_id, self.refreshed_at))
+        return removed
+
+    def finish_hub(self, hub_id):
+        with self.connection:
+            stale = [row[0] for row in self.connection.execute(
+                "SELECT project_id FROM projects WHERE hub_id = ? AND seen_at < ?", (hub_id, self.refreshed_at))]
+            for project_id in stale:
+                self.connection.execute(
+                    "DELETE FROM file_references WHERE file_id IN (SELECT file_id FROM files WHERE project_id = ?)",
+                    (project_id,))
+                self.connection.execute("DELETE FROM files WHERE project_id = ?", (project_id,))
+                self.connection.execute("DELETE FROM folders WHERE project_id = ?", (project_id,))
+                self.connection.execute("DELETE FROM projects WHERE project_id = ?", (project_id,))
+            self.connection.execute(
+                "UPDATE hubs SET refreshed_at = ? WHERE hub_id = ?", (self.refreshed_at, hub_id))
+        return len(stale)
+
+    def refreshed(self, hub_id):
+        row = self.connection.execute("SELECT refreshed_at FROM hubs WHERE hub_id = ?", (hub_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def assembly_flag(self, version_id):
+        row = self.connection.execute(
+            "SELECT is_assembly FROM files WHERE version_id = ?", (version_id,)).fetchone()
+        if row is None:
+            return None
+
+        return bool(row[0])
+
+    def child_references(self, version_id):
+        # ids of data files referenced by the catalogued version, None for other versions
+        row = self.connection.execute(
+            "SELECT file_id FROM files WHERE version_id = ?", (version_id,)).fetchone()
+        if row is None:
+            return None
+
+        return [child[0] for child in self.connection.execute(
+            "SELECT child_id FROM file_references WHERE file_id = ? ORDER BY rowid", (row[0],))]
+
+    def folder_paths(self, output_path, hub_id):
+        # folder id -> output folder, like the export lays them out
+        return dict((folder_id, os.path.join(output_path, path)) for folder_id, path in self.connection.execute(
+            "SELECT folders.folder_id, folders.path FROM folders "
+            "JOIN projects ON projects.project_id = folders.project_id WHERE projects.hub_id = ?", (hub_id,)))
+
+    def designs(self, hub_id, project_ids=None):
+        # (file id, version number) of the designs in listing order, project by project
+        rows = self.connection.execute(
+            "SELECT files.project_id, files.file_id, files.version_number FROM files "
+            "JOIN projects ON projects.project_id = files.project_id "
+            "WHERE projects.hub_id = ? AND files.extension IN ({}) "
+            "ORDER BY projects.rowid, files.position".format(",".join("?" * len(design_extensions))),
+            (hub_id,) + design_extensions)
+        project_ids = set(project_ids) if project_ids is not None else None
+        return [(file_id, version_number) for project_id, file_id, version_number in rows
+                if project_ids is None or project_id in project_ids]
+
+    # questions about the hub, answered without the cloud
+
+    def parents(self, file_id):
+        # designs whose latest version references the file
+        return self._files(
+            "WHERE files.file_id IN (SELECT file_id FROM file_references WHERE child_id = ?)", (file_id,))
+
+    def children(self, file_id):
+        return self._files(
+            "WHERE files.file_id IN (SELECT child_id FROM file_references WHERE file_id = ?)", (file_id,))
+
+    def changed_since(self, timestamp):
+        # latest first
+        return self._files("WHERE files.date_modified >= ? ORDER BY files.date_modified DESC", (timestamp,))
+
+    def find(self, pattern):
+        # like in SQL, "%bracket%"
+        return self._files("WHERE files.name LIKE ? ORDER BY files.name", (pattern,))
+
+    def project_versions(self, hub_id=None):
+        # project name -> (files, versions), the latest version number counts the versions of a file
+        return OrderedDict((name, (files, versions)) for name, files, versions in self.connection.execute(
+            "SELECT projects.name, COUNT(files.file_id), COALESCE(SUM(files.version_number), 0) FROM projects "
+            "LEFT JOIN files ON files.project_id = projects.project_id "
+            "WHERE ? IS NULL OR projects.hub_id = ? GROUP BY projects.project_id ORDER BY projects.rowid",
+            (hub_id, hub_id)))
+
+    def counts(self):
+        counts = OrderedDict()
+        for table in ("hubs", "projects", "folders", "files", "file_references"):
+            counts[table] = self.connection.execute("SELECT COUNT(*) FROM {}".format(table)).fetchone()[0]
+        counts["versions"] = self.connection.execute(
+            "SELECT COALESCE(SUM(version_number), 0) FROM files").fetchone()[0]
+        counts["assemblies"] = self.connection.execute(
+            "SELECT COUNT(*) FROM files WHERE is_assembly").fetchone()[0]
+        return counts
+
+    def summary(self):
+        counts = self.counts()
+        return "{} projects, {} folders, {} files with {} versions, {} assemblies with {} references".format(
+            counts["projects"], counts["folders"], counts["files"], counts["versions"], counts["assemblies"],
+            counts["file_references"])
+
+    def _files(self, condition, parameters):
+        columns = ("file_id", "name", "extension", "version_number", "date_modified", "is_assembly", "size",
+                   "project", "path")
+        return [OrderedDict(zip(columns, row)) for row in self.connection.execute(
+            "SELECT files.file_id, files.name, files.extension, files.version_number, files.date_modified, "
+            "files.is_assembly, files.size, projects.name, folders.path FROM files "
+            "LEFT JOIN projects ON projects.project_id = files.project_id "
+            "LEFT JOIN folders ON folders.folder_id = files.folder_id " + condition, parameters)]
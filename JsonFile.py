@@ -0,0 +1,15 @@
+import json
+import os
+
+
+def write_json(path, values, indent=1):
+    # written under a temp name and swapped in, readers see the old file or the whole new one
+    part_path = path + ".part"
+    try:
+        with open(part_path, 'w', encoding='utf-8') as f:
+            json.dump(values, f, ensure_ascii=False, indent=indent)
+        os.replace(part_path, path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
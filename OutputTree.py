@@ -0,0 +1,113 @@
+import os
+
+
+class OutputTree(object):
+    """Listings of output folders, so the same paths aren't probed again and again.
+
+    On a network share every exists() and makedirs() is a round trip. A folder
+    is listed once with a single scandir, folders made and files written
+    through the tree are added to the listings, so later checks under the
+    same folder cost nothing. Files written by Fusion itself are not known
+    until they are added. Folders removed behind its back have to be
+    forgotten.
+
+    Only the main thread uses it. With enabled False every call goes to the
+    file system.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.listings = {}  # folder -> set of entry names, None when the folder doesn't exist
+        self.children = {}  # folder -> listed folders in it, a subtree is forgotten without a scan of all listings
+        self.scans = 0
+
+    def exists(self, path):
+        if not self.enabled:
+            return os.path.exists(path)
+
+        folder, name = os.path.split(self._key(path))
+        listing = self._listing(folder)
+        return listing is not None and name in listing
+
+    def makedirs(self, path):
+        if not self.enabled:
+            os.makedirs(path, exist_ok=True)
+            return
+
+        key = self._key(path)
+        if self.listings.get(key) is not None:
+            return
+
+        folder, name = os.path.split(key)
+        listing = self._listing(folder)
+        if listing is not None and name in listing:
+            return
+
+        if listing is None and folder != key:
+            self.makedirs(folder)
+
+        try:
+            os.mkdir(path)
+        except FileExistsError:
+            # made by somebody else since the listing
+            self.listings.pop(key, None)
+        else:
+            self._store(key, set())
+        self.added(path)
+
+    def added(self, path):
+        # a file or folder was written
+        if not self.enabled:
+            return
+
+        folder, name = os.path.split(self._key(path))
+        listing = self.listings.get(folder)
+        if listing is not None:
+            listing.add(name)
+        else:
+            self.listings.pop(folder, None)
+
+    def forget(self, path):
+        # the folder is changed by somebody else, its listings and its parent's are read again when needed
+        if not self.enabled:
+            return
+
+        key = self._key(path)
+        parent = os.path.dirname(key)
+        if parent in self.children:
+            self.children[parent].discard(key)
+
+        folders = [key]
+        while folders:
+            folder = folders.pop()
+            self.listings.pop(folder, None)
+            folders.extend(self.children.pop(folder, ()))
+        self.listings.pop(parent, None)
+
+    def clear(self):
+        self.listings.clear()
+        self.children.clear()
+
+    def _listing(self, folder):
+        if folder in self.listings:
+            return self.listings[folder]
+
+        self.scans += 1
+        try:
+            with os.scandir(folder) as entries:
+                listing = set(os.path.normcase(entry.name) for entry in entries)
+        except (FileNotFoundError, NotADirectoryError):
+            listing = None
+
+        self._store(folder, listing)
+        return listing
+
+    def _store(self, folder, listing):
+        self.listings[folder] = listing
+        parent = os.path.dirname(folder)
+        if parent != folder:
+            self.children.setdefault(parent, set()).add(folder)
+
+    def _key(self, path):
+        # case insensitive on Windows
+        return os.path.normcase(os.path.normpath(path))
@@ -0,0 +1,67 @@
+import time
+from collections import OrderedDict
+
+
+class WaitStats(object):
+    def __init__(self):
+        self.count = 0
+        self.timeouts = 0
+        self.total = 0.0
+        self.longest = 0.0
+        self.polls = 0
+
+
+class ReadinessWaiter(object):
+    """Polls a condition with exponential backoff instead of sleeping a fixed time.
+
+    The pump is called between polls, Fusion only updates its state while
+    events are processed. Time really spent waiting is kept per label.
+    """
+
+    def __init__(self, pump=None, clock=time.monotonic, sleep=time.sleep):
+        self.pump = pump
+        self.clock = clock
+        self.sleep = sleep
+        self.stats = OrderedDict()
+
+    def wait(self, label, condition, timeout, initial_delay=0.05, max_delay=1.0, factor=2.0):
+        stats = self.stats.setdefault(label, WaitStats())
+        started = self.clock()
+        delay = initial_delay
+        polls = 0
+
+        while True:
+            polls += 1
+            try:
+                is_ready = condition()
+            except Exception:
+                is_ready = False
+
+            elapsed = self.clock() - started
+            if is_ready or elapsed >= timeout:
+                break
+
+            self.sleep(min(delay, timeout - elapsed))
+            delay = min(delay * factor, max_delay)
+            if self.pump is not None:
+                self.pump()
+
+        stats.count += 1
+        stats.polls += polls
+        stats.total += elapsed
+        stats.longest = max(stats.longest, elapsed)
+        if not is_ready:
+            stats.timeouts += 1
+
+        return is_ready
+
+    @property
+    def total(self):
+        return sum(stats.total for stats in self.stats.values())
+
+    def summary(self):
+        lines = []
+        for label, stats in self.stats.items():
+            lines.append("{}: {} waits, {:.1f}s total, {:.2f}s longest, {} polls, {} timeouts".format(
+                label, stats.count, stats.total, stats.longest, stats.polls, stats.timeouts))
+        return "\n".join(lines)
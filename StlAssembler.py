@@ -0,0 +1,184 @@
+import math
+import os
+import shutil
+import struct
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# stl files written for a component: a file per body, one file of the whole component, or both
+stl_modes = ("both", "bodies", "merged")
+default_stl_mode = "both"
+
+# stl length units per cm, the unit of the API
+stl_units = {"mm": 10.0, "cm": 1.0, "m": 0.01, "in": 1 / 2.54, "ft": 1 / 30.48}
+
+header_size = 80
+record_size = 50
+record_format = struct.Struct('<12fH')
+record_dtype = [('values', '<f4', 12), ('attribute', '<u2')] if numpy is not None else None
+
+
+class StlAssembler(object):
+    """Puts binary stl files together into one, each moved by its occurrence transform.
+
+    Parts are streamed in chunks, so a component is never held in memory as
+    a whole. Parts without a transform are copied as they are, transformed
+    parts go through NumPy when it is installed and struct otherwise. ASCII
+    parts are read too, the result is always binary.
+    """
+
+    def __init__(self, chunk_triangles=65536):
+        self.chunk_triangles = chunk_triangles
+        self.triangles = 0
+        self.files = 0
+
+    def merge(self, target_path, parts, units_per_cm=10.0):
+        # parts are (stl path, Matrix3D.asArray() of the placement or None)
+        part_path = target_path + ".part"
+        count = 0
+        with open(part_path, 'wb') as target:
+            target.write(b"TehExport".ljust(header_size, b"\0"))
+            target.write(struct.pack('<I', 0))
+            for stl_path, matrix in parts:
+                count += self._append(target, stl_path, matrix, units_per_cm)
+            target.seek(header_size)
+            target.write(struct.pack('<I', count))
+        os.replace(part_path, target_path)
+
+        self.triangles += count
+        self.files += 1
+        return count
+
+    def units_per_cm(self, stl_path, size_cm):
+        # the unit Fusion wrote the stl in, from the size of the mesh against the size of the body
+        if size_cm <= 0:
+            return None
+        size = self.size(stl_path)
+        if size <= 0:
+            return None
+        ratio = size / size_cm
+        return min(stl_units.values(), key=lambda units: abs(math.log(ratio / units)))
+
+    def size(self, stl_path):
+        # longest side of the bounding box
+        low = [float("inf")] * 3
+        high = [float("-inf")] * 3
+        for chunk in self._chunks(stl_path):
+            if numpy is not None:
+                vertices = numpy.asarray(chunk, dtype='<f4').reshape(-1, 4, 3)[:, 1:].reshape(-1, 3)
+                chunk_low, chunk_high = vertices.min(axis=0), vertices.max(axis=0)
+            else:
+                vertices = [record[index:index + 3] for record in chunk for index in (3, 6, 9)]
+                chunk_low = [min(vertex[axis] for vertex in vertices) for axis in range(3)]
+                chunk_high = [max(vertex[axis] for vertex in vertices) for axis in range(3)]
+            for axis in range(3):
+                low[axis] = min(low[axis], float(chunk_low[axis]))
+                high[axis] = max(high[axis], float(chunk_high[axis]))
+        if low[0] > high[0]:
+            return 0.0
+        return max(high[axis] - low[axis] for axis in range(3))
+
+    def _append(self, target, stl_path, matrix, units_per_cm):
+        ascii_stl, count = self._inspect(stl_path)
+        if matrix is None and not ascii_stl:
+            with open(stl_path, 'rb') as f:
+                f.seek(header_size + 4)
+                shutil.copyfileobj(f, target, self.chunk_triangles * record_size)
+            return count
+
+        rotation, translation = self._placement(matrix, units_per_cm)
+        count = 0
+        for chunk in self._chunks(stl_path):
+            if numpy is not None:
+                # normals are turned, vertices turned and moved
+                records = numpy.asarray(chunk, dtype='<f8').reshape(-1, 4, 3)
+                if rotation is not None:
+                    records = records @ numpy.array(rotation, dtype='<f8').T
+                    records[:, 1:] += numpy.array(translation, dtype='<f8')
+                data = numpy.zeros(len(records), dtype=record_dtype)
+                data['values'] = records.reshape(-1, 12)
+                target.write(data.tobytes())
+            else:
+                for record in chunk:
+                    if rotation is not None:
+                        record = self._transform(record, rotation, translation)
+                    target.write(record_format.pack(*record[:12], 0))
+            count += len(chunk)
+        return count
+
+    def _inspect(self, stl_path):
+        size = os.path.getsize(stl_path)
+        with open(stl_path, 'rb') as f:
+            header = f.read(header_size + 4)
+        if len(header) < header_size + 4:
+            raise ValueError("\"{}\" is not an stl file".format(stl_path))
+
+        count = struct.unpack('<I', header[header_size:])[0]
+        if size == header_size + 4 + count * record_size:
+            return False, count
+        if header.lstrip().startswith(b"solid"):
+            return True, None
+        raise ValueError("\"{}\" is cut, {} triangles don't fit into {} bytes".format(stl_path, count, size))
+
+    def _chunks(self, stl_path):
+        # lists of (normal, vertex 1, vertex 2, vertex 3) as 12 floats
+        ascii_stl, count = self._inspect(stl_path)
+        if ascii_stl:
+            yield from self._ascii_chunks(stl_path)
+            return
+
+        with open(stl_path, 'rb') as f:
+            f.seek(header_size + 4)
+            while count > 0:
+                chunk_count = min(count, self.chunk_triangles)
+                data = f.read(chunk_count * record_size)
+                if numpy is not None:
+                    yield numpy.frombuffer(data, dtype=record_dtype)['values']
+                else:
+                    yield list(record_format.iter_unpack(data))
+                count -= chunk_count
+
+    def _ascii_chunks(self, stl_path):
+        chunk = []
+        record = []
+        with open(stl_path, encoding='ascii', errors='replace') as f:
+            for line in f:
+                words = line.split()
+                if not words:
+                    continue
+                if words[0] == "facet" and len(words) >= 5:
+                    record = [float(value) for value in words[2:5]]
+                elif words[0] == "vertex" and len(words) >= 4:
+                    record.extend(float(value) for value in words[1:4])
+                elif words[0] == "endfacet" and len(record) == 12:
+                    chunk.append(record)
+                    if len(chunk) >= self.chunk_triangles:
+                        yield chunk
+                        chunk = []
+        if chunk:
+            yield chunk
+
+    @staticmethod
+    def _placement(matrix, units_per_cm):
+        if matrix is None:
+            return None, None
+        # row major 4x4, the translation is in the last column and in cm
+        rotation = [matrix[0:3], matrix[4:7], matrix[8:11]]
+        translation = [matrix[3] * units_per_cm, matrix[7] * units_per_cm, matrix[11] * units_per_cm]
+        return rotation, translation
+
+    @staticmethod
+    def _transform(record, rotation, translation):
+        values = []
+        for index in range(4):
+            x, y, z = record[index * 3:index * 3 + 3]
+            for axis in range(3):
+                row = rotation[axis]
+                value = row[0] * x + row[1] * y + row[2] * z
+                if index > 0:
+                    value += translation[axis]
+                values.append(value)
+        return values
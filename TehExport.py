@@ -4,6 +4,14 @@ import adsk.core
 #from .lib import fusion360utils as futil
 
 from .FusionFileExport import FusionFileExport
+from .ArchiveWriter import archive_formats, default_archive_format
+from .StlAssembler import stl_modes, default_stl_mode
+from .BatchExport import run_batch, job_environment_variable
+from .ExportScheduler import schedule_policies, default_schedule_policy
+from .VersionSelector import version_policies, default_version_policy
+from .ExportWatchdog import quarantine_policies, default_quarantine_policy
+from .ExportLog import log_verbosities, default_log_verbosity
+from .ExportShards import ExportShard
 
 import traceback
 
@@ -70,6 +78,11 @@ def run(context):
 
         # Specify if the command is promoted to the main toolbar.
         control.isPromoted = IS_PROMOTED
+
+        # Fusion started for an unattended export, e.g. by a scheduled task
+        job_path = os.environ.get(job_environment_variable)
+        if job_path:
+            run_batch(app, job_path)
     except:
         futil.handle_error('run')
 
@@ -96,6 +109,10 @@ def stop(context):
             ui.messageBox(f'AddIn Stop Failed: {e}')
 
 
+# work on the shards of an export from outside of any of them
+shard_wide_export_types = ('Split the plan into shards', 'Merge shard reports', 'Catalog the hub')
+
+
 class CommandExecuteHandler(adsk.core.CommandEventHandler):
     def __init__(self):
         super().__init__()
@@ -125,10 +142,21 @@ class CommandExecuteHandler(adsk.core.CommandEventHandler):
             if not output_path:
                 return
 
-            with FusionFileExport(app, output_path) as total_export:
+            shard = ExportShard(values['shard'] - 1, values['shards'])
+
+            with FusionFileExport(app, output_path, log_verbosity=values['log_verbosity'],
+                                  log_format="json" if values['log_json'] else "text",
+                                  shard=shard if values['exportType'] not in shard_wide_export_types else None) as total_export:
                 total_export.export_step = values['export_step']
                 total_export.export_iges = values['export_iges']
                 total_export.export_stl = values['export_stl']
+                total_export.stl_mode = values['stl_mode']
+                total_export.archive_format = values['archive_format']
+                total_export.resume = values['resume']
+                total_export.schedule_policy = values['schedule_policy']
+                total_export.version_policy = values['version_policy']
+                total_export.version_interval = values['version_interval']
+                total_export.quarantine_policy = values['quarantine_policy']
 
                 if values['exportType'] == 'Hub':
                     total_export.exportActiveHub()
@@ -136,6 +164,22 @@ class CommandExecuteHandler(adsk.core.CommandEventHandler):
                     total_export.exportCurrentProject()
                 elif values['exportType'] == 'File':
                     total_export.exportCurrentFile()
+                elif values['exportType'] == 'Plan hub export':
+                    total_export.planActiveHub()
+                elif values['exportType'] == 'Plan project export':
+                    total_export.planCurrentProject()
+                elif values['exportType'] == 'Export the plan':
+                    total_export.exportPlan()
+                elif values['exportType'] == 'Split the plan into shards':
+                    total_export.splitPlan(shard.count)
+                elif values['exportType'] == 'Merge shard reports':
+                    total_export.mergeShards()
+                elif values['exportType'] == 'Catalog the hub':
+                    total_export.catalogActiveHub()
+                elif values['exportType'] == 'Export changes from the catalog':
+                    total_export.exportCatalog()
+                elif values['exportType'] == 'Clean up blob store':
+                    total_export.collectGarbage()
                 else:
                     if ui:
                         ui.messageBox('Unknown export type: {}'.format(
@@ -202,6 +246,14 @@ class CommandCreatedHandler(adsk.core.CommandCreatedEventHandler):
             dropdown3Items.add('Hub', False, '')
             dropdown3Items.add('Project', False, '')
             dropdown3Items.add('File', True, '')
+            dropdown3Items.add('Plan hub export', False, '')
+            dropdown3Items.add('Plan project export', False, '')
+            dropdown3Items.add('Export the plan', False, '')
+            dropdown3Items.add('Split the plan into shards', False, '')
+            dropdown3Items.add('Merge shard reports', False, '')
+            dropdown3Items.add('Catalog the hub', False, '')
+            dropdown3Items.add('Export changes from the catalog', False, '')
+            dropdown3Items.add('Clean up blob store', False, '')
 
             inputs.addBoolValueInput(
                 'export_step', 'Export step', True, "", True)
@@ -210,6 +262,53 @@ class CommandCreatedHandler(adsk.core.CommandCreatedEventHandler):
             inputs.addBoolValueInput(
                 'export_iges', 'Export iges', True, "", False)
 
+            stlModeInput = inputs.addDropDownCommandInput(
+                'stl_mode', 'Stl files', adsk.core.DropDownStyles.TextListDropDownStyle)
+            for stl_mode in stl_modes:
+                stlModeInput.listItems.add(
+                    stl_mode, stl_mode == default_stl_mode, '')
+            inputs.addBoolValueInput(
+                'resume', 'Resume interrupted or cancelled export', True, "", False)
+
+            archiveFormatInput = inputs.addDropDownCommandInput(
+                'archive_format', 'Archive format', adsk.core.DropDownStyles.TextListDropDownStyle)
+            for archive_format in archive_formats:
+                archiveFormatInput.listItems.add(
+                    archive_format, archive_format == default_archive_format, '')
+
+            schedulePolicyInput = inputs.addDropDownCommandInput(
+                'schedule_policy', 'Export order', adsk.core.DropDownStyles.TextListDropDownStyle)
+            for schedule_policy in schedule_policies:
+                schedulePolicyInput.listItems.add(
+                    schedule_policy, schedule_policy == default_schedule_policy, '')
+
+            versionPolicyInput = inputs.addDropDownCommandInput(
+                'version_policy', 'Versions', adsk.core.DropDownStyles.TextListDropDownStyle)
+            for version_policy in version_policies:
+                versionPolicyInput.listItems.add(
+                    version_policy, version_policy == default_version_policy, '')
+            inputs.addIntegerSpinnerCommandInput(
+                'version_interval', 'Every Nth version', 1, 1000, 1, 10)
+
+            quarantinePolicyInput = inputs.addDropDownCommandInput(
+                'quarantine_policy', 'Quarantined files', adsk.core.DropDownStyles.TextListDropDownStyle)
+            for quarantine_policy in quarantine_policies:
+                quarantinePolicyInput.listItems.add(
+                    quarantine_policy, quarantine_policy == default_quarantine_policy, '')
+
+            logVerbosityInput = inputs.addDropDownCommandInput(
+                'log_verbosity', 'Log', adsk.core.DropDownStyles.TextListDropDownStyle)
+            for log_verbosity in log_verbosities:
+                logVerbosityInput.listItems.add(
+                    log_verbosity, log_verbosity == default_log_verbosity, '')
+            inputs.addBoolValueInput(
+                'log_json', 'Log as JSON lines', True, "", False)
+
+            inputs.addIntegerSpinnerCommandInput(
+                'shard', 'Shard', 1, 64, 1, 1)
+            inputs.addIntegerSpinnerCommandInput(
+                'shards', 'Of shards', 1, 64, 1, 1)
+
             onExecute = CommandExecuteHandler()
             command.execute.add(onExecute)
             handlers.append(onExecute)
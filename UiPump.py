@@ -0,0 +1,96 @@
+import os
+import time
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+class UiPump(object):
+    """Keeps Fusion responsive on a time cadence instead of once per file.
+
+    Events are processed, the viewport is refreshed and the progress dialog
+    is updated at most every interval seconds, however long or short the
+    exports in between are. The exporter calls checkpoint() between single
+    component and sketch exports, it raises ExportCancelled once Cancel is
+    pressed.
+
+    While the pause file exists the export waits at the next checkpoint,
+    still processing events, and goes on when the file is deleted. Cancel
+    works while paused too.
+    """
+
+    def __init__(self, progress_dialog, do_events, refresh=None, pause_path=None, interval=0.25,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.progress_dialog = progress_dialog
+        self.do_events = do_events
+        self.refresh = refresh
+        self.pause_path = pause_path
+        self.interval = interval
+        self.clock = clock
+        self.sleep = sleep
+
+        self.last_pump = None
+        self.cancelled = False
+        self.paused = False
+        self.paused_seconds = 0.0
+        self.pumps = 0
+
+        self.pending_value = None
+        self.pending_maximum = None
+
+    def progress(self, value, maximum=None):
+        # shown with the next pump
+        self.pending_value = value
+        if maximum is not None:
+            self.pending_maximum = maximum
+
+    def pump(self, force=False):
+        now = self.clock()
+        if not force and self.last_pump is not None and now - self.last_pump < self.interval:
+            return self.cancelled
+        self.last_pump = now
+        self.pumps += 1
+
+        if self.pending_maximum is not None:
+            if self.progress_dialog.maximumValue != self.pending_maximum:
+                self.progress_dialog.maximumValue = self.pending_maximum
+            self.pending_maximum = None
+        if self.pending_value is not None:
+            self.progress_dialog.progressValue = self.pending_value
+            self.pending_value = None
+
+        if self.refresh is not None:
+            self.refresh()
+        self.do_events()
+
+        if self.progress_dialog.wasCancelled:
+            self.cancelled = True
+        self.paused = self.pause_path is not None and os.path.exists(self.pause_path)
+        return self.cancelled
+
+    def poll(self):
+        # between files, tells if the export is cancelled
+        self.pump()
+        self.wait_while_paused()
+        return self.cancelled
+
+    def checkpoint(self):
+        # inside of a file, the export of the file is abandoned on cancel
+        if self.poll():
+            raise ExportCancelled("Cancelled")
+
+    def wait_while_paused(self):
+        if self.cancelled or not self.paused:
+            return
+
+        started = self.clock()
+        message = self.progress_dialog.message
+        self.progress_dialog.message = "Paused, delete \"{}\" to go on".format(self.pause_path)
+        try:
+            while not self.cancelled and self.paused:
+                self.sleep(self.interval)
+                self.pump(force=True)
+        finally:
+            self.progress_dialog.message = message
+            self.paused_seconds += self.clock() - started
@@ -0,0 +1,89 @@
+version_policies = ("latest", "all", "new", "every_nth", "described")
+default_version_policy = "latest"
+
+
+class VersionSelector(object):
+    """Picks the versions of a data file to export.
+
+    latest     the latest version only
+    all        the whole history
+    new        versions newer than the latest exported one, the latest only for files never exported
+    every_nth  every interval'th version and the latest
+    described  versions saved with a description and the latest
+
+    Versions come oldest first, the latest always last. The manifest tells
+    which version numbers are exported already, when nothing new is left
+    the history isn't listed at all, so an incremental run over a hub costs
+    a lookup per unchanged file.
+    """
+
+    def __init__(self, manifest, policy=default_version_policy, interval=10):
+        if policy not in version_policies:
+            raise ValueError("Unknown version policy \"{}\"".format(policy))
+        if interval < 1:
+            raise ValueError("Version interval must be 1 or more")
+
+        self.manifest = manifest
+        self.policy = policy
+        self.interval = interval
+
+    def select(self, file):
+        if self.policy == "latest":
+            return [file]
+
+        latest_number = file.versionNumber
+        exported = self.manifest.exported_version_numbers(file.id)
+
+        if self.policy == "new":
+            if not exported:
+                return [file]
+            newer_than = max(exported)
+            if latest_number <= newer_than:
+                return []
+            return self._versions(file, lambda number, version: number > newer_than)
+
+        if self.policy == "all":
+            if exported.issuperset(range(1, latest_number + 1)):
+                return []
+            return self._versions(file, lambda number, version: number not in exported)
+
+        if self.policy == "every_nth":
+            wanted = set(range(self.interval, latest_number + 1, self.interval))
+            wanted.add(latest_number)
+            if exported.issuperset(wanted):
+                return []
+            return self._versions(file, lambda number, version: number in wanted and number not in exported)
+
+        # described versions older than the latest exported one were selected back when they were the latest
+        if latest_number in exported:
+            return []
+        return self._versions(file, lambda number, version: number not in exported and bool(version.description))
+
+    def is_done(self, file_id, latest_number):
+        # nothing left to select, told from the manifest alone, like the early returns of select()
+        exported = self.manifest.exported_version_numbers(file_id)
+        if self.policy in ("latest", "described"):
+            return latest_number in exported
+        if self.policy == "new":
+            return bool(exported) and latest_number <= max(exported)
+        if self.policy == "all":
+            return exported.issuperset(range(1, latest_number + 1))
+
+        wanted = set(range(self.interval, latest_number + 1, self.interval))
+        wanted.add(latest_number)
+        return exported.issuperset(wanted)
+
+    def _versions(self, file, is_selected):
+        latest_number = file.versionNumber
+        if latest_number == 1:
+            return [file]
+
+        selected = []
+        for version in file.versions:
+            number = version.versionNumber
+            if number < latest_number and is_selected(number, version):
+                selected.append((number, version))
+
+        selected.sort(key=lambda entry: entry[0])
+        # the listed latest version is a different object, the one given is used for it
+        return [version for number, version in selected] + [file]
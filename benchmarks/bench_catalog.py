@@ -0,0 +1,122 @@
+"""Hub catalog refreshes and catalog driven exports against a simulated Fusion 360 API.
+
+    python benchmarks/bench_catalog.py [--changes 3] [--deletes 1] [--latency DataFile.hasChildReferences=0.2 ...]
+
+Catalogs a synthetic hub, saves new versions of some files and deletes
+others, then refreshes the catalog again and shows the API calls of both
+refreshes. Then the hub is exported, the changed files are saved once more
+and exported by a full listing and from the refreshed catalog side by side,
+and a few questions are answered from the catalog alone.
+"""
+
+import argparse
+import importlib
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+benchmarks_path = os.path.dirname(os.path.abspath(__file__))
+package_path = os.path.dirname(benchmarks_path)
+
+sys.path.insert(0, os.path.join(benchmarks_path, "fakeadsk"))
+sys.path.insert(0, benchmarks_path)
+sys.path.insert(0, os.path.dirname(package_path))
+
+import adsk.core  # noqa: E402
+from adsk import _sim  # noqa: E402
+
+import synthetic  # noqa: E402
+
+package_name = os.path.basename(package_path)
+fusion_file_export = importlib.import_module(package_name + ".FusionFileExport")
+
+
+def run(app, output_path, action):
+    _sim.reset()
+    started = time.perf_counter()
+    with fusion_file_export.FusionFileExport(app, output_path, interactive=False) as total_export:
+        action(total_export)
+    seconds = time.perf_counter() - started
+    print("  {:.3f}s, {} api calls, {} hasChildReferences, {} documents opened, {} exported, {} skipped".format(
+        seconds, sum(_sim.calls.values()), _sim.calls["DataFile.hasChildReferences"], _sim.calls["Documents.open"],
+        total_export.file_exported_count, total_export.file_skipped_count))
+    return total_export
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--changes", type=int, default=3, help="files saved with a new version")
+    parser.add_argument("--deletes", type=int, default=1, help="files deleted")
+    parser.add_argument("--output", help="output folder, a temp folder by default")
+
+    parser.add_argument("--projects", type=int, default=2)
+    parser.add_argument("--folders", type=int, default=2, help="sub folders per folder")
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--files", type=int, default=3, help="files per folder")
+    parser.add_argument("--assemblies", type=int, default=3)
+    parser.add_argument("--references", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--latency", action="append", default=[], metavar="CALL=SECONDS",
+                        help="simulated latency of an API call, may be repeated")
+    args = parser.parse_args()
+
+    fusion_file_export.cloud_export_poll_interval = 0
+    fusion_file_export.cloud_export_final_wait = 1
+
+    app = adsk.core.Application.reset()
+    _sim.latency.update(dict((name, float(seconds)) for name, _, seconds in
+                             (value.partition("=") for value in args.latency)))
+    hub = synthetic.build(app, projects=args.projects, folders=args.folders, depth=args.depth, files=args.files,
+                          assemblies=args.assemblies, references=args.references, seed=args.seed)
+    rnd = random.Random(args.seed)
+
+    output_path = args.output or tempfile.mkdtemp(prefix="tehexport-catalog-")
+    try:
+        os.makedirs(output_path, exist_ok=True)
+
+        print("First refresh of the catalog")
+        run(app, output_path, lambda total_export: total_export.catalogActiveHub())
+
+        changed = rnd.sample(hub.files, args.changes + args.deletes)
+        for data_file in changed[:args.changes]:
+            synthetic.save_version(app, data_file)
+        for data_file in changed[args.changes:]:
+            synthetic.delete_file(app, data_file)
+        print("Refresh after {} new versions and {} deleted files".format(args.changes, args.deletes))
+        run(app, output_path, lambda total_export: (total_export.catalogActiveHub(),
+                                                    print("  " + total_export.catalog.summary())))
+
+        print("Full export of the hub")
+        run(app, output_path, lambda total_export: total_export.exportActiveHub())
+
+        for data_file in changed[:args.changes]:
+            synthetic.save_version(app, app.data._files_by_id[data_file._id])
+        print("Export of {} new versions by listing the hub".format(args.changes))
+        listing_path = output_path + "-listing"
+        shutil.copytree(output_path, listing_path)
+        try:
+            run(app, listing_path, lambda total_export: total_export.exportActiveHub())
+        finally:
+            shutil.rmtree(listing_path, ignore_errors=True)
+        print("Export of {} new versions from the catalog, refresh included".format(args.changes))
+        run(app, output_path, lambda total_export: (total_export.catalogActiveHub(), total_export.exportCatalog()))
+
+        with fusion_file_export.FusionFileExport(app, output_path, interactive=False) as total_export:
+            catalog = total_export.catalog
+            part_id = hub.assemblies[0]._children[0]._id
+            print("Designs referencing {}: {}".format(
+                part_id, ", ".join(file["name"] for file in catalog.parents(part_id))))
+            print("Changed since the start: {}".format(
+                ", ".join(file["name"] for file in catalog.changed_since(1600000000 + 2 * 86400))))
+            for name, (files, versions) in catalog.project_versions().items():
+                print("{}: {} files, {} versions".format(name, files, versions))
+    finally:
+        if not args.output:
+            shutil.rmtree(output_path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
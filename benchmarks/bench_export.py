@@ -0,0 +1,224 @@
+"""End to end export benchmark against a simulated Fusion 360 API.
+
+    python benchmarks/bench_export.py [--mode hub|project|component] [--runs 2]
+        [--projects 2 --folders 2 --depth 2 --files 3 --components 3 --occurrences 3 ...]
+        [--latency Documents.open=0.05 --latency ExportManager.execute.stp=0.02]
+
+Drives exportActiveHub, exportCurrentProject or _write_component with the
+fake adsk package from benchmarks/fakeadsk and reports wall time, API call
+counts, filesystem calls and peak memory. Later runs reuse the output
+folder, so they show the cost of an incremental export.
+"""
+
+import argparse
+import builtins
+import collections
+import importlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+benchmarks_path = os.path.dirname(os.path.abspath(__file__))
+package_path = os.path.dirname(benchmarks_path)
+
+sys.path.insert(0, os.path.join(benchmarks_path, "fakeadsk"))
+sys.path.insert(0, benchmarks_path)
+sys.path.insert(0, os.path.dirname(package_path))
+
+import adsk.core  # noqa: E402
+from adsk import _sim  # noqa: E402
+
+import synthetic  # noqa: E402
+
+fusion_file_export = importlib.import_module(os.path.basename(package_path) + ".FusionFileExport")
+
+
+FS_CALLS = ["stat", "lstat", "mkdir", "scandir", "listdir", "remove", "unlink", "rename",
+            "replace", "link", "rmdir", "utime"]
+
+
+class FsCounter(object):
+    """Counts os level filesystem calls and opens of all threads while active."""
+
+    def __init__(self):
+        self.calls = collections.Counter()
+        self.lock = threading.Lock()
+        self.originals = {}
+
+    def __enter__(self):
+        for name in FS_CALLS:
+            if hasattr(os, name):
+                self._patch(os, name, name)
+        self._patch(builtins, "open", "open")
+        self._patch(io, "open", "open")
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        for (module, name), original in self.originals.items():
+            setattr(module, name, original)
+        self.originals.clear()
+
+    def _patch(self, module, name, label):
+        original = getattr(module, name)
+        self.originals[(module, name)] = original
+
+        def counted(*args, **kwargs):
+            with self.lock:
+                self.calls[label] += 1
+            return original(*args, **kwargs)
+
+        setattr(module, name, counted)
+
+
+def parse_latency(values):
+    latency = {}
+    for value in values:
+        name, _, seconds = value.partition("=")
+        latency[name] = float(seconds)
+    return latency
+
+
+def run_component(exporter, hub):
+    # components only, without documents, archives and the manifest
+    exporter.progress_dialog.show("Exporting data!", "", 0, 1, 1)
+    for data_file in hub.files:
+        design = data_file._design_factory(data_file)
+        base_path = os.path.join(exporter.output_path, "components", data_file._id)
+        exporter.written_components.clear()
+        exporter._write_component(base_path, design.rootComponent, data_file.versionId)
+
+
+def run_once(args, output_path):
+    app = adsk.core.Application.reset()
+    _sim.latency.clear()
+    _sim.latency.update(parse_latency(args.latency))
+    _sim.default_latency = args.default_latency
+    _sim.cloud_export_delay = args.cloud_export_delay
+
+    hub = synthetic.build(
+        app, projects=args.projects, folders=args.folders, depth=args.depth, files=args.files,
+        components=args.components, occurrences=args.occurrences, shared=not args.no_sharing,
+        sketches=args.sketches, bodies=args.bodies, assemblies=args.assemblies,
+        references=args.references, versions=args.versions, seed=args.seed)
+    _sim.reset()
+
+    if args.memory:
+        tracemalloc.start()
+
+    started = time.perf_counter()
+    with FsCounter() as fs:
+        with fusion_file_export.FusionFileExport(app, output_path, log_verbosity=args.log_verbosity,
+                                                 log_format=args.log_format) as exporter:
+            exporter.export_step = not args.no_step
+            exporter.export_stl = args.stl
+            exporter.stl_mode = args.stl_mode
+            exporter.export_iges = args.iges
+            exporter.archive_format = args.archive_format
+            exporter.schedule_policy = args.schedule
+            exporter.version_policy = args.version_policy
+            exporter.version_interval = args.version_interval
+            exporter.quarantine_policy = args.quarantine
+            exporter.document_pool.max_documents = args.open_documents
+
+            if args.mode == "hub":
+                exporter.exportActiveHub()
+            elif args.mode == "project":
+                exporter.exportCurrentProject()
+            else:
+                run_component(exporter, hub)
+                exporter._finish_archives()
+    elapsed = time.perf_counter() - started
+
+    peak = 0
+    if args.memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {
+        "seconds": elapsed,
+        "files": len(hub.files),
+        "api": collections.Counter(_sim.calls),
+        "fs": collections.Counter(fs.calls),
+        "peak": peak,
+        "issues": exporter.num_issues,
+        "exported": exporter.file_exported_count,
+        "skipped": exporter.file_skipped_count,
+    }
+
+
+def report(index, result, top):
+    print("run {}: {:.3f}s, {} files ({} exported, {} skipped, {} issues), peak memory {:.1f} MB".format(
+        index, result["seconds"], result["files"], result["exported"], result["skipped"],
+        result["issues"], result["peak"] / (1024 * 1024)))
+    print("  api calls: {}".format(sum(result["api"].values())))
+    for name, count in result["api"].most_common(top):
+        print("    {:>8} {}".format(count, name))
+    print("  fs calls: {}".format(sum(result["fs"].values())))
+    for name, count in result["fs"].most_common():
+        print("    {:>8} {}".format(count, name))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=["hub", "project", "component"], default="hub")
+    parser.add_argument("--runs", type=int, default=2)
+    parser.add_argument("--output", help="output folder, a temp folder by default")
+    parser.add_argument("--top", type=int, default=12, help="most frequent API calls to show")
+
+    parser.add_argument("--projects", type=int, default=2)
+    parser.add_argument("--folders", type=int, default=2, help="sub folders per folder")
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--files", type=int, default=3, help="files per folder")
+    parser.add_argument("--components", type=int, default=3, help="parts per design")
+    parser.add_argument("--occurrences", type=int, default=3, help="bolts per part")
+    parser.add_argument("--no-sharing", action="store_true", help="every bolt is its own component")
+    parser.add_argument("--sketches", type=int, default=1, help="sketches per component")
+    parser.add_argument("--bodies", type=int, default=1, help="bodies per component")
+    parser.add_argument("--assemblies", type=int, default=1)
+    parser.add_argument("--references", type=int, default=2, help="referenced designs per assembly")
+    parser.add_argument("--versions", type=int, default=1, help="max versions per file")
+    parser.add_argument("--seed", type=int, default=1)
+
+    parser.add_argument("--latency", action="append", default=[], metavar="CALL=SECONDS",
+                        help="simulated latency of an API call, may be repeated")
+    parser.add_argument("--default-latency", type=float, default=0.0)
+    parser.add_argument("--cloud-export-delay", type=float, default=0.05)
+
+    parser.add_argument("--no-step", action="store_true")
+    parser.add_argument("--stl", action="store_true")
+    parser.add_argument("--stl-mode", default="both", help="stl files of bodies, merged components or both")
+    parser.add_argument("--iges", action="store_true")
+    parser.add_argument("--archive-format", default="zip")
+    parser.add_argument("--schedule", default="folder", help="schedule policy of the export order")
+    parser.add_argument("--version-policy", default="latest", help="versions of a file to export")
+    parser.add_argument("--version-interval", type=int, default=10, help="for the every_nth version policy")
+    parser.add_argument("--quarantine", default="defer", help="defer, skip or retry quarantined files")
+    parser.add_argument("--open-documents", type=int, default=0, help="documents kept open for related files")
+    parser.add_argument("--no-output-tree", action="store_true",
+                        help="probe every output path on disk instead of caching folder listings")
+    parser.add_argument("--log-verbosity", default="file", help="summary, file or artifact")
+    parser.add_argument("--log-format", default="text", help="text or json")
+    parser.add_argument("--memory", action="store_true", help="trace peak memory, slows the run down")
+    args = parser.parse_args()
+
+    # cloud exports arrive within the simulated delay, nobody has to wait for minutes
+    fusion_file_export.cloud_export_poll_interval = 0
+    fusion_file_export.cloud_export_final_wait = max(args.cloud_export_delay * 10, 1)
+    fusion_file_export.cache_output_listings = not args.no_output_tree
+
+    output_path = args.output or tempfile.mkdtemp(prefix="tehexport-bench-")
+    try:
+        for index in range(1, args.runs + 1):
+            report(index, run_once(args, output_path), args.top)
+    finally:
+        if not args.output:
+            shutil.rmtree(output_path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
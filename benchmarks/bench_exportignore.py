@@ -0,0 +1,83 @@
+"""Match cost of exportignore.txt rules against the number of rules.
+
+    python benchmarks/bench_exportignore.py [--paths 20000] [--rules 1,10,100,300,1000,3000]
+
+Compares the old line by line substring scan with the compiled ExportIgnore matcher.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ExportIgnore import ExportIgnore  # noqa: E402
+
+
+WORDS = ["Bracket", "Housing", "Gear", "Shaft", "Cover", "Plate", "Bolt M3", "Nut M4",
+         "Frame", "Motor Mount", "Spacer", "Bearing 608", "Panel", "Clip", "Hinge", "Arm"]
+
+
+def random_path(rnd):
+    parts = ["D:\\Backup", "Hub " + rnd.choice(WORDS), "Project " + rnd.choice(WORDS)]
+    for _ in range(rnd.randint(1, 5)):
+        parts.append("{} {}".format(rnd.choice(WORDS), rnd.randint(1, 400)))
+    return "\\".join(parts) + rnd.choice([".stp", ".stl", ".igs", ".dxf"])
+
+
+def random_rule(rnd):
+    return "{} {}".format(rnd.choice(WORDS), rnd.randint(1000, 100000))
+
+
+def legacy_match(exportignore, file_path):
+    for line in exportignore.splitlines():
+        if line.strip() and line.strip() in file_path:
+            return True
+
+    return False
+
+
+def measure(function, paths):
+    started = time.perf_counter()
+    matched = 0
+    for file_path in paths:
+        if function(file_path):
+            matched += 1
+    return (time.perf_counter() - started) / len(paths) * 1e6, matched
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--paths", type=int, default=20000)
+    parser.add_argument("--rules", default="1,10,100,300,1000,3000")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    paths = [random_path(rnd) for _ in range(args.paths)]
+
+    print("{:>6} {:>12} {:>14} {:>12} {:>9}".format(
+        "rules", "legacy us", "compiled us", "compile ms", "matched"))
+    for rules_count in [int(count) for count in args.rules.split(",")]:
+        rules = [random_rule(rnd) for _ in range(rules_count)]
+        # a few rules that really match something
+        rules[:2] = ["Bolt M3 1", "Gear 12"][:rules_count]
+        exportignore = "\n".join(rules)
+
+        started = time.perf_counter()
+        compiled = ExportIgnore(exportignore)
+        compile_ms = (time.perf_counter() - started) * 1e3
+
+        legacy_us, legacy_matched = measure(
+            lambda file_path: legacy_match(exportignore, file_path), paths)
+        compiled_us, compiled_matched = measure(compiled.match, paths)
+        assert legacy_matched == compiled_matched
+
+        print("{:>6} {:>12.2f} {:>14.2f} {:>12.2f} {:>9}".format(
+            rules_count, legacy_us, compiled_us, compile_ms, compiled_matched))
+
+
+if __name__ == "__main__":
+    main()
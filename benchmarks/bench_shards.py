@@ -0,0 +1,131 @@
+"""Sharded hub export against a simulated Fusion 360 API.
+
+    python benchmarks/bench_shards.py [--shards 3] [--weights 2,1,1] [--separate] [--plan]
+        [--skip-shard 2] [--latency Documents.open=0.05 ...]
+
+Exports every shard one after another, like separate workstations would at
+the same time, into one shared output folder or one folder per shard, then
+merges the shard reports and shows the balance of the shards and the
+overlaps and gaps found. --skip-shard leaves a shard out to show a gap,
+--plan splits an export plan by estimated time instead of hashing.
+"""
+
+import argparse
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+benchmarks_path = os.path.dirname(os.path.abspath(__file__))
+package_path = os.path.dirname(benchmarks_path)
+
+sys.path.insert(0, os.path.join(benchmarks_path, "fakeadsk"))
+sys.path.insert(0, benchmarks_path)
+sys.path.insert(0, os.path.dirname(package_path))
+
+import adsk.core  # noqa: E402
+from adsk import _sim  # noqa: E402
+
+import synthetic  # noqa: E402
+
+package_name = os.path.basename(package_path)
+fusion_file_export = importlib.import_module(package_name + ".FusionFileExport")
+export_shards = importlib.import_module(package_name + ".ExportShards")
+
+
+def build(args):
+    app = adsk.core.Application.reset()
+    _sim.latency.clear()
+    _sim.latency.update(dict((name, float(seconds)) for name, _, seconds in
+                             (value.partition("=") for value in args.latency)))
+    synthetic.build(app, projects=args.projects, folders=args.folders, depth=args.depth,
+                    files=args.files, versions=args.versions, seed=args.seed)
+    _sim.reset()
+    return app
+
+
+def exporter(args, app, output_path, shard=None):
+    total_export = fusion_file_export.FusionFileExport(app, output_path, interactive=False, shard=shard)
+    total_export.version_policy = "all" if args.versions > 1 else "latest"
+    return total_export
+
+
+def run_shard(args, output_path, shard):
+    app = build(args)
+    started = time.perf_counter()
+    with exporter(args, app, output_path, shard) as total_export:
+        if args.plan:
+            total_export.exportPlan()
+        else:
+            total_export.exportActiveHub()
+    return {
+        "seconds": time.perf_counter() - started,
+        "exported": total_export.file_exported_count,
+        "skipped": total_export.file_skipped_count,
+        "issues": total_export.num_issues,
+        "opens": _sim.calls["Documents.open"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", type=int, default=3)
+    parser.add_argument("--weights", help="relative speed of the shards, like 2,1,1")
+    parser.add_argument("--separate", action="store_true", help="an output folder per shard")
+    parser.add_argument("--plan", action="store_true", help="split an export plan by estimated time")
+    parser.add_argument("--skip-shard", type=int, default=0, help="shard not to run, 1 based")
+    parser.add_argument("--output", help="output folder, a temp folder by default")
+
+    parser.add_argument("--projects", type=int, default=2)
+    parser.add_argument("--folders", type=int, default=2, help="sub folders per folder")
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--files", type=int, default=3, help="files per folder")
+    parser.add_argument("--versions", type=int, default=1, help="max versions per file, all are exported")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--latency", action="append", default=[], metavar="CALL=SECONDS",
+                        help="simulated latency of an API call, may be repeated")
+    args = parser.parse_args()
+
+    fusion_file_export.cloud_export_poll_interval = 0
+    fusion_file_export.cloud_export_final_wait = 1
+    weights = [float(weight) for weight in args.weights.split(",")] if args.weights else None
+
+    output_path = args.output or tempfile.mkdtemp(prefix="tehexport-shards-")
+    try:
+        roots = [os.path.join(output_path, "shard{}".format(index + 1)) if args.separate else output_path
+                 for index in range(args.shards)]
+        for root in roots:
+            os.makedirs(root, exist_ok=True)
+
+        if args.plan:
+            # planned once, every shard gets its part of the plan next to it
+            with exporter(args, build(args), roots[0]) as total_export:
+                total_export.planActiveHub()
+                total_export.splitPlan(args.shards, weights)
+            for index, root in enumerate(roots[1:], 1):
+                if root == roots[0]:
+                    continue
+                shard_plan_name = export_shards.ExportShard(index, args.shards, weights).file_name("exportplan.json")
+                shutil.copyfile(os.path.join(roots[0], shard_plan_name), os.path.join(root, shard_plan_name))
+
+        for index in range(args.shards):
+            if index + 1 == args.skip_shard:
+                continue
+            shard = export_shards.ExportShard(index, args.shards, weights)
+            result = run_shard(args, roots[index], shard)
+            print("{}: {:.3f}s, {} exported, {} skipped, {} issues, {} documents opened".format(
+                shard.name, result["seconds"], result["exported"], result["skipped"], result["issues"],
+                result["opens"]))
+
+        with exporter(args, build(args), roots[0]) as total_export:
+            result = total_export.mergeShards(sorted(set(roots)))
+        print(export_shards.ShardMerge.summary(result))
+    finally:
+        if not args.output:
+            shutil.rmtree(output_path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
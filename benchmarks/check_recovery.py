@@ -0,0 +1,174 @@
+"""Failure and recovery scenarios against the simulated Fusion 360 API.
+
+    python benchmarks/check_recovery.py [scenario ...]
+
+Every scenario exports into a temp folder with the fake adsk package from
+benchmarks/fakeadsk, breaks something on the way and checks that the next
+run recovers from it. Exits with 1 when a check fails.
+"""
+
+import contextlib
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+import traceback
+import zipfile
+
+benchmarks_path = os.path.dirname(os.path.abspath(__file__))
+package_path = os.path.dirname(benchmarks_path)
+
+sys.path.insert(0, os.path.join(benchmarks_path, "fakeadsk"))
+sys.path.insert(0, benchmarks_path)
+sys.path.insert(0, os.path.dirname(package_path))
+
+import adsk.core  # noqa: E402
+import adsk.fusion  # noqa: E402
+from adsk import _sim  # noqa: E402
+
+import synthetic  # noqa: E402
+
+package_name = os.path.basename(package_path)
+fusion_file_export = importlib.import_module(package_name + ".FusionFileExport")
+blob_store = importlib.import_module(package_name + ".BlobStore")
+
+
+@contextlib.contextmanager
+def patched(owner, name, replacement):
+    original = getattr(owner, name)
+    setattr(owner, name, replacement(original))
+    try:
+        yield
+    finally:
+        setattr(owner, name, original)
+
+
+def failing_f3d(file_name):
+    # the f3d export of the file raises, like a corrupt design does
+    def replacement(execute):
+        def execute_or_fail(self, options):
+            if options.kind == '.f3d' and os.path.basename(options.filename).startswith(file_name + " v"):
+                raise RuntimeError("corrupt design")
+            return execute(self, options)
+        return execute_or_fail
+    return patched(adsk.fusion.ExportManager, "execute", replacement)
+
+
+def export_hub(output_path, action="exportActiveHub", **settings):
+    app = adsk.core.Application.reset()
+    synthetic.build(app, projects=1, folders=1, depth=1, files=2)
+    _sim.reset()
+    with fusion_file_export.FusionFileExport(app, output_path, interactive=False) as total_export:
+        for name, value in settings.items():
+            setattr(total_export, name, value)
+        getattr(total_export, action)()
+    return total_export
+
+
+def archives(output_path):
+    return [os.path.join(folder_path, file_name) for folder_path, _, file_names in os.walk(output_path)
+            for file_name in file_names if file_name.endswith(".zip")]
+
+
+def archive_count(output_path):
+    return len(archives(output_path))
+
+
+def archives_with(output_path, text):
+    count = 0
+    for archive_path in archives(output_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            count += any(text in name for name in archive.namelist())
+    return count
+
+
+def write_exportignore(output_path, text):
+    with open(os.path.join(output_path, "exportignore.txt"), 'w') as f:
+        f.write(text)
+
+
+def failed_then_resumed(output_path):
+    # a file that failed is not taken for a crash by the resumed run, it is exported again
+    with failing_f3d("Design 2"):
+        total_export = export_hub(output_path, quarantine_policy="skip")
+    assert total_export.num_issues == 1, total_export.num_issues
+    assert not total_export.quarantined, total_export.quarantined
+    assert archive_count(output_path) == 3, archive_count(output_path)
+
+    total_export = export_hub(output_path, quarantine_policy="skip", resume=True)
+    assert total_export.journal.resumed
+    assert not total_export.quarantined, total_export.quarantined
+    assert total_export.file_exported_count == 1, total_export.file_exported_count
+    assert total_export.num_issues == 0, total_export.num_issues
+    assert archive_count(output_path) == 4, archive_count(output_path)
+
+
+def ignore_rule_removed_then_planned(output_path):
+    # a loosened exportignore.txt leaves the archives alone until an export writes them over
+    write_exportignore(output_path, "Bolt\n")
+    export_hub(output_path)
+    assert archive_count(output_path) == 4 and archives_with(output_path, "Bolt") == 0
+
+    write_exportignore(output_path, "")
+    for action in ("planActiveHub", "collectGarbage"):
+        export_hub(output_path, action)
+        assert archive_count(output_path) == 4, (action, archive_count(output_path))
+
+    total_export = export_hub(output_path)
+    assert total_export.file_exported_count == 4, total_export.file_exported_count
+    assert archives_with(output_path, "Bolt") == 4, archives_with(output_path, "Bolt")
+
+    total_export = export_hub(output_path)
+    assert total_export.file_skipped_count == 4, total_export.file_skipped_count
+
+
+def locked_while_finishing(output_path):
+    # an archive that can't be stored fails its file only, the export goes on and reports it
+    def replacement(store):
+        def store_or_fail(self, file_path, digest=None):
+            if os.path.basename(file_path).startswith("Design 2 v") and file_path.endswith(".zip"):
+                raise PermissionError(13, "locked", file_path)
+            return store(self, file_path, digest)
+        return store_or_fail
+
+    with patched(blob_store.BlobStore, "store", replacement):
+        total_export = export_hub(output_path)
+    assert total_export.file_exported_count == 4, total_export.file_exported_count
+    assert total_export.num_issues == 1, total_export.num_issues
+    assert total_export.exportStatus() == "completed_with_issues", total_export.exportStatus()
+
+    total_export = export_hub(output_path, resume=True)
+    assert not total_export.quarantined, total_export.quarantined
+    assert total_export.num_issues == 0, total_export.num_issues
+    # the archive was complete, the resumed run only records it
+    assert total_export.file_skipped_count == 4, total_export.file_skipped_count
+
+
+scenarios = [failed_then_resumed, ignore_rule_removed_then_planned, locked_while_finishing]
+
+
+def main():
+    fusion_file_export.cloud_export_poll_interval = 0
+    fusion_file_export.cloud_export_final_wait = 1
+
+    names = sys.argv[1:] or [scenario.__name__ for scenario in scenarios]
+    failed = 0
+    for scenario in scenarios:
+        if scenario.__name__ not in names:
+            continue
+        output_path = tempfile.mkdtemp(prefix="tehexport-recovery-")
+        try:
+            scenario(output_path)
+            print("{}: ok".format(scenario.__name__))
+        except Exception:
+            failed += 1
+            print("{}: FAILED\n{}".format(scenario.__name__, traceback.format_exc()))
+        finally:
+            shutil.rmtree(output_path, ignore_errors=True)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
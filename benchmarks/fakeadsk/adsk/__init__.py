@@ -0,0 +1,12 @@
+"""Minimal stand-in for the Fusion 360 `adsk` package, good enough to drive FusionFileExport offline."""
+
+from . import _sim
+
+
+def doEvents():
+    _sim.call('doEvents')
+    _sim.pump()
+
+
+def terminate():
+    pass
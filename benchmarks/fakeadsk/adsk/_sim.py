@@ -0,0 +1,38 @@
+"""State of the simulated Fusion 360 API: call counters, latencies and delayed events."""
+
+import collections
+import time
+
+calls = collections.Counter()
+
+# seconds per API call, by call name ("Documents.open", "ExportManager.execute.stp", ...)
+latency = {}
+default_latency = 0.0
+
+# seconds until a cloud f3z export arrives
+cloud_export_delay = 0.05
+
+pending = []
+
+
+def call(name):
+    calls[name] += 1
+    delay = latency.get(name, default_latency)
+    if delay:
+        time.sleep(delay)
+
+
+def later(delay, callback):
+    pending.append((time.monotonic() + delay, callback))
+
+
+def pump():
+    now = time.monotonic()
+    for event in [event for event in pending if event[0] <= now]:
+        pending.remove(event)
+        event[1]()
+
+
+def reset():
+    calls.clear()
+    del pending[:]
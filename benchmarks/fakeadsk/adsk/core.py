@@ -0,0 +1,404 @@
+import os
+
+from . import _sim
+
+
+class MessageBoxButtonTypes:
+    OKButtonType = 0
+    OKCancelButtonType = 1
+    RetryCancelButtonType = 2
+    YesNoButtonType = 3
+    YesNoCancelButtonType = 4
+
+
+class MessageBoxIconTypes:
+    NoIconIconType = 0
+    QuestionIconType = 1
+    InformationIconType = 2
+    WarningIconType = 3
+    CriticalIconType = 4
+
+
+class DialogResults:
+    DialogError = -1
+    DialogOK = 0
+    DialogCancel = 1
+    DialogNo = 2
+    DialogYes = 3
+
+
+class DropDownStyles:
+    LabeledIconDropDownStyle = 0
+    TextListDropDownStyle = 2
+
+
+class CommandEventHandler(object):
+    pass
+
+
+class CommandCreatedEventHandler(object):
+    pass
+
+
+def _api_property(name, attribute):
+    def getter(self):
+        _sim.call(name)
+        return getattr(self, attribute)
+    return property(getter)
+
+
+class ProgressDialog(object):
+    def __init__(self):
+        self.message = ''
+        self.maximumValue = 0
+        self.progressValue = 0
+        self.wasCancelled = False
+        self.isShowing = False
+
+    def show(self, title, message, minimumValue, maximumValue, delay=0):
+        self.isShowing = True
+        self.wasCancelled = False
+        return True
+
+    def hide(self):
+        self.isShowing = False
+        return True
+
+    def reset(self):
+        self.progressValue = 0
+        return True
+
+
+class FolderDialog(object):
+    def __init__(self):
+        self.title = ''
+        self.folder = ''
+
+    def showDialog(self):
+        return DialogResults.DialogOK if self.folder else DialogResults.DialogCancel
+
+
+class UserInterface(object):
+    def __init__(self):
+        self.messages = []
+        # answers given to the next message boxes, Yes/OK when empty
+        self.answers = []
+
+    def messageBox(self, text, title='', buttons=0, icon=0):
+        self.messages.append(text)
+        if self.answers:
+            return self.answers.pop(0)
+        if buttons in (MessageBoxButtonTypes.YesNoButtonType, MessageBoxButtonTypes.YesNoCancelButtonType):
+            return DialogResults.DialogYes
+        return DialogResults.DialogOK
+
+    def createProgressDialog(self):
+        return ProgressDialog()
+
+    def createFolderDialog(self):
+        return FolderDialog()
+
+
+class Viewport(object):
+    def refresh(self):
+        _sim.call('Viewport.refresh')
+        return True
+
+    def saveAsImageFile(self, filename, width, height):
+        _sim.call('Viewport.saveAsImageFile')
+        with open(filename, 'wb') as f:
+            f.write(b'\x89PNG' + b'\0' * 1024)
+        return True
+
+
+class Point3D(object):
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x = x
+        self.y = y
+        self.z = z
+
+
+class BoundingBox3D(object):
+    def __init__(self, minPoint, maxPoint):
+        self.minPoint = minPoint
+        self.maxPoint = maxPoint
+
+
+class ObjectCollection(object):
+    def __init__(self, items, name):
+        self._items = list(items)
+        self._name = name
+
+    @property
+    def count(self):
+        _sim.call(self._name + '.count')
+        return len(self._items)
+
+    def item(self, index):
+        _sim.call(self._name + '.item')
+        return self._items[index]
+
+    def itemById(self, id):
+        _sim.call(self._name + '.itemById')
+        for item in self._items:
+            if item._id == id:
+                return item
+        return None
+
+    def __iter__(self):
+        _sim.call(self._name + '.iter')
+        return iter(list(self._items))
+
+
+class DataHub(object):
+    name = _api_property('DataHub.name', '_name')
+    id = _api_property('DataHub.id', '_id')
+
+    def __init__(self, id, name):
+        self._id = id
+        self._name = name
+        self._projects = []
+
+    @property
+    def dataProjects(self):
+        _sim.call('DataHub.dataProjects')
+        return ObjectCollection(self._projects, 'DataProjects')
+
+
+class DataProject(object):
+    name = _api_property('DataProject.name', '_name')
+    id = _api_property('DataProject.id', '_id')
+    rootFolder = _api_property('DataProject.rootFolder', '_root_folder')
+    parentHub = _api_property('DataProject.parentHub', '_hub')
+
+    def __init__(self, hub, id, name):
+        self._hub = hub
+        self._id = id
+        self._name = name
+        self._root_folder = None
+
+
+class DataFolder(object):
+    name = _api_property('DataFolder.name', '_name')
+    id = _api_property('DataFolder.id', '_id')
+    parentFolder = _api_property('DataFolder.parentFolder', '_parent')
+    parentProject = _api_property('DataFolder.parentProject', '_project')
+
+    def __init__(self, project, parent, id, name):
+        self._project = project
+        self._parent = parent
+        self._id = id
+        self._name = name
+        self._files = []
+        self._folders = []
+
+    @property
+    def isRoot(self):
+        _sim.call('DataFolder.isRoot')
+        return self._parent is None
+
+    @property
+    def dataFiles(self):
+        _sim.call('DataFolder.dataFiles')
+        return ObjectCollection(self._files, 'DataFiles')
+
+    @property
+    def dataFolders(self):
+        _sim.call('DataFolder.dataFolders')
+        return ObjectCollection(self._folders, 'DataFolders')
+
+
+class DataFile(object):
+    name = _api_property('DataFile.name', '_name')
+    id = _api_property('DataFile.id', '_id')
+    versionId = _api_property('DataFile.versionId', '_version_id')
+    versionNumber = _api_property('DataFile.versionNumber', '_version_number')
+    latestVersionNumber = _api_property('DataFile.latestVersionNumber', '_latest_version_number')
+    fileExtension = _api_property('DataFile.fileExtension', '_extension')
+    parentFolder = _api_property('DataFile.parentFolder', '_folder')
+    dateCreated = _api_property('DataFile.dateCreated', '_date_created')
+    dateModified = _api_property('DataFile.dateModified', '_date_modified')
+    description = _api_property('DataFile.description', '_description')
+
+    def __init__(self, folder, id, name, extension='f3d', version_number=1):
+        self._folder = folder
+        self._id = id
+        self._name = name
+        self._extension = extension
+        self._version_number = version_number
+        self._latest_version_number = version_number
+        self._version_id = '{}.v{}'.format(id, version_number)
+        self._date_created = 1600000000
+        self._date_modified = 1600000000 + version_number * 86400
+        self._description = ''
+        self._children = []
+        self._parents = []
+        self._versions = [self]
+        self._design_factory = None
+
+    @property
+    def parentProject(self):
+        _sim.call('DataFile.parentProject')
+        return self._folder._project
+
+    @property
+    def hasChildReferences(self):
+        _sim.call('DataFile.hasChildReferences')
+        return bool(self._children)
+
+    @property
+    def childReferences(self):
+        _sim.call('DataFile.childReferences')
+        return ObjectCollection(self._children, 'DataFiles')
+
+    @property
+    def parentReferences(self):
+        _sim.call('DataFile.parentReferences')
+        return ObjectCollection(self._parents, 'DataFiles')
+
+    @property
+    def versions(self):
+        _sim.call('DataFile.versions')
+        return ObjectCollection(self._versions, 'DataFiles')
+
+    @property
+    def latestVersion(self):
+        _sim.call('DataFile.latestVersion')
+        return self._versions[-1]
+
+
+class Data(object):
+    def __init__(self):
+        self._hubs = []
+        self._active_hub = None
+        self._active_project = None
+        self._files_by_id = {}
+
+    @property
+    def dataHubs(self):
+        _sim.call('Data.dataHubs')
+        return ObjectCollection(self._hubs, 'DataHubs')
+
+    @property
+    def activeHub(self):
+        _sim.call('Data.activeHub')
+        return self._active_hub
+
+    @activeHub.setter
+    def activeHub(self, hub):
+        _sim.call('Data.setActiveHub')
+        self._active_hub = hub
+
+    @property
+    def activeProject(self):
+        _sim.call('Data.activeProject')
+        return self._active_project
+
+    @activeProject.setter
+    def activeProject(self, project):
+        _sim.call('Data.setActiveProject')
+        self._active_project = project
+
+    def findFileById(self, id):
+        _sim.call('Data.findFileById')
+        return self._files_by_id.get(id)
+
+
+class Document(object):
+    def __init__(self, app, data_file):
+        self._app = app
+        self.dataFile = data_file
+        self.design = data_file._design_factory(data_file)
+        self.design.parentDocument = self
+        self.isValid = True
+
+    def activate(self):
+        _sim.call('Document.activate')
+        self._app._active_document = self
+        return True
+
+    def close(self, saveChanges):
+        _sim.call('Document.close')
+        self._app.documents._open.remove(self)
+        self.isValid = False
+        return True
+
+
+class Documents(object):
+    def __init__(self, app):
+        self._app = app
+        self._open = []
+
+    def open(self, dataFile, visible=True):
+        _sim.call('Documents.open')
+        for document in self._open:
+            if document.dataFile._version_id == dataFile._version_id:
+                return document
+
+        # references that are not open already are downloaded and computed again
+        open_ids = set(document.dataFile._id for document in self._open)
+        pending = list(dataFile._children)
+        loaded = set()
+        while pending:
+            child = pending.pop()
+            if child._id in open_ids or child._id in loaded:
+                continue
+            loaded.add(child._id)
+            _sim.call('Documents.loadReference')
+            pending.extend(child._children)
+
+        document = Document(self._app, dataFile)
+        self._open.append(document)
+        return document
+
+    @property
+    def count(self):
+        _sim.call('Documents.count')
+        return len(self._open)
+
+    def item(self, index):
+        _sim.call('Documents.item')
+        return self._open[index]
+
+
+class Application(object):
+    _instance = None
+
+    def __init__(self):
+        self.userInterface = UserInterface()
+        self.data = Data()
+        self.documents = Documents(self)
+        self.activeViewport = Viewport()
+        self.activeProduct = None
+        self._active_document = None
+
+    @classmethod
+    def get(cls):
+        if cls._instance is None:
+            cls._instance = Application()
+        return cls._instance
+
+    @classmethod
+    def reset(cls):
+        cls._instance = None
+        _sim.reset()
+        return cls.get()
+
+    @property
+    def activeDocument(self):
+        _sim.call('Application.activeDocument')
+        return self._active_document
+
+    def executeTextCommand(self, command):
+        _sim.call('Application.executeTextCommand')
+        if command.startswith('data.fileExport f3z'):
+            folder = command.split('"')[1]
+            data_file = self._active_document.dataFile
+            file_path = os.path.join(folder, data_file._name + '.f3z')
+
+            def arrive():
+                with open(file_path, 'wb') as f:
+                    f.write(b'f3z' * 1024)
+            _sim.later(_sim.cloud_export_delay, arrive)
+            return 'OK'
+        return ''
@@ -0,0 +1,252 @@
+import struct
+
+from . import _sim
+from .core import Point3D, BoundingBox3D
+
+
+def _write(path, size):
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+
+
+class Design(object):
+    def __init__(self, root):
+        self.rootComponent = root
+        self.exportManager = ExportManager()
+        self.parentDocument = None
+        root._set_design(self)
+
+    @staticmethod
+    def cast(obj):
+        if isinstance(obj, Design):
+            return obj
+        return None
+
+
+class FusionDocument(object):
+    @staticmethod
+    def cast(document):
+        return document
+
+
+class Matrix3D(object):
+    def __init__(self, values=None):
+        self._values = values or [1.0, 0, 0, 0, 0, 1.0, 0, 0, 0, 0, 1.0, 0, 0, 0, 0, 1.0]
+
+    def asArray(self):
+        return list(self._values)
+
+
+class Collection(object):
+    def __init__(self, items, name):
+        self._items = items
+        self._name = name
+
+    @property
+    def count(self):
+        _sim.call(self._name + '.count')
+        return len(self._items)
+
+    def item(self, index):
+        _sim.call(self._name + '.item')
+        return self._items[index]
+
+
+class Component(object):
+    def __init__(self, id, name, bodies=0, sketches=0, meshes=0):
+        self._id = id
+        self._name = name
+        self._occurrences = []
+        self._sketches = [Sketch(self, 'Sketch{}'.format(i)) for i in range(sketches)]
+        self._bodies = [BRepBody(self, 'Body{}'.format(i)) for i in range(bodies)]
+        self._meshes = [BRepBody(self, 'Mesh{}'.format(i)) for i in range(meshes)]
+        self._design = None
+
+    def _set_design(self, design):
+        self._design = design
+        for occurrence in self._occurrences:
+            # components of referenced designs belong to their own design
+            if occurrence._reference is None:
+                occurrence._component._set_design(design)
+
+    @property
+    def name(self):
+        _sim.call('Component.name')
+        return self._name
+
+    @property
+    def id(self):
+        _sim.call('Component.id')
+        return self._id
+
+    @property
+    def parentDesign(self):
+        _sim.call('Component.parentDesign')
+        return self._design
+
+    @property
+    def occurrences(self):
+        _sim.call('Component.occurrences')
+        return Collection(self._occurrences, 'Occurrences')
+
+    @property
+    def sketches(self):
+        _sim.call('Component.sketches')
+        return Collection(self._sketches, 'Sketches')
+
+    @property
+    def bRepBodies(self):
+        _sim.call('Component.bRepBodies')
+        return Collection(self._bodies, 'BRepBodies')
+
+    @property
+    def meshBodies(self):
+        _sim.call('Component.meshBodies')
+        return Collection(self._meshes, 'MeshBodies')
+
+
+class DocumentReference(object):
+    def __init__(self, data_file):
+        self._data_file = data_file
+
+    @property
+    def dataFile(self):
+        _sim.call('DocumentReference.dataFile')
+        return self._data_file
+
+
+class Occurrence(object):
+    def __init__(self, component, reference=None, transform=None):
+        self._component = component
+        self._reference = reference
+        self._transform = transform or Matrix3D()
+
+    @property
+    def component(self):
+        _sim.call('Occurrence.component')
+        return self._component
+
+    @property
+    def isReferencedComponent(self):
+        _sim.call('Occurrence.isReferencedComponent')
+        return self._reference is not None
+
+    @property
+    def documentReference(self):
+        _sim.call('Occurrence.documentReference')
+        return self._reference
+
+    @property
+    def transform(self):
+        _sim.call('Occurrence.transform')
+        return self._transform
+
+    transform2 = transform
+
+
+class Sketch(object):
+    def __init__(self, component, name):
+        self._component = component
+        self._name = name
+        self.errorOrWarningMessage = ''
+
+    @property
+    def name(self):
+        _sim.call('Sketch.name')
+        return self._name
+
+    def saveAsDXF(self, path):
+        _sim.call('Sketch.saveAsDXF')
+        _write(path, 2048)
+        return True
+
+
+class BRepBody(object):
+    def __init__(self, component, name):
+        self._component = component
+        self._name = name
+
+    @property
+    def name(self):
+        _sim.call('BRepBody.name')
+        return self._name
+
+    @property
+    def parentComponent(self):
+        _sim.call('BRepBody.parentComponent')
+        return self._component
+
+    @property
+    def boundingBox(self):
+        # every body is a 1 cm cube
+        _sim.call('BRepBody.boundingBox')
+        return BoundingBox3D(Point3D(0, 0, 0), Point3D(1, 1, 1))
+
+
+class ExportOptions(object):
+    def __init__(self, kind, path, geometry):
+        self.kind = kind
+        self.filename = path
+        self.geometry = geometry
+        self.isBinaryFormat = True
+
+
+class ExportManager(object):
+    def createSTEPExportOptions(self, path, geometry=None):
+        _sim.call('ExportManager.createSTEPExportOptions')
+        return ExportOptions('.stp', path, geometry)
+
+    def createIGESExportOptions(self, path, geometry=None):
+        _sim.call('ExportManager.createIGESExportOptions')
+        return ExportOptions('.igs', path, geometry)
+
+    def createSTLExportOptions(self, geometry, path=''):
+        _sim.call('ExportManager.createSTLExportOptions')
+        return ExportOptions('.stl', path, geometry)
+
+    def createFusionArchiveExportOptions(self, path, geometry=None):
+        _sim.call('ExportManager.createFusionArchiveExportOptions')
+        return ExportOptions('.f3d', path, geometry)
+
+    def execute(self, options):
+        _sim.call('ExportManager.execute')
+        _sim.call('ExportManager.execute' + options.kind)
+        path = options.filename
+        if not path.lower().endswith(options.kind):
+            path += options.kind
+        if options.kind == '.stl':
+            _write_stl(path, options.geometry)
+        else:
+            _write(path, 8192)
+        return True
+
+
+def _write_stl(path, geometry):
+    # bodies are 1 cm cubes written in mm like Fusion does, anything else gets some triangles
+    if isinstance(geometry, BRepBody):
+        triangles = _cube_triangles(10.0)
+    else:
+        triangles = [((0, 0, 1), (i, 0, 0), (0, i, 0), (0, 0, i)) for i in range(12)]
+    with open(path, 'wb') as f:
+        f.write(b'\0' * 80)
+        f.write(struct.pack('<I', len(triangles)))
+        for normal, a, b, c in triangles:
+            f.write(struct.pack('<12fH', *normal, *a, *b, *c, 0))
+
+
+def _cube_triangles(size):
+    triangles = []
+    for axis in range(3):
+        for side in (0, 1):
+            normal = [0.0, 0.0, 0.0]
+            normal[axis] = 1.0 if side else -1.0
+            corners = []
+            for u, v in ((0, 0), (1, 0), (1, 1), (0, 1)):
+                corner = [0.0, 0.0, 0.0]
+                corner[axis] = side * size
+                corner[(axis + 1) % 3] = u * size
+                corner[(axis + 2) % 3] = v * size
+                corners.append(tuple(corner))
+            triangles.append((tuple(normal), corners[0], corners[1], corners[2]))
+            triangles.append((tuple(normal), corners[0], corners[2], corners[3]))
+    return triangles
@@ -0,0 +1,145 @@
+"""Synthetic hubs for the simulated adsk API in benchmarks/fakeadsk.
+
+Every design has a root component with `components` parts, every part
+holds `occurrences` occurrences of a shared "Bolt" component (or of its
+own copy when sharing is off). Assemblies reference root components of
+other designs, like real Fusion 360 assemblies made of separate files.
+"""
+
+import random
+
+import adsk.core
+import adsk.fusion
+
+
+class SyntheticHub(object):
+    def __init__(self, hub, projects, files, assemblies):
+        self.hub = hub
+        self.projects = projects
+        self.files = files
+        self.assemblies = assemblies
+
+
+def _make_design_factory(data_file, components, occurrences, shared, sketches, bodies):
+    def factory(opened_file):
+        file_id = data_file._id
+        root = adsk.fusion.Component('root-' + file_id, data_file._name, bodies=bodies, sketches=sketches)
+        bolt = adsk.fusion.Component('bolt-' + file_id, 'Bolt', bodies=bodies, sketches=sketches)
+
+        for index in range(components):
+            part = adsk.fusion.Component('part{}-{}'.format(index, file_id), 'Part {}'.format(index),
+                                         bodies=bodies, sketches=sketches)
+            for occurrence_index in range(occurrences):
+                if not shared:
+                    bolt = adsk.fusion.Component('bolt{}-{}-{}'.format(index, occurrence_index, file_id), 'Bolt',
+                                                 bodies=bodies, sketches=sketches)
+                # bolts in a row along x, 2 cm apart
+                part._occurrences.append(adsk.fusion.Occurrence(bolt, transform=adsk.fusion.Matrix3D(
+                    [1.0, 0, 0, occurrence_index * 2.0, 0, 1.0, 0, 0, 0, 0, 1.0, 0, 0, 0, 0, 1.0])))
+            root._occurrences.append(adsk.fusion.Occurrence(part))
+
+        # every document gets its own copies of referenced designs, like Documents.open does
+        for child in data_file._children:
+            child_design = child._design_factory(child)
+            root._occurrences.append(adsk.fusion.Occurrence(
+                child_design.rootComponent, adsk.fusion.DocumentReference(child)))
+
+        return adsk.fusion.Design(root)
+
+    return factory
+
+
+def build(app, projects=2, folders=2, depth=2, files=3, components=3, occurrences=3, shared=True,
+          sketches=1, bodies=1, assemblies=1, references=2, versions=1, seed=1):
+    rnd = random.Random(seed)
+    data = app.data
+    hub = adsk.core.DataHub('hub-1', 'Synthetic Hub')
+    data._hubs.append(hub)
+    data._active_hub = hub
+
+    all_files = []
+
+    def fill(project, folder, level):
+        for _ in range(files):
+            index = len(all_files) + 1
+            file_id = 'file-{}'.format(index)
+            version_number = rnd.randint(1, versions)
+
+            history = []
+            for number in range(1, version_number + 1):
+                data_file = adsk.core.DataFile(folder, file_id, 'Design {}'.format(index),
+                                               version_number=number)
+                data_file._description = 'release' if number % 3 == 0 else ''
+                history.append(data_file)
+            for data_file in history:
+                data_file._versions = history
+                data_file._latest_version_number = version_number
+
+            latest = history[-1]
+            folder._files.append(latest)
+            data._files_by_id[file_id] = latest
+            all_files.append(latest)
+
+        if level < depth:
+            for index in range(folders):
+                sub_folder = adsk.core.DataFolder(project, folder, '{}-{}'.format(folder._id, index),
+                                                  'Folder {}'.format(index))
+                folder._folders.append(sub_folder)
+                fill(project, sub_folder, level + 1)
+
+    all_projects = []
+    for index in range(projects):
+        project = adsk.core.DataProject(hub, 'project-{}'.format(index), 'Project {}'.format(index))
+        project._root_folder = adsk.core.DataFolder(project, None, 'root-{}'.format(index), 'Root')
+        hub._projects.append(project)
+        all_projects.append(project)
+        fill(project, project._root_folder, 0)
+
+    # assemblies are taken from the start, their parts from the second half of the hub
+    assembly_files = all_files[:assemblies]
+    parts = all_files[max(len(all_files) // 2, assemblies):]
+    for assembly in assembly_files:
+        for child in rnd.sample(parts, min(references, len(parts))):
+            assembly._children.append(child)
+            child._parents.append(assembly)
+
+    for data_file in all_files:
+        factory = _make_design_factory(data_file, components, occurrences, shared, sketches, bodies)
+        for version in data_file._versions:
+            version._design_factory = factory
+            version._children = data_file._children
+            version._parents = data_file._parents
+
+    data._active_project = all_projects[0]
+
+    # exportCurrentProject looks at the document that is open in Fusion
+    if all_files:
+        document = adsk.core.Document(app, all_files[0])
+        app.activeProduct = document.design
+        app._active_document = document
+
+    return SyntheticHub(hub, all_projects, all_files, assembly_files)
+
+
+def save_version(app, data_file):
+    # a new latest version of the file, like saving it in Fusion
+    number = data_file._latest_version_number + 1
+    version = adsk.core.DataFile(data_file._folder, data_file._id, data_file._name, version_number=number)
+    version._design_factory = data_file._design_factory
+    version._children = data_file._children
+    version._parents = data_file._parents
+
+    history = data_file._versions + [version]
+    for old_version in history:
+        old_version._versions = history
+        old_version._latest_version_number = number
+
+    files = data_file._folder._files
+    files[files.index(data_file)] = version
+    app.data._files_by_id[data_file._id] = version
+    return version
+
+
+def delete_file(app, data_file):
+    data_file._folder._files.remove(data_file)
+    del app.data._files_by_id[data_file._id]